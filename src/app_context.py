@@ -1,7 +1,14 @@
-from config_service import IConfigService
+import os
+from config_service import ConfigFileService, IConfigService
+from config_db_service import ConfigDatabaseService
 from file_organizer import FileOrganizer
 
 
+# Implementations of the config service
+BACKEND_FILE = "file"
+BACKEND_SQLITE = "sqlite"
+
+
 class AppContext:
     """
     The AppContext class represents the application's context, providing 
@@ -13,4 +20,24 @@ class AppContext:
     """
     def __init__(self, service: IConfigService, organizer: FileOrganizer) -> None:
         self.service = service
-        self.organizer = organizer
\ No newline at end of file
+        self.organizer = organizer
+
+
+    @staticmethod
+    def create_service(backend: str, configs_directory: str, database_path: str) -> IConfigService:
+        """
+        Create the config service of a backend.
+
+        :param backend: "file" for a JSON file per config, "sqlite" for a single database.
+        :param configs_directory: Directory of the JSON config files.
+        :param database_path: Path of the SQLite database. A new database imports the JSON config files once.
+        """
+        if backend == BACKEND_FILE:
+            return ConfigFileService(configs_directory=configs_directory)
+        if backend == BACKEND_SQLITE:
+            new_database = not os.path.exists(database_path)
+            service = ConfigDatabaseService(database_path)
+            if new_database:
+                service.import_config_files(configs_directory)
+            return service
+        raise ValueError(f"Unknown config backend: {backend}")
@@ -1,13 +1,38 @@
+"""
+Benchmarks of the organizer.
+
+The phase suite (`run_suite`) times each step of a full run on its own (validate,
+reset, categorize, cleanup) over a set of generated workloads, and records
+the nanoseconds, files per second and filesystem calls of every phase plus the peak
+RSS of the process. It also times the routing of a million synthetic names, without
+any disk I/O. Results are appended to a JSON history and compared to a stored
+baseline:
+
+    python src/benchmark.py                      Run the suite, fail on a regression
+    python src/benchmark.py --save-baseline      Run the suite and store it as the baseline
+"""
+
+from dataclasses import asdict, dataclass
 from datetime import datetime
+import argparse
 import json
 import os
+import random
 from random import choice
+import sys
+import tempfile
 import time
 import shutil
 from file_organizer import FileOrganizer 
-import matplotlib.pyplot as plt
 
 from models import Config
+from move_plan import MovePlanner
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, the peak RSS isn't recorded
+    resource = None
 
 FILE_EXTENSIONS = [
     # Text and Documents
@@ -38,80 +63,274 @@ FILE_EXTENSIONS = [
     ".exe", ".dll", ".bat", ".sh", ".apk", ".iso", ".bin"
 ]
 
-def create_files_in_directory(directory, num_files):
-    os.makedirs(directory, exist_ok=True)
-    for i in range(num_files):
-        with open(os.path.join(directory, f"file_{i}{choice(FILE_EXTENSIONS)}"), 'w') as f:
-            f.write("Test file content")
-
 def load_template_config(template_path="config/template.json"):
     with open(template_path, 'r') as file:
         data = json.load(file)
     return Config.from_dict(data)
 
-def benchmark_organizer_single_dir(num_files_list):
-    times = []
-    template_config = load_template_config()
-    
-    for num_files in num_files_list:
-        temp_dir = f"temp_{num_files}_files"
-        create_files_in_directory(temp_dir, num_files)
-        template_config.directory = temp_dir
+
+def benchmark_routing(num_names=1_000_000, template_path="config/template.json"):
+    """
+    Time the placement of synthetic file names with the compiled routing table
+    of the template config, without any disk I/O.
+
+    Returns:
+        float: Placed names per second.
+    """
+    template_config = load_template_config(template_path)
+    names = [f"file_{i}{choice(FILE_EXTENSIONS)}" for i in range(num_names)]
+    planner = MovePlanner(template_config.directory, template_config.categories)
+
+    target = planner.target
+    start_time = time.perf_counter()
+    for name in names:
+        target(name)
+    end_time = time.perf_counter()
+
+    return num_names / (end_time - start_time)
+
+
+HISTORY_PATH = "benchmark/history.json"
+BASELINE_PATH = "benchmark/baseline.json"
+
+# Allowed slowdown of a phase against the baseline
+REGRESSION_THRESHOLD = 0.25
+
+# Phases shorter than this in the baseline are too noisy to compare
+MIN_COMPARED_NS = 5_000_000
+
+# Synthetic names placed by the routing benchmark
+ROUTING_NAMES = 1_000_000
+
+# The categorize phase creates the directories of its plan
+PHASES = ["validate", "reset", "categorize", "cleanup"]
+
+# Filesystem calls of the organizer counted per phase
+COUNTED_CALLS = ["stat", "lstat", "scandir", "listdir", "rename", "mkdir", "rmdir", "access"]
+
+
+@dataclass
+class Workload:
+    """
+    Represents the files a benchmark run organizes.
+
+    Attributes:
+        name (str): Name of the workload in the results.
+        num_files (int): Number of files.
+        extension_skew (float): Zipf exponent of the extension frequencies, 0 for uniform.
+        depth (int): Nesting of the misplaced files inside the categories, 0 for all files in the main directory.
+        file_size (int): Size of each file in bytes.
+    """
+
+    name: str
+    num_files: int
+    extension_skew: float = 0.0
+    depth: int = 0
+    file_size: int = 16
+
+
+WORKLOADS = [
+    Workload("flat_1k", 1_000),
+    Workload("flat_10k", 10_000),
+    Workload("skewed_10k", 10_000, extension_skew=1.2),
+    Workload("nested_10k", 10_000, depth=3),
+    Workload("large_files_1k", 1_000, file_size=1 << 20),
+]
+
+
+def create_workload(directory, workload, config, seed=0):
+    """
+    Generate the files of a workload. With a depth, half of the files start
+    misplaced inside nested directories of the categories, so the reset has work.
+    """
+    rng = random.Random(seed)
+    weights = [1 / (rank ** workload.extension_skew) for rank in range(1, len(FILE_EXTENSIONS) + 1)]
+    extensions = rng.choices(FILE_EXTENSIONS, weights=weights, k=workload.num_files)
+    payload = b"x" * workload.file_size
+
+    nested = []
+    if workload.depth:
+        for category in config.categories:
+            path = os.path.join(directory, category.name, *[f"level{level}" for level in range(workload.depth)])
+            os.makedirs(path, exist_ok=True)
+            nested.append(path)
+    else:
+        os.makedirs(directory, exist_ok=True)
+
+    for idx, extension in enumerate(extensions):
+        parent = nested[idx % len(nested)] if nested and idx % 2 else directory
+        with open(os.path.join(parent, f"file_{idx}{extension}"), "wb") as f:
+            f.write(payload)
+
+
+class CallCounter:
+    """
+    Counts the calls of the `os` filesystem functions while active. The calls
+    through `os.DirEntry` (like `is_dir`) are served from the listing and aren't counted.
+    """
+
+    def __init__(self, names=COUNTED_CALLS):
+        self.names = [name for name in names if hasattr(os, name)]
+        self.counts = dict.fromkeys(self.names, 0)
+        self.originals = {}
+
+
+    def _wrap(self, name, function):
+        counts = self.counts
+
+        def counted(*args, **kwargs):
+            counts[name] += 1
+            return function(*args, **kwargs)
+        return counted
+
+
+    def __enter__(self):
+        for name in self.names:
+            self.originals[name] = getattr(os, name)
+            setattr(os, name, self._wrap(name, self.originals[name]))
+        return self
+
+
+    def __exit__(self, *exc):
+        for name, function in self.originals.items():
+            setattr(os, name, function)
+
+
+def _peak_rss_kb():
+    """Peak resident set size of the process, in KiB (None without `resource`)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def benchmark_phases(workload, config):
+    """
+    Run each phase of a full organize over a generated workload.
+
+    Returns:
+        dict: The results of the workload, with the nanoseconds, files per second
+        and filesystem calls of each phase.
+    """
+    directory = tempfile.mkdtemp(prefix=f"benchmark_{workload.name}_")
+    try:
+        create_workload(directory, workload, config)
+        config = Config(directory=directory, categories=config.categories)
         organizer = FileOrganizer()
-        
-        start_time = time.time()
-        organizer.process_config(template_config)
-        end_time = time.time()
-
-        times.append(end_time - start_time)
-        shutil.rmtree(temp_dir)
-
-    return times
-
-def benchmark_organizer_multiple_dir(num_dir_list, num_files):
-    times_matrix = []
-
-    template_config = load_template_config()
-    for num_dirs in num_dir_list:
-        total_time = 0
-        for _ in range(num_dirs):
-            temp_dir = f"temp_{num_files}_files_dir_{_}"
-            create_files_in_directory(temp_dir, num_files)
-            template_config.directory = temp_dir
-            organizer = FileOrganizer()
-
-            start_time = time.time()
-            organizer.process_config(template_config)
-            end_time = time.time()
-
-            total_time += (end_time - start_time)
-            shutil.rmtree(temp_dir)
-
-        times_matrix.append(total_time / num_dirs)
-    
-    return times_matrix
-
-def plot_single_dir_results(num_files_list, times):
-    plt.plot(num_files_list, times, marker='o')
-    plt.xlabel("Number of Files")
-    plt.ylabel("Time (seconds)")
-    plt.title("Single Directory Benchmark")
-    plt.grid(True)
-    
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    plt.savefig(f"benchmark/results_single_dir_{timestamp}.png")
-    plt.show()
-
-def plot_multi_dir_results(num_files_list, num_dir_list, times_matrix):
-    for idx, num_dirs in enumerate(num_dir_list):
-        plt.plot(num_files_list, times_matrix[idx], marker='o', label=f'{num_dirs} directories')
-    
-    plt.xlabel("Number of Files per Directory")
-    plt.ylabel("Average Time (seconds)")
-    plt.title("Multiple Directories Benchmark")
-    plt.legend()
-    plt.grid(True)
-    
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    plt.savefig(f"benchmark/results_multi_dir_{timestamp}.png")
-    plt.show()
+        steps = {
+            "validate": lambda: organizer.validate_directory(directory),
+            "reset": lambda: organizer.reset_directory(directory, config.categories),
+            "categorize": lambda: organizer.categorize_files(directory, config.categories),
+            "cleanup": lambda: organizer.remove_empty_directories(directory, organizer._category_paths(directory, config.categories)),
+        }
+
+        phases = {}
+        for phase in PHASES:
+            with CallCounter() as counter:
+                start_time = time.perf_counter_ns()
+                steps[phase]()
+                elapsed = time.perf_counter_ns() - start_time
+
+            phases[phase] = {
+                "ns": elapsed,
+                "files_per_second": workload.num_files / (elapsed / 1e9) if elapsed else None,
+                "calls": {name: count for name, count in counter.counts.items() if count},
+            }
+    finally:
+        shutil.rmtree(directory)
+
+    return {"workload": asdict(workload), "phases": phases, "peak_rss_kb": _peak_rss_kb()}
+
+
+def run_suite(workloads=WORKLOADS, template_path="config/template.json", routing_names=ROUTING_NAMES):
+    """Run the phase benchmarks of all the workloads, and the routing benchmark."""
+    config = load_template_config(template_path)
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "results": {workload.name: benchmark_phases(workload, config) for workload in workloads},
+        "routing": {
+            "names": routing_names,
+            "names_per_second": benchmark_routing(routing_names, template_path),
+        },
+    }
+
+
+def append_history(run, path=HISTORY_PATH):
+    """Append a suite run to the JSON results history."""
+    history = []
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            history = json.load(f)
+    history.append(run)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(history, f, indent=2)
+
+
+def check_regressions(run, baseline, threshold=REGRESSION_THRESHOLD, min_ns=MIN_COMPARED_NS):
+    """
+    Compare the phases of a suite run with a baseline run.
+
+    Returns:
+        list[str]: A message for every phase slower than the baseline by more than `threshold`.
+    """
+    regressions = []
+    for name, result in run["results"].items():
+        baseline_result = baseline["results"].get(name)
+        if not baseline_result:
+            continue
+        for phase, measured in result["phases"].items():
+            expected = baseline_result["phases"].get(phase, {}).get("ns")
+            if not expected or expected < min_ns:
+                continue
+            slowdown = measured["ns"] / expected - 1
+            if slowdown > threshold:
+                regressions.append(f"{name}/{phase}: {measured['ns'] / 1e6:.1f}ms vs {expected / 1e6:.1f}ms baseline (+{slowdown:.0%})")
+
+    # Older baselines have no routing benchmark
+    expected = baseline.get("routing", {}).get("names_per_second")
+    measured = run.get("routing", {}).get("names_per_second")
+    if expected and measured:
+        slowdown = expected / measured - 1
+        if slowdown > threshold:
+            regressions.append(f"routing: {measured:,.0f} names/s vs {expected:,.0f} names/s baseline (+{slowdown:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the phases of the organizer")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="allowed slowdown of a phase (0.25 is 25%%)")
+    parser.add_argument("--workloads", nargs="*", help="names of the workloads to run, all by default")
+    parser.add_argument("--routing-names", type=int, default=ROUTING_NAMES, help="synthetic names placed by the routing benchmark")
+    args = parser.parse_args()
+
+    workloads = [workload for workload in WORKLOADS if not args.workloads or workload.name in args.workloads]
+    run = run_suite(workloads, routing_names=args.routing_names)
+    append_history(run)
+
+    for name, result in run["results"].items():
+        phases = ", ".join(f"{phase} {measured['ns'] / 1e6:.1f}ms" for phase, measured in result["phases"].items())
+        print(f"{name}: {phases} (peak RSS {result['peak_rss_kb']} KiB)")
+    print(f"routing: {run['routing']['names_per_second']:,.0f} names/s over {run['routing']['names']:,} names")
+
+    if args.save_baseline:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(run, f, indent=2)
+        return 0
+
+    if not os.path.exists(BASELINE_PATH):
+        print("No baseline to compare with, store one with --save-baseline")
+        return 0
+
+    with open(BASELINE_PATH, "r") as f:
+        regressions = check_regressions(run, json.load(f), args.threshold)
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
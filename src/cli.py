@@ -1,21 +1,37 @@
 import os
 import sys
+from datetime import datetime
 from menu_system import *
 from models import Category, Config
 from utils import Table, get_template_config
+from estimate import DryRunReport
+from run_report import RunReport
+from scheduler import ScheduleState, load_schedule_states
+from watcher import Watcher
 
 
 class MainMenu(Menu):
 
     def _enter(self, data: dict[str, any] = {}):
-        headers = ["Directory", "Categories", "Schedule", "Active"]
-        table_data = [
-            (config.directory, str(len(config.categories)), str(config.schedule.active), str(config.active)) 
-            for config 
-            in self.ctx.service.get_configs()
-        ]
+        headers = ["Directory", "Categories", "Schedule", "Active", "Next Run", "Last Duration", "Last Run"]
+        self.schedule_states = self._load_schedule_states()
+        table_data = [self._config_row(config) for config in self.ctx.service.get_configs()]
 
         self.config_table = Table(headers=headers, data=table_data)
+
+    def _load_schedule_states(self) -> dict[str, ScheduleState]:
+        """Load the schedule states saved by the scheduler daemon, if any."""
+        state_directory = self.ctx.organizer.state_directory
+        return load_schedule_states(state_directory) if state_directory else {}
+
+    def _config_row(self, config: Config) -> tuple[str]:
+        """Create the table row of a config."""
+        state = self.schedule_states.get(config.directory)
+        next_run = datetime.fromtimestamp(state.next_run).strftime("%Y-%m-%d %H:%M:%S") if state else "-"
+        last_duration = f"{state.last_duration:.2f}s" if state and state.last_duration is not None else "-"
+        report = self.ctx.organizer.last_report(config.directory)
+        last_run = f"{report.status}, {report.files_moved} moved, {report.errors} errors" if report else "-"
+        return (config.directory, str(len(config.categories)), str(config.schedule.active), str(config.active), next_run, last_duration, last_run)
     
     def _display(self):
         print("Configuration list")
@@ -31,13 +47,35 @@ class MainMenu(Menu):
         print("   --create")
         print("   --delete    <directory>")
         print("   --search    <directory>/<empty>")
-        print("   --organize  <directory>/<empty>")
-        print("   --reset     <directory>")
+        print("   --organize  <directory>/<empty> [--dry-run]")
+        print("   --reset     <directory> [--dry-run]")
+        print("   --watch     <directory>/<empty>")
+        print("   --recover   <directory> [--rollback]")
+        print("   --undo      <directory> [<runs>]")
+        print("   --report    <directory>")
         print("   --help")
         print("   --exit")
         
     
     
+    def _print_report(self, report: RunReport):
+        """Print the report of a run."""
+        started_at = datetime.fromtimestamp(report.started_at).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"{report.directory} ({'incremental' if report.incremental else 'full'}, started {started_at}):")
+        print(f"   Status: {report.status}{f' ({report.error})' if report.error else ''} in {report.duration:.2f}s")
+        print(f"   Files: {report.files_scanned} scanned, {report.files_moved} moved ({report.bytes_moved} bytes), {report.files_skipped} skipped, {report.errors} errors")
+        if report.duplicates:
+            print(f"   Duplicates: {report.duplicates} ({report.duplicate_bytes} bytes)")
+        print(f"   Phases: {', '.join(f'{phase} {seconds:.2f}s' for phase, seconds in report.phases.items())}")
+
+    def _print_dry_run(self, report: DryRunReport):
+        """Print the estimated work of a run."""
+        duration = f"{report.estimated_duration:.2f}s" if report.estimated_duration is not None else "unknown"
+        print(f"{report.directory} ({'incremental' if report.incremental else 'full'}):")
+        print(f"   Moves: {report.moves} ({report.bytes} bytes, {report.cross_device} cross-device)")
+        print(f"   Directories: {report.directories_created} created, {report.directories_removed} removed")
+        print(f"   Estimated duration: {duration}")
+
     def _update(self):
         action = input("Action: ")
         if "--show" in action:
@@ -69,49 +107,112 @@ class MainMenu(Menu):
         elif "--search" in action:
             try:
                 searched = action.split()[1]
-                # Filtering the configs based on the search term
-                matched_configs = [config for config in self.ctx.service.get_configs() if searched.lower() in config.directory.lower()]
+                # Filtering the configs based on the search term, through the search index of the service
+                matched_configs = self.ctx.service.find_configs(searched)
             
                 # Display the matched configurations in a table format
-                data = [
-                    (config.directory, str(len(config.categories)), str(config.schedule.active), str(config.active)) 
-                    for config in matched_configs
-                ]
+                data = [self._config_row(config) for config in matched_configs]
             
                 self.config_table.set_data(data)
             except IndexError as e:
-                data = [
-                    (config.directory, str(len(config.categories)), str(config.schedule.active), str(config.active)) 
-                    for config 
-                    in self.ctx.service.get_configs()
-                ]
+                data = [self._config_row(config) for config in self.ctx.service.get_configs()]
                 self.config_table.set_data(data)
         elif "--organize" in action:
+            dry_run = "--dry-run" in action
+            params = [param for param in action.split() if param != "--dry-run"]
             try:
-                dir = action.split()[1]
+                dir = params[1]
                 config = self.ctx.service.get_config(directory=dir)
-                if config:
-                    self.ctx.organizer.process_config(config)
+                if config and dry_run:
+                    self._print_dry_run(self.ctx.organizer.dry_run(config, incremental=True))
+                elif config:
+                    self.ctx.organizer.process_config(config, incremental=True)
             except IndexError as e:
                 configs = self.ctx.service.get_configs()
                 if not configs:
                     input("There are no configs to organize...")
                     return
                 
-                self.ctx.organizer.process_configs(configs)
+                if dry_run:
+                    for config in configs:
+                        self._print_dry_run(self.ctx.organizer.dry_run(config, incremental=True))
+                    return
+
+                results = self.ctx.organizer.process_configs(configs, incremental=True)
+                for result in results:
+                    print(f"{result.directory}: {result.status} ({result.duration:.2f}s)")
             finally:
-                input("Finished organizing")
+                input("Finished estimating" if dry_run else "Finished organizing")
         elif "--reset" in action:
+            dry_run = "--dry-run" in action
+            params = [param for param in action.split() if param != "--dry-run"]
             try:
-                dir = action.split()[1]
+                dir = params[1]
                 config = self.ctx.service.get_config(directory=dir)
-                if config:
+                if config and dry_run:
+                    self._print_dry_run(self.ctx.organizer.dry_run_reset(config))
+                elif config:
                     self.ctx.organizer.reset_directory(directory=config.directory, categories=config.categories)
                     self.ctx.organizer.cleanup_directory(directory=config.directory, categories=config.categories)
                 
-                input(f"Finished resetting {dir}")
+                input(f"Finished {'estimating reset of' if dry_run else 'resetting'} {dir}")
+            except IndexError as e:
+                input("You didn't specifiy a directory")
+        elif "--recover" in action:
+            rollback = "--rollback" in action
+            params = [param for param in action.split() if param != "--rollback"]
+            try:
+                dir = params[1]
+                config = self.ctx.service.get_config(directory=dir)
+                if config and self.ctx.organizer.recover(config, rollback=rollback):
+                    input(f"Finished {'rolling back' if rollback else 'resuming'} the interrupted run of {dir}")
+                else:
+                    input(f"There is no interrupted run of {dir}")
+            except IndexError as e:
+                input("You didn't specifiy a directory")
+        elif "--undo" in action:
+            params = action.split()
+            try:
+                dir = params[1]
+                runs = int(params[2]) if len(params) > 2 else 1
+                config = self.ctx.service.get_config(directory=dir)
+                if config:
+                    moved = self.ctx.organizer.undo(config, runs=runs)
+                    input(f"Moved {moved} files of {dir} back")
+                else:
+                    input(f"There is no config for {dir}")
             except IndexError as e:
                 input("You didn't specifiy a directory")
+            except ValueError as e:
+                input("The number of runs must be a number")
+        elif "--report" in action:
+            try:
+                dir = action.split()[1]
+                report = self.ctx.organizer.last_report(dir)
+                if report:
+                    self._print_report(report)
+                    input("Press enter to continue")
+                else:
+                    input(f"There is no report for {dir}")
+            except IndexError as e:
+                input("You didn't specifiy a directory")
+        elif "--watch" in action:
+            try:
+                dir = action.split()[1]
+                config = self.ctx.service.get_config(directory=dir)
+                configs = [config] if config else []
+            except IndexError as e:
+                configs = self.ctx.service.get_configs()
+
+            if not configs:
+                input("There are no configs to watch...")
+                return
+
+            print("Watching for new files, press Ctrl+C to stop...")
+            try:
+                Watcher(self.ctx.organizer, configs).run()
+            except KeyboardInterrupt:
+                input("Stopped watching")
         elif "--help" in action:
             self.menu_manager.change_menu(HelpMenu(self.menu_manager, self.ctx))
         elif "--exit" in action:
@@ -181,8 +282,12 @@ class HelpMenu(Menu):
             ("--create", "", "Open menu to create a new configuration file."),
             ("--delete", "<directory>", "Deletes a configuration of the specified directory"),
             ("--search", "<directory>/<empty>", "Search for a configuration by the directory, reset table if no params"),
-            ("--organize", "<directory>/<empty>", "Run the organizer for all configs if no params else for a specific config."),
-            ("--reset", "<directory>", "Reset the directory for a specific config."),
+            ("--organize", "<directory>/<empty> [--dry-run]", "Run the organizer for all configs if no params else for a specific config. With --dry-run only estimate the work."),
+            ("--reset", "<directory> [--dry-run]", "Reset the directory for a specific config. With --dry-run only estimate the work."),
+            ("--watch", "<directory>/<empty>", "Organize new files as they arrive, for all configs if no params else for a specific config."),
+            ("--recover", "<directory> [--rollback]", "Resume an interrupted run of a config. With --rollback move its files back instead."),
+            ("--undo", "<directory> [<runs>]", "Move the files of the last runs (default 1) of a config back to where they were."),
+            ("--report", "<directory>", "Show the report of the last run of a config: file counts and the time of each phase."),
             ("--exit", "", "Close the programm"),
         ]
         self.help_table = Table(headers=headers, data=data)
@@ -221,6 +326,8 @@ class ConfigShowMenu(Menu):
             print(f"{idx}. {category.name}")
             print("   Extensions:", ', '.join(category.extensions))
             print(f"   Categorize Extensions: {'Yes' if category.categorize_extensions else 'No'}")
+            for rule in category.rules:
+                print(f"   Rule: {rule.type} {rule.pattern!r}", ', '.join(f"{name}={value}" for name, value in rule.to_dict().items() if name not in ('type', 'pattern')))
         
         print("\n----- SCHEDULE -----")
         print("Type:", self.config.schedule.type)
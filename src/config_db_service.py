@@ -0,0 +1,183 @@
+"""
+Module with a config service backed by a single SQLite database, for setups with
+thousands of configs where a JSON file per config makes startup and search slow.
+
+The database runs in WAL mode, so the CLI and the scheduler daemon can read while
+the other one writes. Every create, update and delete is a single transaction.
+"""
+
+import json
+import bisect
+import sqlite3
+import logging
+import threading
+from typing import Optional
+
+from config_service import ConfigFileService, IConfigService
+from models import Config
+from search_index import SearchIndex
+
+
+LOG = logging.getLogger(__name__)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS configs (
+    directory TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class ConfigDatabaseService(IConfigService):
+    """
+    Keeps the configs in a SQLite database, indexed by directory.
+
+    The configs are cached in memory. The cache is read again only when another
+    connection (like the daemon) committed a change, which SQLite reports through
+    `PRAGMA data_version`.
+
+    Attributes:
+        path (str): Path of the SQLite database file.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+        self._configs: dict[str, Config] = {}
+        # Sorted directories of the configs, and the search index over them
+        self._directories: list[str] = []
+        self._search = SearchIndex()
+        self._data_version: Optional[int] = None
+
+
+    def close(self):
+        """Close the database connection."""
+        self.connection.close()
+
+
+    def _ensure_loaded(self) -> None:
+        """Read the configs again if the database changed outside of this connection."""
+        data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+
+        configs = {}
+        for directory, data in self.connection.execute("SELECT directory, data FROM configs ORDER BY directory"):
+            try:
+                configs[directory] = Config.from_dict(json.loads(data))
+            except Exception as e:
+                LOG.error(f"Error reading config {directory}: {e}")
+        self._configs = configs
+        self._directories = list(configs)
+        self._search = SearchIndex(configs)
+        self._data_version = data_version
+
+
+    def get_configs(self) -> list[Config]:
+        """Returns the list of available Configs."""
+        with self.lock:
+            self._ensure_loaded()
+            return [self._configs[directory] for directory in self._directories]
+
+    def get_config(self, directory: str) -> Optional[Config]:
+        """Load a specific Config by its name."""
+        with self.lock:
+            self._ensure_loaded()
+            return self._configs.get(directory)
+
+    def search_configs(self, prefix: str) -> list[Config]:
+        """Returns the Configs whose directory starts with a prefix, with a range scan of the index."""
+        with self.lock:
+            self._ensure_loaded()
+            if not prefix:
+                return self.get_configs()
+            # Every string starting with the prefix sorts before the prefix followed by the highest code point
+            rows = self.connection.execute(
+                "SELECT directory FROM configs WHERE directory >= ? AND directory < ? ORDER BY directory",
+                (prefix, prefix + "\U0010ffff")
+            )
+            return [self._configs[directory] for directory, in rows if directory in self._configs]
+
+    def find_configs(self, term: str) -> list[Config]:
+        """Returns the Configs whose directory contains a term, ignoring case, from the search index."""
+        with self.lock:
+            self._ensure_loaded()
+            return [self._configs[directory] for directory in self._search.search(term)]
+
+    def create_config(self, config: Config) -> None:
+        """Save a Config object."""
+        with self.lock:
+            try:
+                with self.connection:
+                    self.connection.execute(
+                        "INSERT INTO configs (directory, data) VALUES (?, ?)",
+                        (config.directory, json.dumps(config.to_dict()))
+                    )
+            except sqlite3.IntegrityError:
+                raise ValueError("Config for this directory already exists")
+            self._ensure_loaded()
+            if config.directory not in self._configs:
+                bisect.insort(self._directories, config.directory)
+                self._search.add(config.directory)
+            self._configs[config.directory] = config
+
+    def delete_config(self, directory: str) -> None:
+        """Delete a Config."""
+        with self.lock:
+            with self.connection:
+                deleted = self.connection.execute("DELETE FROM configs WHERE directory = ?", (directory,)).rowcount
+            if not deleted:
+                raise ValueError("Config not found")
+            self._ensure_loaded()
+            if self._configs.pop(directory, None) is not None:
+                del self._directories[bisect.bisect_left(self._directories, directory)]
+                self._search.remove(directory)
+
+    def update_config(self, directory: Config, config: Config) -> None:
+        """Update an existing Config, moving it to the directory of the new Config."""
+        with self.lock:
+            try:
+                with self.connection:
+                    updated = self.connection.execute(
+                        "UPDATE configs SET directory = ?, data = ? WHERE directory = ?",
+                        (config.directory, json.dumps(config.to_dict()), directory)
+                    ).rowcount
+            except sqlite3.IntegrityError:
+                raise ValueError("Config for this directory already exists")
+            if not updated:
+                raise ValueError("Config not found")
+            self._ensure_loaded()
+            if self._configs.pop(directory, None) is not None:
+                del self._directories[bisect.bisect_left(self._directories, directory)]
+                self._search.remove(directory)
+            if config.directory not in self._configs:
+                bisect.insort(self._directories, config.directory)
+                self._search.add(config.directory)
+            self._configs[config.directory] = config
+
+
+    def import_config_files(self, configs_directory: str) -> int:
+        """
+        Copy the configs of a directory of JSON files (see `ConfigFileService`) into
+        the database, in a single transaction. Configs already in the database are kept.
+
+        :param configs_directory: The directory of the JSON config files.
+        :return: Number of imported configs.
+        """
+        configs = ConfigFileService(configs_directory).get_configs()
+        with self.lock:
+            with self.connection:
+                imported = self.connection.executemany(
+                    "INSERT OR IGNORE INTO configs (directory, data) VALUES (?, ?)",
+                    [(config.directory, json.dumps(config.to_dict())) for config in configs]
+                ).rowcount
+            # Read back, the ignored configs are the ones of the database
+            self._data_version = None
+        LOG.info(f"Imported {imported} configs from {configs_directory}")
+        return imported
@@ -1,12 +1,62 @@
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import bisect
 import json
 import os
+import time
 import logging
-from typing import Optional
+import threading
+from typing import Iterator, Optional
 from models import Config
+from search_index import SearchIndex
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, the writes of different processes aren't serialized there
+    fcntl = None
 
 LOG = logging.getLogger(__name__)
 
+
+# Files of the configs directory that keep the writers of different processes coherent
+LOCK_FILENAME = ".lock"
+GENERATION_FILENAME = ".generation"
+
+
+def _write_atomic(path: str, content: str) -> None:
+    """
+    Write a file through a temporary file that is fsynced and renamed over it, so
+    a reader sees either the old or the new content and a crash never leaves half a file.
+    """
+    directory, filename = os.path.split(path)
+    temp_path = os.path.join(directory, f".{filename}.{os.getpid()}.tmp")
+    try:
+        with open(temp_path, 'w') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    _fsync_directory(directory)
+
+
+def _fsync_directory(directory: str) -> None:
+    """Make a rename or a delete in a directory durable (not possible on Windows)."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
 class IConfigService(ABC):
 
     @abstractmethod
@@ -34,73 +84,257 @@ class IConfigService(ABC):
         """Update an existing Config."""
         pass
 
+    def search_configs(self, prefix: str) -> list[Config]:
+        """Returns the Configs whose directory starts with a prefix, sorted by directory."""
+        return [config for config in self.get_configs() if config.directory.startswith(prefix)]
+
+    def find_configs(self, term: str) -> list[Config]:
+        """Returns the Configs whose directory contains a term, ignoring case."""
+        term = term.lower()
+        return [config for config in self.get_configs() if term in config.directory.lower()]
+
 
 
 class ConfigFileService(IConfigService):
-    
+    """
+    Keeps the configs of a directory of JSON files.
+
+    The files are read on the first access, not at construction. After that the
+    directory is checked at most once every `reload_interval` seconds and only the
+    files whose mtime (or size) changed are parsed again, so a long running daemon
+    picks up edits without parsing every config. The directories are kept in a
+    sorted index that is updated on every insert and delete.
 
-    def __init__(self, configs_directory: str) -> None:
+    Writes replace the files atomically and hold an advisory lock of the directory,
+    so services of different processes (like the CLI and the daemon) don't race.
+    Every write also increments a generation counter file: reading it is the only
+    check an access needs to see the writes of another process right away.
+
+    Attributes:
+        configs_directory (str): Directory of the JSON config files.
+        reload_interval (float): Seconds between two checks of the directory for changes.
+    """
+
+    def __init__(self, configs_directory: str, reload_interval: float = 2.0) -> None:
         if not os.path.exists(configs_directory):
             raise Exception("Configs directory don't exists")
         
         self.configs_directory = configs_directory
+        self.reload_interval = reload_interval
         self.configs_map: dict[str, tuple[Config, str]] = dict()
-        self._load_configs()
+        self.lock = threading.RLock()
+
+        # Sorted directories of the configs, and the search index over them
+        self._directories: list[str] = []
+        self._search = SearchIndex()
+        # Filename -> (mtime_ns, size, directory of its config or None if invalid)
+        self._files: dict[str, tuple[int, int, Optional[str]]] = dict()
+        self._last_check: Optional[float] = None
+        self._generation: Optional[int] = None
+
+
+    def _ensure_loaded(self) -> None:
+        """
+        Load the configs on the first access. Then reload the changed files when another
+        service wrote a config, or once per interval for the files edited by hand.
+        """
+        now = time.monotonic()
+        generation = self._read_generation()
+        if self._last_check is None or generation != self._generation or now - self._last_check >= self.reload_interval:
+            self.reload()
+            self._generation = generation
+            self._last_check = now
+
 
+    def _read_generation(self) -> int:
+        """Read the number of writes done to the configs directory by any service."""
+        try:
+            with open(os.path.join(self.configs_directory, GENERATION_FILENAME), 'r') as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return 0
 
-    def _load_configs(self) -> None:
-        """Loads the configs from the configs directory"""
-        for file in os.listdir(self.configs_directory):
-            if file.endswith('.json'):
-                config_path = os.path.join(self.configs_directory, file)
-                with open(config_path, 'r') as f:
-                    data = json.load(f)
-                    config = Config.from_dict(data)
 
-                    # Validate config
-                    if not config.is_valid():
-                        LOG.warning(f"Config {file} is invalid and will be skipped.")
+    def _bump_generation(self) -> None:
+        """Count a write, called while holding the lock."""
+        self._generation = self._read_generation() + 1
+        _write_atomic(os.path.join(self.configs_directory, GENERATION_FILENAME), str(self._generation))
+
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Hold the lock of the service and the advisory lock of the configs directory."""
+        with self.lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.configs_directory, LOCK_FILENAME), 'a') as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+    def reload(self) -> None:
+        """Parse the config files that were added or changed and drop the deleted ones."""
+        with self.lock:
+            seen = set()
+            with os.scandir(self.configs_directory) as it:
+                for entry in it:
+                    if not entry.name.endswith('.json'):
+                        continue
+                    seen.add(entry.name)
+                    try:
+                        file_stat = entry.stat()
+                    except FileNotFoundError:
                         continue
 
-                    self.configs_map[config.directory] = (config, file)
+                    cached = self._files.get(entry.name)
+                    if cached and cached[:2] == (file_stat.st_mtime_ns, file_stat.st_size):
+                        continue
+                    self._load_config(entry.name, file_stat)
+
+            for filename in set(self._files) - seen:
+                self._forget_file(filename)
+
+
+    def _load_config(self, filename: str, file_stat: os.stat_result) -> None:
+        """Parse a config file and put its config in the index."""
+        self._forget_file(filename)
+        config_path = os.path.join(self.configs_directory, filename)
+        directory = None
+        try:
+            with open(config_path, 'r') as f:
+                data = json.load(f)
+                config = Config.from_dict(data)
+
+            # Validate config
+            if config.is_valid():
+                directory = config.directory
+                self._put(config, filename)
+            else:
+                LOG.warning(f"Config {filename} is invalid and will be skipped.")
+        except Exception as e:
+            LOG.error(f"Error reading config {filename}: {e}")
+
+        # Also remembered when invalid, so it's parsed again only when it changes
+        self._files[filename] = (file_stat.st_mtime_ns, file_stat.st_size, directory)
+
+
+    def _forget_file(self, filename: str) -> None:
+        """Drop the config of a file that changed or was deleted."""
+        cached = self._files.pop(filename, None)
+        if not cached or cached[2] is None:
+            return
+        config_tuple = self.configs_map.get(cached[2])
+        if config_tuple and config_tuple[1] == filename:
+            self._remove(cached[2])
+
+
+    def _record_file(self, filename: str, directory: str) -> None:
+        """Remember the stat of a file the service wrote, so it isn't parsed again."""
+        file_stat = os.stat(os.path.join(self.configs_directory, filename))
+        self._files[filename] = (file_stat.st_mtime_ns, file_stat.st_size, directory)
+
+
+    def _put(self, config: Config, filename: str) -> None:
+        """Insert or replace a config in the index."""
+        if config.directory not in self.configs_map:
+            bisect.insort(self._directories, config.directory)
+            self._search.add(config.directory)
+        self.configs_map[config.directory] = (config, filename)
+
+
+    def _remove(self, directory: str) -> None:
+        """Remove a config from the index."""
+        del self.configs_map[directory]
+        idx = bisect.bisect_left(self._directories, directory)
+        del self._directories[idx]
+        self._search.remove(directory)
 
 
     def get_configs(self) -> list[Config]:
         """Returns the list of available Configs."""
-        return sorted([config_tuple[0] for config_tuple in self.configs_map.values()], key=lambda config: config.directory)
+        with self.lock:
+            self._ensure_loaded()
+            return [self.configs_map[directory][0] for directory in self._directories]
+
+    def search_configs(self, prefix: str) -> list[Config]:
+        """Returns the Configs whose directory starts with a prefix, from the sorted index."""
+        with self.lock:
+            self._ensure_loaded()
+            start = bisect.bisect_left(self._directories, prefix)
+            matched = []
+            for directory in self._directories[start:]:
+                if not directory.startswith(prefix):
+                    break
+                matched.append(self.configs_map[directory][0])
+            return matched
+
+    def find_configs(self, term: str) -> list[Config]:
+        """Returns the Configs whose directory contains a term, ignoring case, from the search index."""
+        with self.lock:
+            self._ensure_loaded()
+            return [self.configs_map[directory][0] for directory in self._search.search(term)]
 
     def get_config(self, directory: str) -> Optional[Config]:
         """Load a specific Config by its name."""
-        config_tuple = self.configs_map.get(directory)
-        return config_tuple[0] if config_tuple else None
+        with self.lock:
+            self._ensure_loaded()
+            config_tuple = self.configs_map.get(directory)
+            return config_tuple[0] if config_tuple else None
 
     def create_config(self, config: Config) -> None:
         """Save a Config object."""
-        if config.directory in self.configs_map:
-            raise ValueError("Config for this directory already exists")
-        filename = f"{config.dir_to_filename()}.json"
-        file_path = os.path.join(self.configs_directory, filename)
-        with open(file_path, 'w') as f:
-            json.dump(config.to_dict(), f)
-        self.configs_map[config.directory] = (config, filename)
+        with self._locked():
+            self._ensure_loaded()
+            if config.directory in self.configs_map:
+                raise ValueError("Config for this directory already exists")
+            filename = f"{config.dir_to_filename()}.json"
+            file_path = os.path.join(self.configs_directory, filename)
+            _write_atomic(file_path, json.dumps(config.to_dict()))
+            self._put(config, filename)
+            self._record_file(filename, config.directory)
+            self._bump_generation()
 
     def delete_config(self, directory: str) -> None:
         """Delete a Config."""
-        config_tuple = self.configs_map.get(directory)
-        if not config_tuple:
-            raise ValueError("Config not found")
-        filename = config_tuple[1]
-        file_path = os.path.join(self.configs_directory, filename)
-        os.remove(file_path)
-        del self.configs_map[directory]
+        with self._locked():
+            self._ensure_loaded()
+            config_tuple = self.configs_map.get(directory)
+            if not config_tuple:
+                raise ValueError("Config not found")
+            filename = config_tuple[1]
+            file_path = os.path.join(self.configs_directory, filename)
+            os.remove(file_path)
+            _fsync_directory(self.configs_directory)
+            self._remove(directory)
+            self._files.pop(filename, None)
+            self._bump_generation()
 
     def update_config(self, directory: Config, config: Config) -> None:
-        """Update an existing Config."""
-        config_tuple = self.configs_map.get(directory)
-        if not config_tuple:
-            raise ValueError("Config not found")
-        filename = config_tuple[1]
-        file_path = os.path.join(self.configs_directory, filename)
-        with open(file_path, 'w') as f:
-            json.dump(config.to_dict(), f)
-        self.configs_map[directory] = (config, filename)
\ No newline at end of file
+        """Update an existing Config, moving it to the directory of the new Config."""
+        with self._locked():
+            self._ensure_loaded()
+            config_tuple = self.configs_map.get(directory)
+            if not config_tuple:
+                raise ValueError("Config not found")
+            filename = config_tuple[1]
+            if config.directory != directory:
+                if config.directory in self.configs_map:
+                    raise ValueError("Config for this directory already exists")
+                # The file is named after the directory, a config created later for the old one gets the old name
+                new_filename = f"{config.dir_to_filename()}.json"
+                _write_atomic(os.path.join(self.configs_directory, new_filename), json.dumps(config.to_dict()))
+                if new_filename != filename:
+                    os.remove(os.path.join(self.configs_directory, filename))
+                    _fsync_directory(self.configs_directory)
+                    self._files.pop(filename, None)
+                self._remove(directory)
+                filename = new_filename
+            else:
+                _write_atomic(os.path.join(self.configs_directory, filename), json.dumps(config.to_dict()))
+            self._put(config, filename)
+            self._record_file(filename, config.directory)
+            self._bump_generation()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import logging
+from setup import configs_path, database_path, setup_environment, state_path
+from app_context import AppContext, BACKEND_FILE
+from file_organizer import FileOrganizer
+from run_report import exporters_from_environment
+from sniffing import classifier_from_environment
+from dedupe import deduplicator_from_environment
+from scheduler import Scheduler
+
+# Configure logging
+LOG = logging.getLogger(__name__)
+
+
+def main():
+
+    # Set up the application folders and logging
+    setup_environment(verbose="--verbose" in sys.argv)
+
+    # Setup the daemon dependencies
+    # The config backend is "file" (a JSON file per config) unless FILE_ORGANIZER_CONFIG_BACKEND is "sqlite"
+    backend = os.environ.get("FILE_ORGANIZER_CONFIG_BACKEND", BACKEND_FILE)
+    service = AppContext.create_service(backend, configs_directory=configs_path(), database_path=database_path())
+    organizer = FileOrganizer(
+        state_directory=state_path(), hooks=exporters_from_environment(),
+        classifier=classifier_from_environment(state_path()),
+        deduplicator=deduplicator_from_environment(state_path())
+    )
+
+    # Run the configs on their schedules until interrupted
+    scheduler = Scheduler(organizer=organizer, service=service, state_directory=state_path())
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        LOG.info("Scheduler interrupted")
+    finally:
+        if organizer.classifier:
+            organizer.classifier.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+Module to find the duplicate files of a directory, and to hardlink them.
+
+    Stages
+    --------------------------------------------------------------------
+    1. Group the files by size. A file with a unique size has no duplicate.
+    2. Hash the first and the last `PARTIAL_SIZE` bytes of the files of the same size.
+    3. Hash the whole content of the files with the same partial hash.
+    Each stage only reads the files the previous one couldn't tell apart, so most
+    files are never read. The reads of a stage run in a thread pool, every worker
+    streams the files through one reused buffer.
+
+The hashes are cached by inode (see `inode_cache`), so the next runs only hash
+the files that are new or changed.
+"""
+
+import os
+import hashlib
+import logging
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Optional
+
+from inode_cache import InodeCache
+from picklable import PicklableLock
+from move_plan import FileEntry
+
+
+LOG = logging.getLogger(__name__)
+
+
+# Bytes hashed from the start and from the end of a file in stage 2
+PARTIAL_SIZE = 64 * 1024
+# Buffer of the full hash of stage 3
+CHUNK_SIZE = 1024 * 1024
+
+# Files hashed at the same time
+HASH_WORKERS = 8
+
+MAX_CACHE_ENTRIES = 200_000
+CACHE_FILENAME = "hashes.json"
+
+# What to do with the duplicates
+MODE_REPORT = "report"
+MODE_HARDLINK = "hardlink"
+
+
+def _new_hash():
+    return hashlib.blake2b(digest_size=20)
+
+
+@dataclass
+class DuplicateGroup:
+    """
+    Represents files with the same content.
+
+    Attributes:
+        size (int): Size of each file in bytes.
+        digest (str): Hex hash of the content.
+        paths (list[str]): Paths of the files, sorted. The first one is kept as the original.
+        stats (dict[str, tuple[int, int, int]]): The (size, mtime_ns, inode) each file was hashed with.
+    """
+
+    size: int
+    digest: str
+    paths: list[str] = field(default_factory=list)
+    stats: dict[str, tuple[int, int, int]] = field(default_factory=dict)
+
+    def wasted_bytes(self) -> int:
+        """Bytes the copies take besides the original."""
+        return self.size * (len(self.paths) - 1)
+
+
+class DuplicateFinder(PicklableLock):
+    """
+    Finds the files with the same content, and optionally hardlinks them.
+
+    Attributes:
+        mode (str): "report" to only log the duplicates, "hardlink" to replace them with links to the original.
+        max_workers (int): Number of files hashed at the same time.
+        cache (InodeCache): The partial and full hashes by inode.
+        reads (int): Number of files read, for the tests and the logs.
+    """
+
+    # The read buffers are per thread
+    UNPICKLED = {"lock": threading.Lock, "_local": threading.local}
+
+    def __init__(
+        self,
+        mode: str = MODE_REPORT,
+        cache_path: Optional[str] = None,
+        max_workers: int = HASH_WORKERS,
+        max_entries: int = MAX_CACHE_ENTRIES
+    ) -> None:
+        if mode not in (MODE_REPORT, MODE_HARDLINK):
+            raise ValueError(f"Unknown dedupe mode: {mode}")
+        self.mode = mode
+        self.max_workers = max(1, max_workers)
+        self.cache = InodeCache(cache_path, max_entries)
+        self.reads = 0
+        self.lock = threading.Lock()
+        self._local = threading.local()
+
+
+    def _buffer(self) -> memoryview:
+        """The read buffer of the current thread."""
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = self._local.buffer = memoryview(bytearray(CHUNK_SIZE))
+        return buffer
+
+
+    def _hashes(self, entry: FileEntry) -> list:
+        """The cached [partial, full] hashes of a file, full is None until it's computed."""
+        return self.cache.get((entry.device, entry.inode), entry.size, entry.mtime_ns) or [None, None]
+
+
+    def partial_hash(self, entry: FileEntry) -> Optional[str]:
+        """Hash of the first and last `PARTIAL_SIZE` bytes of a file, None if it can't be read."""
+        hashes = self._hashes(entry)
+        if hashes[0] is not None:
+            return hashes[0]
+
+        path = os.path.join(entry.parent, entry.name)
+        digest = _new_hash()
+        try:
+            with open(path, "rb", buffering=0) as f:
+                buffer = self._buffer()
+                count = f.readinto(buffer[:PARTIAL_SIZE])
+                digest.update(buffer[:count])
+                if entry.size > 2 * PARTIAL_SIZE:
+                    f.seek(entry.size - PARTIAL_SIZE)
+                    count = f.readinto(buffer[:PARTIAL_SIZE])
+                    digest.update(buffer[:count])
+                elif entry.size > PARTIAL_SIZE:
+                    count = f.readinto(buffer[:PARTIAL_SIZE])
+                    digest.update(buffer[:count])
+        except OSError as e:
+            LOG.error(f"Error reading {path}: {e}")
+            return None
+
+        with self.lock:
+            self.reads += 1
+        hashes[0] = digest.hexdigest()
+        # Up to two partial reads cover the whole file, the partial hash is the full one
+        if entry.size <= 2 * PARTIAL_SIZE:
+            hashes[1] = hashes[0]
+        self.cache.put((entry.device, entry.inode), entry.size, entry.mtime_ns, hashes)
+        return hashes[0]
+
+
+    def full_hash(self, entry: FileEntry) -> Optional[str]:
+        """Hash of the whole content of a file, None if it can't be read."""
+        hashes = self._hashes(entry)
+        if hashes[1] is not None:
+            return hashes[1]
+
+        path = os.path.join(entry.parent, entry.name)
+        digest = _new_hash()
+        try:
+            with open(path, "rb", buffering=0) as f:
+                buffer = self._buffer()
+                while count := f.readinto(buffer):
+                    digest.update(buffer[:count])
+        except OSError as e:
+            LOG.error(f"Error reading {path}: {e}")
+            return None
+
+        with self.lock:
+            self.reads += 1
+        hashes[1] = digest.hexdigest()
+        self.cache.put((entry.device, entry.inode), entry.size, entry.mtime_ns, hashes)
+        return hashes[1]
+
+
+    def _split(self, groups: list[list[FileEntry]], key: Callable[[FileEntry], Optional[str]]) -> list[list[FileEntry]]:
+        """Split groups of files by a hash, keeping the subgroups with more than one file."""
+        entries = [entry for group in groups for entry in group]
+        if self.max_workers == 1 or len(entries) <= 1:
+            keys = [key(entry) for entry in entries]
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                keys = list(executor.map(key, entries))
+
+        split: dict[tuple[int, str], list[FileEntry]] = {}
+        for entry, digest in zip(entries, keys):
+            if digest is not None:
+                split.setdefault((entry.size, digest), []).append(entry)
+        return [group for group in split.values() if len(group) > 1]
+
+
+    def find(self, entries: Iterable[FileEntry]) -> list[DuplicateGroup]:
+        """
+        Find the groups of files with the same content. The entries need their stats
+        (see `FileOrganizer.scan_files`). Empty files and links to the same inode are skipped.
+
+        :param entries: The files to check.
+        :return: The groups of duplicates, largest waste first.
+        """
+        by_size: dict[int, list[FileEntry]] = {}
+        seen_inodes = set()
+        for entry in entries:
+            if entry.size == 0 or (entry.device, entry.inode) in seen_inodes:
+                continue
+            seen_inodes.add((entry.device, entry.inode))
+            by_size.setdefault(entry.size, []).append(entry)
+
+        groups = [group for group in by_size.values() if len(group) > 1]
+        if groups:
+            groups = self._split(groups, self.partial_hash)
+        if groups:
+            groups = self._split(groups, self.full_hash)
+        self.cache.save()
+
+        duplicates = [
+            DuplicateGroup(
+                size=group[0].size,
+                digest=self.full_hash(group[0]),
+                paths=sorted(os.path.join(entry.parent, entry.name) for entry in group),
+                stats={os.path.join(entry.parent, entry.name): (entry.size, entry.mtime_ns, entry.inode) for entry in group}
+            )
+            for group in groups
+        ]
+        duplicates.sort(key=lambda group: (-group.wasted_bytes(), group.paths[0]))
+        return duplicates
+
+
+    def link(self, group: DuplicateGroup) -> int:
+        """
+        Replace the copies of a group with hardlinks to its first file. Each copy is
+        replaced atomically: the link is created next to it, under a name no file
+        has, and renamed over it. A copy is skipped when it or the original changed
+        since they were hashed.
+
+        :param group: The duplicates to link.
+        :return: The bytes freed.
+        """
+        original, *copies = group.paths
+        freed = 0
+        for path in copies:
+            temp_path = None
+            try:
+                if self._changed(group, original) or self._changed(group, path):
+                    LOG.warning(f"Not linking {path} to {original}, a file changed since it was hashed")
+                    continue
+
+                # A unique name, so a file of the user is never replaced or removed
+                while temp_path is None:
+                    candidate = f"{path}.{secrets.token_hex(8)}.dedupe.tmp"
+                    try:
+                        os.link(original, candidate)
+                        temp_path = candidate
+                    except FileExistsError:
+                        continue
+                os.replace(temp_path, path)
+                temp_path = None
+                freed += group.size
+                LOG.debug(f"Linked {path} to {original}")
+            except OSError as e:
+                LOG.error(f"Error linking {path} to {original}: {e}")
+                if temp_path is not None:
+                    os.remove(temp_path)
+        return freed
+
+
+    @staticmethod
+    def _changed(group: DuplicateGroup, path: str) -> bool:
+        """Whether a file of a group isn't the one that was hashed anymore."""
+        file_stat = os.lstat(path)
+        expected = group.stats.get(path)
+        if expected is None:
+            return file_stat.st_size != group.size
+        return (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino) != expected
+
+
+def deduplicator_from_environment(state_directory: Optional[str]) -> Optional[DuplicateFinder]:
+    """
+    Create the duplicate finder when the environment enables it:
+        FILE_ORGANIZER_DEDUPE    "report" to log the duplicates of each run, "hardlink" to also link them
+    The hashes are kept in the state directory.
+    """
+    mode = os.environ.get("FILE_ORGANIZER_DEDUPE")
+    if not mode:
+        return None
+    try:
+        return DuplicateFinder(mode, cache_path=os.path.join(state_directory, CACHE_FILENAME) if state_directory else None)
+    except ValueError as e:
+        LOG.error(f"Error in FILE_ORGANIZER_DEDUPE: {e}")
+        return None
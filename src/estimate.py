@@ -0,0 +1,126 @@
+"""
+Module to estimate the cost of organize and reset runs before doing them.
+
+The organizer measures the throughput of its real runs (moves per second) and
+keeps it in the state directory. A dry run counts the work of a run in a single
+metadata pass and turns it into an estimated duration with that throughput.
+"""
+
+import os
+import json
+import logging
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from picklable import PicklableLock
+
+
+LOG = logging.getLogger(__name__)
+
+
+THROUGHPUT_FILENAME = "throughput.json"
+
+# Weight of the newest measurement in the moving average
+SMOOTHING = 0.3
+
+
+@dataclass
+class DryRunReport:
+    """
+    Represents the work an organize (or reset) run would do.
+
+    Attributes:
+        directory (str): Directory of the config.
+        incremental (bool): Whether the run would skip the reset step.
+        moves (int): Number of file moves (a reset and categorize moves a file twice).
+        bytes (int): Total size of the moved files.
+        cross_device (int): Number of moves that would copy the file to another filesystem.
+        directories_created (int): Number of directories the run would create.
+        directories_removed (int): Number of directories the run would remove.
+        estimated_duration (float | None): Estimated seconds, None without a measured throughput.
+    """
+
+    directory: str
+    incremental: bool = False
+    moves: int = 0
+    bytes: int = 0
+    cross_device: int = 0
+    directories_created: int = 0
+    directories_removed: int = 0
+    estimated_duration: Optional[float] = None
+
+
+class ThroughputStore(PicklableLock):
+    """
+    Keeps a moving average of the measured moves per second. Measurements are
+    kept in memory until `save`, the organizer stores them once per run.
+
+    Attributes:
+        path (str | None): Path of the JSON file, without it measurements are only kept in memory.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.files_per_second: Optional[float] = None
+        self._changed = False
+        self._load()
+
+
+    def _load(self):
+        """Load the stored throughput, if any."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                self.files_per_second = json.load(f).get("files_per_second")
+        except Exception as e:
+            LOG.error(f"Error reading throughput {self.path}: {e}")
+
+
+    def record(self, moves: int, seconds: float):
+        """
+        Add a measurement of a run.
+
+        :param moves: Number of moves the run did.
+        :param seconds: Time the moves took.
+        """
+        if moves <= 0 or seconds <= 0:
+            return
+
+        with self.lock:
+            measured = moves / seconds
+            if self.files_per_second is None:
+                self.files_per_second = measured
+            else:
+                self.files_per_second = SMOOTHING * measured + (1 - SMOOTHING) * self.files_per_second
+            self._changed = True
+
+
+    def save(self):
+        """Store the throughput, if it changed since it was loaded."""
+        with self.lock:
+            if not self.path or not self._changed:
+                return
+            data = {"files_per_second": self.files_per_second}
+            self._changed = False
+        temp_path = None
+        try:
+            # Unique in the state directory, so the CLI and the daemon never share it
+            fd, temp_path = tempfile.mkstemp(prefix=f"{os.path.basename(self.path)}.", suffix=".tmp", dir=os.path.dirname(self.path) or ".")
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            LOG.error(f"Error writing throughput {self.path}: {e}")
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+    def estimate(self, moves: int) -> Optional[float]:
+        """Estimate the seconds `moves` moves take, None without a measurement."""
+        if not self.files_per_second:
+            return None
+        return moves / self.files_per_second
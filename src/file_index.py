@@ -0,0 +1,188 @@
+"""
+Module to keep a persistent index of the files of a configured directory.
+
+The index remembers, for every directory inside the categories, the mtime it had
+at the end of the last run together with the files it contained (size, mtime, inode
+and assigned category). A directory whose mtime didn't change since then doesn't need
+to be listed again: its files are exactly the ones of the index and they are already in place.
+"""
+
+import os
+import sqlite3
+import logging
+from typing import Iterable, Optional
+
+from move_plan import FileEntry, MoveAction
+
+
+LOG = logging.getLogger(__name__)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    parent TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    parent TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    PRIMARY KEY (parent, name)
+);
+CREATE INDEX IF NOT EXISTS files_size ON files (size);
+"""
+
+# Values bound in one query, below the SQLite limit of host parameters
+MAX_PARAMETERS = 500
+
+
+class FileIndex:
+    """
+    SQLite backed index of the files and directories of a configured directory.
+
+    The directories table is small and is kept in memory for the lookups of a run,
+    the files table is only read and written for the directories that changed.
+
+    Attributes:
+        path (str): Path of the SQLite database file.
+        directory (str): The main directory the index belongs to.
+    """
+
+    def __init__(self, path: str, directory: str) -> None:
+        self.path = path
+        self.directory = directory
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+        # Load the directories: path -> (parent, mtime_ns)
+        self.directories: dict[str, tuple[str, int]] = {
+            path: (parent, mtime_ns)
+            for path, parent, mtime_ns in self.connection.execute("SELECT path, parent, mtime_ns FROM directories")
+        }
+        self.children: dict[str, list[str]] = {}
+        for path, (parent, _) in self.directories.items():
+            self.children.setdefault(parent, []).append(path)
+
+
+    def __enter__(self) -> 'FileIndex':
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.connection.commit()
+        self.close()
+
+
+    def close(self):
+        """Close the database connection."""
+        self.connection.close()
+
+
+    def _category(self, parent: str) -> str:
+        """Get the category path (relative to the main directory) of a file's parent."""
+        return os.path.relpath(parent, self.directory)
+
+
+    def directory_mtime(self, path: str) -> Optional[int]:
+        """Get the mtime a directory had at the end of the last run, if it's indexed."""
+        directory = self.directories.get(path)
+        return directory[1] if directory else None
+
+
+    def child_directories(self, path: str) -> list[str]:
+        """Get the indexed subdirectories of a directory."""
+        return list(self.children.get(path, []))
+
+
+    def paths_with_sizes(self, sizes: Iterable[int]) -> list[str]:
+        """Get the paths of the indexed files that have one of the given sizes, like the candidate duplicates of some files."""
+        sizes = list(set(sizes))
+        paths = []
+        for start in range(0, len(sizes), MAX_PARAMETERS):
+            chunk = sizes[start:start + MAX_PARAMETERS]
+            rows = self.connection.execute(
+                f"SELECT parent, name FROM files WHERE size IN ({', '.join('?' * len(chunk))})", chunk
+            )
+            paths.extend(os.path.join(parent, name) for parent, name in rows)
+        return paths
+
+
+    def set_directory_mtime(self, path: str, mtime_ns: int):
+        """Record the mtime of an indexed (or new) directory."""
+        parent = self.directories[path][0] if path in self.directories else os.path.dirname(path)
+        if path not in self.directories:
+            self.children.setdefault(parent, []).append(path)
+        self.directories[path] = (parent, mtime_ns)
+        self.connection.execute(
+            "INSERT OR REPLACE INTO directories (path, parent, mtime_ns) VALUES (?, ?, ?)",
+            (path, parent, mtime_ns)
+        )
+
+
+    def update_directory(self, path: str, mtime_ns: int, files: list[FileEntry], subdirectories: list[str]):
+        """
+        Replace what the index knows about a directory with a fresh listing.
+
+        :param path: The listed directory.
+        :param mtime_ns: The mtime of the directory when it was listed.
+        :param files: The files of the directory.
+        :param subdirectories: The paths of the subdirectories of the directory.
+        """
+        # Forget the subdirectories that no longer exist
+        for child in self.child_directories(path):
+            if child not in subdirectories:
+                self.remove_tree(child)
+
+        self.set_directory_mtime(path, mtime_ns)
+        self.replace_files(path, files)
+
+
+    def replace_files(self, parent: str, files: list[FileEntry]):
+        """Replace the indexed files of a directory."""
+        self.connection.execute("DELETE FROM files WHERE parent = ?", (parent,))
+        self.put_files(files)
+
+
+    def put_files(self, files: Iterable[FileEntry]):
+        """Insert (or replace) files in the index."""
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO files (parent, name, size, mtime_ns, inode, category) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (entry.parent, entry.name, entry.size, entry.mtime_ns, entry.inode, self._category(entry.parent))
+                for entry in files
+            )
+        )
+
+
+    def record_moves(self, actions: Iterable[MoveAction]):
+        """Move the indexed files of completed move actions to their destination."""
+        self.connection.executemany(
+            "UPDATE OR REPLACE files SET parent = ?, category = ? WHERE parent = ? AND name = ?",
+            (
+                (action.destination, self._category(action.destination), *os.path.split(action.source))
+                for action in actions
+            )
+        )
+
+
+    def remove_tree(self, path: str):
+        """Forget a directory, its subdirectories and their files."""
+        prefix = path.rstrip(os.sep) + os.sep
+        removed = [other for other in self.directories if other == path or other.startswith(prefix)]
+        for other in removed:
+            parent, _ = self.directories.pop(other)
+            siblings = self.children.get(parent)
+            if siblings and other in siblings:
+                siblings.remove(other)
+            self.children.pop(other, None)
+
+        for query in (
+            "DELETE FROM directories WHERE path = ? OR substr(path, 1, ?) = ?",
+            "DELETE FROM files WHERE parent = ? OR substr(parent, 1, ?) = ?"
+        ):
+            self.connection.execute(query, (path, len(prefix), prefix))
@@ -10,25 +10,92 @@ Module to process and sort the directories via a json config file.
     
     Step 2. Check if any category exists and move all files from the category and subcategories back to the main directory
     
-    Step 3. Create missing categories plus `Uncategorized` and `.hidden`, one for files that have no category 
-            and one for files that are hidden.
+    Step 3. Move files to the appropriate categories/subcategories, plus `Uncategorized` and `.hidden`,
+            one for files that have no category and one for files that are hidden.
 
-    Step 6. Move files to the appropriate categories/subcategories
+    Step 4. Remove the categories that got no files.
 
-    Step 7. Check any categories/subcategories and remove empty ones.
+    Step 5. (Optional) Find the duplicate files of the categories, and hardlink them (see `dedupe`).
+
+    The moves of Step 3 are computed as a `MovePlan` and then applied by
+    `execute_plan`, so a plan can be inspected before touching the filesystem.
+    A full run streams Step 2 and Step 3 instead: the scan, the planning and the
+    moves run at the same time on batches of files (see `pipeline`), so the memory
+    doesn't grow with the size of the directory.
+    The directories come from the plans too: only the destinations that receive
+    files are created, and only the directories that files left are removed.
+
+    Many Configs
+    --------------------------------------------------------------------
+    `process_configs` runs independent configs at the same time in a thread (or process)
+    pool, bounded per device, and never runs overlapping directories together.
+
+    Incremental Mode
+    --------------------------------------------------------------------
+    When `process_config` runs with `incremental=True` and the category layout
+    is the same as the one recorded on the previous run, Step 2 is skipped.
+    Files already inside the categories are only moved when their target changed,
+    and files in the main directory are categorized as usual. A persistent file index
+    in the state directory remembers the directories of the last run, so only the ones
+    whose mtime changed are listed again. So the age rules of a category (see `routing`)
+    only move the files of unchanged directories on the next full run.
+
+    Interrupted Runs
+    --------------------------------------------------------------------
+    With a state directory, the plans of Step 2 and Step 3 are written to a journal
+    (see `journal`) before they run. A run that was killed leaves its journal behind,
+    and the next run of the directory (or `recover`) does the moves that are missing
+    before starting. `recover(config, rollback=True)` moves the files back instead.
 """
 
 import os
+import errno
+import stat
 import platform
 import shutil
+import time
 import logging
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Iterable, Iterator, Optional
 
 from models import Category, Config
+from estimate import DryRunReport, THROUGHPUT_FILENAME, ThroughputStore
+from file_index import FileIndex
+from journal import MoveJournal, action_done
+from move_log import MoveLog, MoveLogWriter
+from move_plan import CompactMovePlan, FileEntry, MoveAction, MovePlan, MovePlanner, REASON_RESET, REASON_ROLLBACK
+from pipeline import batched, threaded
+from routing import layout_signature
+from run_report import LastReportStore, RunRecorder, RunReport
+from dedupe import DuplicateFinder, DuplicateGroup, MODE_HARDLINK
+from sniffing import ContentClassifier
 
 
 LOG = logging.getLogger(__name__)
 
 
+# Moves of an undo applied at a time
+UNDO_BATCH_SIZE = 10000
+
+
+# Phases of a journaled run
+PHASE_RESET = "reset"
+PHASE_CATEGORIZE = "categorize"
+PHASE_ORGANIZE = "organize"
+# Names of the moves outside of a run, in the logs
+PHASE_RESUME = "resume"
+PHASE_ROLLBACK = "rollback"
+PHASE_UNDO = "undo"
+
+
+# Statuses of a config run
+STATUS_DONE = "done"
+STATUS_INACTIVE = "inactive"
+STATUS_SKIPPED = "skipped"
+STATUS_ERROR = "error"
+
+
 class FileOrganizer:
 
     CRITICAL_DIRECTORIES = {
@@ -43,6 +110,97 @@ class FileOrganizer:
     ]
 
 
+    def __init__(
+        self,
+        state_directory: Optional[str] = None,
+        max_workers: int = 1,
+        per_device_limit: int = 1,
+        use_processes: bool = False,
+        hooks: Optional[list] = None,
+        classifier: Optional[ContentClassifier] = None,
+        deduplicator: Optional[DuplicateFinder] = None
+    ) -> None:
+        """
+        :param state_directory: Directory to keep the per config run state (like the
+            category layout of the last run). Without it incremental runs always do a full reset.
+        :param max_workers: Number of configs `process_configs` runs at the same time.
+        :param per_device_limit: Number of configs on the same device that run at the same time.
+        :param use_processes: Use a process pool instead of a thread pool in `process_configs`.
+        :param hooks: Hooks called with the report of every run (see `run_report`), like an exporter.
+        :param classifier: Classifies the files that would be uncategorized by their content (see `sniffing`).
+        :param deduplicator: Finds (and links) the duplicate files after each run of `process_config` (see `dedupe`).
+        """
+        self.state_directory = state_directory
+        self.throughput = ThroughputStore(os.path.join(state_directory, THROUGHPUT_FILENAME) if state_directory else None)
+        self.max_workers = max_workers
+        self.per_device_limit = max(1, per_device_limit)
+        self.use_processes = use_processes
+        self.classifier = classifier
+        self.deduplicator = deduplicator
+
+        # The last report of each config is kept for the CLI
+        self.reports = LastReportStore(state_directory) if state_directory else None
+        self.hooks = list(hooks or []) + ([self.reports] if self.reports else [])
+
+
+    def last_report(self, directory: str) -> Optional[RunReport]:
+        """Get the report of the last run of a directory, if it's known."""
+        return self.reports.load(directory) if self.reports else None
+
+
+    @staticmethod
+    def layout_signature(categories: list[Category]) -> str:
+        """
+        Compute a fingerprint of the category layout, see `routing.layout_signature`.
+
+        :param categories: List of category objects.
+        """
+        return layout_signature(categories)
+
+
+    def _layout_state_path(self, directory: str) -> Optional[str]:
+        """Get the path of the file that keeps the last layout signature of a directory."""
+        if not self.state_directory:
+            return None
+        return os.path.join(self.state_directory, f"{directory.replace('/', '_')}.layout")
+
+
+    def load_layout_signature(self, directory: str) -> Optional[str]:
+        """Load the layout signature recorded on the last run of a directory, if any."""
+        state_path = self._layout_state_path(directory)
+        if not state_path or not os.path.exists(state_path):
+            return None
+        try:
+            with open(state_path, "r") as f:
+                return f.read().strip()
+        except Exception as e:
+            LOG.error(f"Error reading layout state {state_path}: {e}")
+            return None
+
+
+    def save_layout_signature(self, directory: str, categories: list[Category]):
+        """Record the layout signature of a directory after a successful run."""
+        self._write_layout_signature(directory, self.layout_signature(categories))
+
+
+    def _write_layout_signature(self, directory: str, signature: str):
+        """Record a layout signature of a directory."""
+        state_path = self._layout_state_path(directory)
+        if not state_path:
+            return
+        try:
+            os.makedirs(self.state_directory, exist_ok=True)
+            with open(state_path, "w") as f:
+                f.write(signature)
+        except Exception as e:
+            LOG.error(f"Error writing layout state {state_path}: {e}")
+
+
+    def layout_changed(self, directory: str, categories: list[Category]) -> bool:
+        """Check whether the category layout changed since the last run of a directory."""
+        return self.load_layout_signature(directory) != self.layout_signature(categories)
+
+
     def validate_directory(self, directory: str):
         """
         Validates the directory existance, permissions and if it is
@@ -63,7 +221,14 @@ class FileOrganizer:
             raise PermissionError("No permission to access the directory")
 
 
-    def reset_directory(self, directory: str, categories: list[Category]):
+    def reset_directory(
+        self,
+        directory: str,
+        categories: list[Category],
+        journal: Optional[MoveJournal] = None,
+        move_log: Optional[MoveLogWriter] = None,
+        report: Optional[RunReport] = None
+    ):
         """
         Move all files from the category directories (and their subdirectories)
         to the main directory and remove the empty subdirectories, but leave
@@ -71,32 +236,29 @@ class FileOrganizer:
         
         :param directory: The main directory path.
         :param categories: List of category names.
+        :param journal: Journal to record the moves in.
+        :param move_log: Log to record the done moves in, for an undo.
+        :param report: Report to count the files of the run in.
         """
+        # Move each file to the main directory, while the categories are still scanned
+        subdirectories = []
+        plans = (
+            MovePlan(directory=directory, scanned=len(batch), actions=[
+                MoveAction(os.path.join(entry.parent, entry.name), directory, REASON_RESET, entry.size, entry.device)
+                for entry in batch
+            ])
+            for batch in threaded(batched(self.iter_categories(directory, categories, directories=subdirectories)))
+        )
+        self.execute_stream(directory, plans, journal=journal, phase=PHASE_RESET, move_log=move_log, report=report)
 
-        for category in categories + self.SPECIAL_CATEGORIES:
-
-            # Create the path to the category
-            category_path = os.path.join(directory, category.name)
-            
-             # Check if the category directory exists
-            if os.path.exists(category_path):
-                # Recursively walk through the directory
-                for root, _, files in os.walk(category_path, topdown=False):  # Using topdown=False to iterate from innermost directory
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        try:
-                            # Move each file to the main directory
-                            shutil.move(file_path, directory)
-                            LOG.info(f"Moved {file} from {root} to {directory}")
-                        except Exception as e:
-                            LOG.error(f"Error moving {file} to main directory: {e}")
-
-                    # Check if the directory is empty and it's not the main category directory
-                    if not os.listdir(root) and root != category_path:
-                        try:
-                            os.rmdir(root)
-                        except Exception as e:
-                            LOG.error(f"Error removing directory {root}: {e}")
+        # Remove the emptied subdirectories, innermost first. The ones that still
+        # have content (like a file that failed to move) can't be removed.
+        for path in reversed(subdirectories):
+            try:
+                os.rmdir(path)
+            except OSError as e:
+                if e.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                    LOG.error(f"Error removing directory {path}: {e}")
 
 
     def create_categories(self, directory: str, categories: list[Category]):
@@ -132,63 +294,536 @@ class FileOrganizer:
                             LOG.error(f"Error creating extension subdirectory {ext_dir}: {e}")
 
 
-    def categorize_files(self, directory: str, categories: list[Category]):
+    def scan_files(self, directory: str, recursive: bool = False, with_stats: bool = False) -> list[FileEntry]:
         """
-        Categorize files in the main directory based on their extensions.
-        
+        Collect the files (not directories) inside a directory. Each directory is
+        listed once with `os.scandir` and the file type comes from the cached directory
+        entry, so files are only stat'ed when `with_stats` asks for their sizes.
+
+        :param directory: The directory to scan.
+        :param recursive: Also scan the subdirectories.
+        :param with_stats: Read the size, device, mtime and inode of every file.
+        """
+        return list(self.iter_files(directory, recursive, with_stats))
+
+
+    def iter_files(
+        self,
+        directory: str,
+        recursive: bool = False,
+        with_stats: bool = False,
+        directories: Optional[list[str]] = None
+    ) -> Iterator[FileEntry]:
+        """
+        Yield the files inside a directory as `os.scandir` lists them, see `scan_files`.
+        Nothing but the open directory listings is kept, however many files there are.
+
+        :param directories: If given, the subdirectories found while recursing are appended to it.
+        """
+        return self._iter_scan(directory, recursive, with_stats, _directory_device(directory), directories)
+
+
+    def _iter_scan(
+        self,
+        directory: str,
+        recursive: bool,
+        with_stats: bool,
+        device: int,
+        directories: Optional[list[str]] = None
+    ) -> Iterator[FileEntry]:
+        """
+        Yield the files of a directory, see `iter_files`.
+        When `directories` is given, the subdirectories found while recursing are appended to it.
+        """
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        # Ensure it's a file and not a directory.
+                        if entry.is_file():
+                            if with_stats:
+                                file_stat = entry.stat()
+                                file_entry = FileEntry(
+                                    directory, entry.name, file_stat.st_size, file_stat.st_dev,
+                                    file_stat.st_mtime_ns, file_stat.st_ino
+                                )
+                            else:
+                                file_entry = FileEntry(directory, entry.name, 0, device)
+                        elif recursive and entry.is_dir(follow_symlinks=False):
+                            if directories is not None:
+                                directories.append(entry.path)
+                            yield from self._iter_scan(entry.path, recursive, with_stats, device, directories)
+                            continue
+                        else:
+                            LOG.debug(f"Skipping {entry.path} directory")
+                            continue
+                    except OSError as e:
+                        LOG.error(f"Error reading {entry.path}: {e}")
+                        continue
+                    yield file_entry
+        except OSError as e:
+            LOG.error(f"Error reading directory {directory}: {e}")
+
+
+    def scan_categories(
+        self,
+        directory: str,
+        categories: list[Category],
+        with_stats: bool = False,
+        directories: Optional[list[str]] = None
+    ) -> list[FileEntry]:
+        """
+        Collect the files inside the category directories (and their subdirectories).
+
         :param directory: The main directory path.
         :param categories: List of category objects.
+        :param with_stats: Read the size, device, mtime and inode of every file.
+        :param directories: If given, the subdirectories of the categories are appended to it.
         """
-        
-       # Create a mapping of extensions to their respective categories.
-        extension_to_category = {}
+        return list(self.iter_categories(directory, categories, with_stats, directories))
+
+
+    def iter_categories(
+        self,
+        directory: str,
+        categories: list[Category],
+        with_stats: bool = False,
+        directories: Optional[list[str]] = None
+    ) -> Iterator[FileEntry]:
+        """Yield the files inside the category directories, see `scan_categories`."""
+        device = _directory_device(directory)
         for category in categories + self.SPECIAL_CATEGORIES:
-            for ext in category.extensions:
-                extension_to_category[ext] = category
-        
-        # Go through each file in the main directory.
-        for filename in os.listdir(directory):
-            file_path = os.path.join(directory, filename)
-            
-            # Ensure it's a file and not a directory.
-            if not os.path.isfile(file_path):
-                LOG.debug(f"Skipping {file_path} directory")
+
+            category_path = os.path.join(directory, category.name)
+            if not os.path.isdir(category_path):
                 continue
-            
-            # If the file starts with a dot (i.e., it's hidden), move to ".hidden" directory.
-            if filename.startswith('.'):
-                LOG.warning(f"File {filename} is a hidden file")
-                target_directory = os.path.join(directory, ".hidden")
+
+            yield from self._iter_scan(category_path, True, with_stats, device, directories)
+
+
+    def scan_categories_indexed(self, directory: str, categories: list[Category], index: FileIndex) -> list[FileEntry]:
+        """
+        Collect the files inside the category directories that may need to move.
+        Directories with the same mtime as in the index are only stat'ed: their files
+        are the ones of the last run, which are already in place. The other directories
+        are listed again and the index is updated with their contents.
+
+        :param directory: The main directory path.
+        :param categories: List of category objects.
+        :param index: The file index of the directory.
+        """
+        entries = []
+        for category in categories + self.SPECIAL_CATEGORIES:
+
+            pending = [os.path.join(directory, category.name)]
+            while pending:
+                path = pending.pop()
                 try:
-                    shutil.move(file_path, target_directory)
-                    LOG.info(f"Moved {filename} to {target_directory}")
+                    mtime_ns = os.stat(path).st_mtime_ns
+                except FileNotFoundError:
+                    index.remove_tree(path)
                     continue
-                except Exception as e:
-                    LOG.error(f"Error moving {filename} to {target_directory}: {e}")
-            
-            # Get the file's extension.
-            _, ext = os.path.splitext(filename)
-            
-            # Determine its category.
-            category = extension_to_category.get(ext)
-            if not category:
-                # If the extension doesn't match any category, move to "Uncategorized" directory.
-                LOG.warning(f"File {filename} has no category")
-                target_directory = os.path.join(directory, "Uncategorized")
-            else:
-                # Determine the target directory based on whether we're categorizing by extension.
-                if category.categorize_extensions:
-                    LOG.info(f"Category {category.name} will categorize extensions")
-                    target_directory = os.path.join(directory, category.name, ext.lstrip('.'))
-                else:
-                    target_directory = os.path.join(directory, category.name)
-            
-            # Move the file to its category directory (or sub-directory).
+                except OSError as e:
+                    LOG.error(f"Error reading directory {path}: {e}")
+                    continue
+
+                if index.directory_mtime(path) == mtime_ns:
+                    pending.extend(index.child_directories(path))
+                    continue
+
+                files = self.scan_files(path, with_stats=True)
+                subdirectories = _subdirectories(path)
+                index.update_directory(path, mtime_ns, files, subdirectories)
+                entries.extend(files)
+                pending.extend(subdirectories)
+        return entries
+
+
+    def _plan(self, planner: MovePlanner, entries: list[FileEntry], compact: bool = False) -> 'MovePlan | CompactMovePlan':
+        """
+        Plan the moves of files, with the content types of the uncategorized ones when there's a classifier.
+        The plans of whole directories are `compact`, see `CompactMovePlan`.
+        """
+        content_types = None
+        if self.classifier:
+            content_types = self.classifier.classify(planner.uncategorized(entries))
+        return planner.plan(entries, content_types, compact=compact)
+
+
+    def _save_classifier(self):
+        """Store the content types the plans of a phase found, if there's a classifier."""
+        if self.classifier:
+            self.classifier.save()
+
+
+    def plan_config(self, config: Config) -> CompactMovePlan:
+        """
+        Plan the moves needed to organize a config's directory without a reset.
+        Misplaced files inside the categories are planned first, then the files
+        of the main directory.
+
+        :param config: The config to plan for.
+        """
+        planner = MovePlanner(config.directory, config.categories + self.SPECIAL_CATEGORIES)
+        plan = self._plan(planner, self.scan_categories(config.directory, config.categories, with_stats=planner.needs_stats), compact=True)
+        plan.extend(self._plan(planner, self.scan_files(config.directory, with_stats=planner.needs_stats)))
+        self._save_classifier()
+        return plan
+
+
+    def _index_path(self, directory: str) -> Optional[str]:
+        """Get the path of the file index of a directory."""
+        if not self.state_directory:
+            return None
+        return os.path.join(self.state_directory, f"{directory.replace('/', '_')}.index.db")
+
+
+    def drop_index(self, directory: str):
+        """Remove the file index of a directory, the next incremental run lists everything again."""
+        index_path = self._index_path(directory)
+        if index_path and os.path.exists(index_path):
             try:
-                shutil.move(file_path, target_directory)
-                LOG.info(f"Moved {filename} to {target_directory}")
+                os.remove(index_path)
             except Exception as e:
-                LOG.error(f"Error moving {filename} to {target_directory}: {e}")
+                LOG.error(f"Error removing file index {index_path}: {e}")
+
+
+    def organize_incremental(
+        self,
+        config: Config,
+        journal: Optional[MoveJournal] = None,
+        move_log: Optional[MoveLogWriter] = None,
+        report: Optional[RunReport] = None
+    ) -> Optional[list[str]]:
+        """
+        Move only the misplaced and new files of a config's directory. With a state
+        directory, the persistent file index limits the listing to the directories
+        that changed since the last run.
+
+        :param config: The config to organize.
+        :param journal: Journal to record the moves in.
+        :param move_log: Log to record the done moves in, for an undo.
+        :param report: Report to count the files of the run in.
+        :return: The paths of the listed files where the run left them, None without the index (every file was listed).
+        """
+        index_path = self._index_path(config.directory)
+        if not index_path:
+            self.execute_plan(self.plan_config(config), journal=journal, move_log=move_log, report=report)
+            return None
+
+        os.makedirs(self.state_directory, exist_ok=True)
+        with FileIndex(index_path, config.directory) as index:
+            planner = MovePlanner(config.directory, config.categories + self.SPECIAL_CATEGORIES)
+
+            root_files = self.scan_files(config.directory, with_stats=True)
+            index.replace_files(config.directory, root_files)
+
+            category_files = self.scan_categories_indexed(config.directory, config.categories, index)
+            plan = self._plan(planner, category_files, compact=True)
+            plan.extend(self._plan(planner, root_files))
+            self._save_classifier()
+            failed = self.execute_plan(plan, journal=journal, move_log=move_log, report=report)
+
+            failed_sources = {action.source for action in failed}
+            index.record_moves(action for action in plan if action.source not in failed_sources)
+
+            # The directories the moved files left may be empty now
+            self.remove_empty_directories(
+                config.directory,
+                {os.path.dirname(action.source) for action in plan if action.source not in failed_sources}
+            )
+
+            # Record the mtime the moves left on the directories, so they aren't listed on the next run.
+            # Directories with a failed move are listed again.
+            failed_directories = {os.path.dirname(source) for source in failed_sources}
+            touched = {os.path.dirname(action.source) for action in plan} | plan.destinations()
+            touched.discard(config.directory)
+            for path in touched:
+                if path in failed_directories:
+                    index.set_directory_mtime(path, 0)
+                    continue
+                try:
+                    index.set_directory_mtime(path, os.stat(path).st_mtime_ns)
+                except OSError:
+                    index.remove_tree(path)
+
+        moved = {
+            action.source: os.path.join(action.destination, os.path.basename(action.source))
+            for action in plan if action.source not in failed_sources
+        }
+        listed = (os.path.join(entry.parent, entry.name) for entry in category_files + root_files)
+        return [moved.get(path, path) for path in listed]
+
+
+    def organize_files(self, config: Config, filenames: Optional[Iterable[str]] = None) -> list[MoveAction]:
+        """
+        Categorize only some files of the main directory, like the ones a watcher
+        reported as new. The target directories are created when missing.
+
+        :param config: The config of the directory.
+        :param filenames: Names of the files in the main directory, all of them if None.
+        :return: The actions that failed.
+        """
+        planner = MovePlanner(config.directory, config.categories + self.SPECIAL_CATEGORIES)
+        if filenames is None:
+            entries = self.scan_files(config.directory, with_stats=planner.needs_stats)
+        else:
+            entries = []
+            for filename in filenames:
+                try:
+                    file_stat = os.stat(os.path.join(config.directory, filename))
+                except OSError:
+                    # Already gone (e.g. a temporary file)
+                    continue
+                if stat.S_ISREG(file_stat.st_mode):
+                    entries.append(FileEntry(
+                        config.directory, filename, file_stat.st_size, file_stat.st_dev,
+                        file_stat.st_mtime_ns, file_stat.st_ino
+                    ))
+
+        plan = self._plan(planner, entries)
+        self._save_classifier()
+        return self.execute_plan(plan)
+
+
+    def execute_plan(
+        self,
+        plan: 'MovePlan | CompactMovePlan',
+        journal: Optional[MoveJournal] = None,
+        phase: str = PHASE_ORGANIZE,
+        move_log: Optional[MoveLogWriter] = None,
+        report: Optional[RunReport] = None
+    ) -> list[MoveAction]:
+        """
+        Apply a move plan. Failed moves are logged and skipped.
+
+        Only the destinations of the plan are created, each one once. The filesystem
+        of each destination is checked once per plan, moves that stay on the device
+        of the main directory are a single atomic rename.
+
+        :param plan: The plan to apply.
+        :param journal: Journal to record the plan and its progress in, once per batch.
+        :param phase: Name of the plan in the journal and in the logs.
+        :param move_log: Log to record the done moves in, for an undo.
+        :param report: Report to count the scanned, moved and skipped files in.
+        :return: The actions that failed.
+        """
+        if journal:
+            journal.begin_phase(phase, plan)
+        return self._execute(plan.directory, [plan], journal, phase, move_log, report, stream=False)
+
+
+    def execute_stream(
+        self,
+        directory: str,
+        plans: Iterable[MovePlan],
+        journal: Optional[MoveJournal] = None,
+        phase: str = PHASE_ORGANIZE,
+        move_log: Optional[MoveLogWriter] = None,
+        report: Optional[RunReport] = None
+    ) -> list[MoveAction]:
+        """
+        Apply a stream of move plans, like the batches of a `pipeline`, as one phase.
+        The moves of each plan are journaled right before they run, and the
+        destinations are created the first time a plan needs them.
+
+        :param directory: The main directory of the plans.
+        :param plans: The plans to apply, in order.
+        :return: The actions that failed.
+        """
+        if journal:
+            journal.begin_stream(phase)
+        return self._execute(directory, plans, journal, phase, move_log, report, stream=True)
+
+
+    def _execute(
+        self,
+        directory: str,
+        plans: Iterable[MovePlan],
+        journal: Optional[MoveJournal],
+        phase: str,
+        move_log: Optional[MoveLogWriter],
+        report: Optional[RunReport],
+        stream: bool
+    ) -> list[MoveAction]:
+        """Apply plans of a phase, see `execute_plan` and `execute_stream`."""
+        failed = []
+        start_time = time.perf_counter()
+        created = set()
+        same_device = set()
+        scanned = moves = moved_bytes = idx = 0
+
+        # Checked once per plan, the moves are only logged one by one in verbose mode
+        verbose = LOG.isEnabledFor(logging.DEBUG)
+        for plan in plans:
+            scanned += plan.scanned
+            if not len(plan):
+                continue
+            new_destinations = plan.destinations() - created
+            if new_destinations:
+                self.create_directories(new_destinations)
+                same_device |= self._same_device_directories(directory, new_destinations)
+                created |= new_destinations
+            if journal and stream:
+                journal.record_actions(plan)
+
+            for action in plan:
+                idx += 1
+                try:
+                    self._move_file(action.source, action.destination, action.destination in same_device)
+                    if verbose:
+                        LOG.debug(f"Moved {os.path.basename(action.source)} to {action.destination}")
+                    if move_log:
+                        move_log.record(action)
+                    moves += 1
+                    moved_bytes += action.size
+                except Exception as e:
+                    LOG.error(f"Error moving {os.path.basename(action.source)} to {action.destination}: {e}")
+                    failed.append(action)
+
+                if journal and idx % journal.batch_size == 0:
+                    journal.mark_done(idx)
+
+        if journal:
+            journal.end_phase()
+
+        duration = time.perf_counter() - start_time
+        if report:
+            report.files_scanned += scanned
+            report.files_skipped += max(scanned - moves - len(failed), 0)
+            report.files_moved += moves
+            report.errors += len(failed)
+            report.bytes_moved += moved_bytes
+        if moves or failed:
+            LOG.info(f"{phase.capitalize()}: moved {moves} files of {directory} in {duration:.2f}s, {len(failed)} failed")
+        self.throughput.record(moves, duration)
+        return failed
+
+
+    @staticmethod
+    def _same_device_directories(directory: str, directories: set[str]) -> set[str]:
+        """
+        Find which of the given directories are on the same filesystem as the main directory.
+
+        :param directory: The main directory path.
+        :param directories: The directories to check.
+        """
+        device = _directory_device(directory)
+        if device == -1:
+            return set()
+        return {path for path in directories if _directory_device(path) == device}
+
+
+    @staticmethod
+    def _move_file(source: str, destination: str, same_device: bool):
+        """
+        Move a file into a directory. On the same filesystem it's a single `os.rename`,
+        otherwise (or if the rename reports a cross-device link) it falls back to `shutil.move`.
+        Like `shutil.move`, an existing file at the destination is never overwritten.
+
+        :param source: Path of the file to move.
+        :param destination: Directory to move the file into.
+        :param same_device: Whether the source and the destination are on the same filesystem.
+        """
+        if not same_device:
+            shutil.move(source, destination)
+            return
+
+        target = os.path.join(destination, os.path.basename(source))
+        if os.path.lexists(target):
+            raise shutil.Error(f"Destination path '{target}' already exists")
+        try:
+            os.rename(source, target)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            shutil.move(source, destination)
+
+
+    @staticmethod
+    def create_directories(paths: Iterable[str]) -> list[str]:
+        """
+        Create directories with a single `mkdir` each, parents first. A missing
+        parent (like a new category of an extension subdirectory) is created on demand.
+
+        :param paths: The directories to create.
+        :return: The directories that were created.
+        """
+        created = []
+        for path in sorted(paths):
+            try:
+                os.mkdir(path)
+            except FileExistsError:
+                continue
+            except FileNotFoundError:
+                try:
+                    os.makedirs(path, exist_ok=True)
+                except OSError as e:
+                    LOG.error(f"Error creating directory {path}: {e}")
+                    continue
+            except OSError as e:
+                LOG.error(f"Error creating directory {path}: {e}")
+                continue
+            created.append(path)
+        return created
+
+
+    @staticmethod
+    def remove_empty_directories(directory: str, paths: Iterable[str]) -> list[str]:
+        """
+        Remove the given directories and their parents inside the main directory when
+        they are empty, innermost first. Nothing is listed: a directory that still
+        has content just fails its `rmdir`.
+
+        :param directory: The main directory path, never removed.
+        :param paths: The directories that may be empty, like the ones a plan moved files out of.
+        :return: The directories that were removed.
+        """
+        prefix = directory.rstrip(os.sep) + os.sep
+        candidates = set()
+        for path in paths:
+            while path.startswith(prefix) and path not in candidates:
+                candidates.add(path)
+                path = os.path.dirname(path)
+
+        removed = []
+        for path in sorted(candidates, key=lambda path: path.count(os.sep), reverse=True):
+            try:
+                os.rmdir(path)
+                removed.append(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                if e.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                    LOG.error(f"Error removing directory {path}: {e}")
+        return removed
+
+
+    def categorize_files(
+        self,
+        directory: str,
+        categories: list[Category],
+        journal: Optional[MoveJournal] = None,
+        move_log: Optional[MoveLogWriter] = None,
+        report: Optional[RunReport] = None
+    ):
+        """
+        Categorize files in the main directory based on their extensions.
+        
+        :param directory: The main directory path.
+        :param categories: List of category objects.
+        :param journal: Journal to record the moves in.
+        :param move_log: Log to record the done moves in, for an undo.
+        :param report: Report to count the files of the run in.
+        """
+        # Scan, classify and move run at the same time, a batch of files at a time (see `pipeline`)
+        planner = MovePlanner(directory, categories + self.SPECIAL_CATEGORIES)
+        entries = threaded(batched(self.iter_files(directory, with_stats=planner.needs_stats)))
+        plans = threaded(self._plan(planner, batch) for batch in entries)
+        try:
+            self.execute_stream(directory, plans, journal=journal, phase=PHASE_CATEGORIZE, move_log=move_log, report=report)
+        finally:
+            self._save_classifier()
 
 
     def cleanup_directory(self, directory: str, categories: list[Category]):
@@ -203,21 +838,34 @@ class FileOrganizer:
 
             # Get category path
             category_directory = os.path.join(directory, category.name)
+
+            # List the category once, the listing tells if it's empty after the subdirectories are removed.
+            try:
+                with os.scandir(category_directory) as it:
+                    children = list(it)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                LOG.error(f"Error reading directory {category_directory}: {e}")
+                continue
+
+            remaining = len(children)
             
             # If we're categorizing by extension, we need to check each subdirectory.
             if category.categorize_extensions:
-                for ext in category.extensions:
-                    ext_directory = os.path.join(category_directory, ext.lstrip('.'))
-                    # If the subdirectory exists and is empty, remove it.
-                    if os.path.exists(ext_directory) and not os.listdir(ext_directory):
+                ext_names = {ext.lstrip('.') for ext in category.extensions}
+                for child in children:
+                    # If the subdirectory is empty, remove it.
+                    if child.name in ext_names and child.is_dir(follow_symlinks=False) and _is_empty_directory(child.path):
                         try:
-                            os.rmdir(ext_directory)
-                            LOG.info(f"Removed empty directory {ext_directory}")
+                            os.rmdir(child.path)
+                            LOG.info(f"Removed empty directory {child.path}")
+                            remaining -= 1
                         except Exception as e:
-                            LOG.error(f"Error removing directory {ext_directory}: {e}")
+                            LOG.error(f"Error removing directory {child.path}: {e}")
 
             # Now, after possibly removing subdirectories, if the category directory is empty, remove it.
-            if os.path.exists(category_directory) and not os.listdir(category_directory):
+            if not remaining:
                 try:
                     os.rmdir(category_directory)
                     LOG.info(f"Removed empty category directory {category_directory}")
@@ -225,23 +873,459 @@ class FileOrganizer:
                     LOG.error(f"Error removing directory {category_directory}: {e}")
 
 
-    def process_config(self, config: Config):
-        
+    def dedupe(self, config: Config, report: Optional[RunReport] = None, paths: Optional[list[str]] = None) -> list[DuplicateGroup]:
+        """
+        Find the files of the categories with the same content. In hardlink mode
+        the copies are replaced with links to the first file of their group.
+
+        Without `paths` every category is scanned. With the paths an incremental run
+        listed, only those files and the indexed files of the same sizes are checked:
+        the duplicates among the unchanged files were found by the earlier runs. A file
+        edited in place leaves the mtime of its directory alone, so only a full run
+        (a changed layout, or a run that isn't incremental) checks it again.
+
+        :param config: The config of the directory.
+        :param report: Report to count the duplicates in.
+        :param paths: The files that are new or changed since the last run, see `organize_incremental`.
+        :return: The groups of duplicates.
+        """
+        if paths is None:
+            entries = self.scan_categories(config.directory, config.categories, with_stats=True)
+        else:
+            entries = self._dedupe_candidates(config.directory, paths)
+        groups = self.deduplicator.find(entries)
+        for group in groups:
+            LOG.info(f"Duplicates of {group.paths[0]}: {', '.join(group.paths[1:])}")
+
+        copies = sum(len(group.paths) - 1 for group in groups)
+        wasted = sum(group.wasted_bytes() for group in groups)
+        if groups and self.deduplicator.mode == MODE_HARDLINK:
+            freed = sum(self.deduplicator.link(group) for group in groups)
+            LOG.info(f"Dedupe: linked {copies} duplicates in {config.directory}, freed {freed} bytes")
+        elif groups:
+            LOG.info(f"Dedupe: found {copies} duplicates in {config.directory}, {wasted} bytes")
+
+        if report:
+            report.duplicates += copies
+            report.duplicate_bytes += wasted
+        return groups
+
+
+    def _dedupe_candidates(self, directory: str, paths: list[str]) -> list[FileEntry]:
+        """The changed files of the categories, and the indexed files with the same size as one of them."""
+        entries = {}
+
+        def add(path: str):
+            parent, name = os.path.split(path)
+            if path in entries or parent == directory:
+                return
+            try:
+                file_stat = os.lstat(path)
+            except OSError:
+                # Gone since it was listed
+                return
+            if stat.S_ISREG(file_stat.st_mode):
+                entries[path] = FileEntry(parent, name, file_stat.st_size, file_stat.st_dev, file_stat.st_mtime_ns, file_stat.st_ino)
+
+        for path in paths:
+            add(path)
+        sizes = {entry.size for entry in entries.values() if entry.size}
+        if sizes:
+            with FileIndex(self._index_path(directory), directory) as index:
+                for path in index.paths_with_sizes(sizes):
+                    add(path)
+        return list(entries.values())
+
+
+    def _journal_path(self, directory: str) -> Optional[str]:
+        """Get the path of the move journal of a directory."""
+        if not self.state_directory:
+            return None
+        return os.path.join(self.state_directory, f"{directory.replace('/', '_')}.journal")
+
+
+    def _open_journal(self, config: Config) -> Optional[MoveJournal]:
+        """Start the move journal of a run, if there's a state directory."""
+        journal_path = self._journal_path(config.directory)
+        if not journal_path:
+            return None
+        os.makedirs(self.state_directory, exist_ok=True)
+        return MoveJournal(journal_path, config.directory, self.layout_signature(config.categories))
+
+
+    def has_interrupted_run(self, directory: str) -> bool:
+        """Check if a run of a directory was interrupted and left its journal."""
+        journal_path = self._journal_path(directory)
+        return bool(journal_path) and os.path.exists(journal_path)
+
+
+    def recover(self, config: Config, rollback: bool = False) -> bool:
+        """
+        Resume (or roll back) the run of a directory that was interrupted.
+
+        Resuming does only the moves the run didn't do. Rolling back moves the
+        files the run moved back to where they were, latest moves first.
+
+        :param config: The config of the directory.
+        :param rollback: Roll the run back instead of resuming it.
+        :return: True if there was an interrupted run.
+        """
+        if not self.has_interrupted_run(config.directory):
+            return False
+
+        journal_path = self._journal_path(config.directory)
+        state = MoveJournal.load(journal_path)
+        if state is None or state.directory != config.directory:
+            LOG.warning(f"Ignoring invalid journal {journal_path}")
+            os.remove(journal_path)
+            return False
+
+        if rollback:
+            LOG.info(f"Rolling back the interrupted run of {config.directory}")
+            # One phase at a time, latest first: a file a later phase moved is only back
+            # where an earlier phase left it after that phase is rolled back. The `done`
+            # counter isn't enough, the moves of the last batch may be done or not.
+            for phase in reversed(state.phases):
+                actions = [
+                    MoveAction(os.path.join(action.destination, os.path.basename(action.source)), os.path.dirname(action.source), REASON_ROLLBACK)
+                    for action in phase.actions
+                    if action_done(action)
+                ]
+                actions.reverse()
+                plan = MovePlan(directory=config.directory, actions=actions)
+                self.execute_plan(plan, phase=PHASE_ROLLBACK)
+                # The phase may have created destinations it never moved a file to
+                self.remove_empty_directories(config.directory, {action.destination for action in phase.actions})
+        else:
+            LOG.info(f"Resuming the interrupted run of {config.directory}")
+            plan = MovePlan(directory=config.directory)
+            for phase in state.phases:
+                # Moves before `done` were attempted, the ones after are checked on the filesystem
+                plan.actions.extend(
+                    action for action in phase.actions[phase.done:]
+                    if os.path.lexists(action.source) and not action_done(action)
+                )
+            self.execute_plan(plan, phase=PHASE_RESUME)
+
+            # A streamed phase never planned the files it didn't scan, they are moved now
+            last_phase = state.phases[-1] if state.phases else None
+            if last_phase and last_phase.name == PHASE_RESET:
+                if not last_phase.ended:
+                    self.reset_directory(config.directory, config.categories)
+                self.categorize_files(config.directory, config.categories)
+            elif last_phase and last_phase.name == PHASE_CATEGORIZE and last_phase.streamed and not last_phase.ended:
+                self.categorize_files(config.directory, config.categories)
+
+        # A resumed run that reached its last phase is complete
+        if not rollback and state.phases and state.phases[-1].name in (PHASE_RESET, PHASE_CATEGORIZE, PHASE_ORGANIZE) and state.layout:
+            self._write_layout_signature(config.directory, state.layout)
+
+        os.remove(journal_path)
+        return True
+
+
+    def _move_log(self, directory: str) -> Optional[MoveLog]:
+        """Get the move logs of the runs of a directory."""
+        if not self.state_directory:
+            return None
+        return MoveLog(os.path.join(self.state_directory, f"{directory.replace('/', '_')}.moves"))
+
+
+    def _start_move_log(self, directory: str) -> Optional[MoveLogWriter]:
+        """Start the move log of a run, if there's a state directory."""
+        move_log = self._move_log(directory)
+        return move_log.start_run() if move_log else None
+
+
+    def undo(self, config: Config, runs: int = 1) -> int:
+        """
+        Move the files of the last runs of a directory back to where they were,
+        latest move first. The reverse moves are applied in batches, through the
+        same rename path as a run. When some moves of a run can't be undone, its
+        log keeps only those moves and the older runs are left alone, so the undo
+        can be retried.
+
+        :param config: The config of the directory.
+        :param runs: Number of runs to undo.
+        :return: Number of files moved back.
+        """
+        move_log = self._move_log(config.directory)
+        if not move_log:
+            return 0
+
+        moved = 0
+        for run in move_log.last_runs(runs):
+            LOG.info(f"Undoing {len(run)} moves of {config.directory}")
+            actions = run.reversed_actions()
+            failed = []
+            while batch := list(islice(actions, UNDO_BATCH_SIZE)):
+                plan = MovePlan(directory=config.directory, actions=batch)
+                batch_failed = self.execute_plan(plan, phase=PHASE_UNDO)
+                moved += len(plan) - len(batch_failed)
+                failed.extend(batch_failed)
+
+            # Remove the directories of the run that are now empty
+            self.remove_empty_directories(config.directory, run.directories)
+            if failed:
+                LOG.warning(f"Could not undo {len(failed)} moves of {config.directory}, they are kept for the next undo")
+                run.keep_failed(failed)
+                break
+            os.remove(run.path)
+
+        # The index is of the undone runs
+        self.drop_index(config.directory)
+        return moved
+
+
+    def _category_paths(self, directory: str, categories: list[Category]) -> list[str]:
+        """Get the paths of the category directories, with the special ones."""
+        return [os.path.join(directory, category.name) for category in categories + self.SPECIAL_CATEGORIES]
+
+
+    def _count_moves(self, report: DryRunReport, moves: list[tuple[int, int, str]]):
+        """
+        Add moves to a dry run report.
+
+        :param moves: The size, source device and destination of each move.
+        """
+        devices = {}
+        for size, device, destination in moves:
+            if destination not in devices:
+                # Missing destinations will be created inside the main directory
+                destination_device = _directory_device(destination)
+                devices[destination] = destination_device if destination_device != -1 else _directory_device(report.directory)
+            report.moves += 1
+            report.bytes += size
+            if device != devices[destination]:
+                report.cross_device += 1
+
+
+    def dry_run(self, config: Config, incremental: bool = False) -> DryRunReport:
+        """
+        Count the work `process_config` would do, without any writes.
+        The directory is read in a single metadata pass.
+
+        :param config: The config to estimate.
+        :param incremental: Estimate an incremental run, see `process_config`.
+        """
+        directory, categories = config.directory, config.categories
+        incremental = incremental and not self.layout_changed(directory, categories)
+        report = DryRunReport(directory=directory, incremental=incremental)
+
+        subdirectories = []
+        category_files = self.scan_categories(directory, categories, with_stats=True, directories=subdirectories)
+        root_files = self.scan_files(directory, with_stats=True)
+        planner = MovePlanner(directory, categories + self.SPECIAL_CATEGORIES)
+
+        # The directories that hold files at the end of the run, and their parents
+        final_targets = {planner.target(entry.name, entry.size, entry.mtime_ns)[0] for entry in category_files + root_files}
+        needed = set()
+        for path in final_targets:
+            while path != directory and path not in needed:
+                needed.add(path)
+                path = os.path.dirname(path)
+
+        if incremental:
+            plan = planner.plan(category_files + root_files, compact=True)
+            self._count_moves(report, [(action.size, action.device, action.destination) for action in plan])
+            report.directories_created = sum(1 for path in needed if not os.path.isdir(path))
+
+            # The directories the moved files leave are removed when nothing stays in them
+            vacated = {os.path.dirname(action.source) for action in plan} - {directory}
+            report.directories_removed = len(vacated - needed)
+        else:
+            # The reset moves the files of the categories to the main directory, then they are categorized from there
+            root_device = _directory_device(directory)
+            moves = [(entry.size, entry.device, directory) for entry in category_files]
+            moves += [(entry.size, root_device, planner.target(entry.name, entry.size, entry.mtime_ns)[0]) for entry in category_files]
+            moves += [(entry.size, entry.device, planner.target(entry.name, entry.size, entry.mtime_ns)[0]) for entry in root_files]
+            self._count_moves(report, moves)
+
+            # The reset removes every subdirectory of the categories, the ones that get files are created again.
+            # The cleanup removes the category directories that get no files.
+            reset_directories = set(subdirectories)
+            existing_categories = {path for path in self._category_paths(directory, categories) if os.path.isdir(path)}
+            report.directories_created = sum(1 for path in needed if path in reset_directories or not os.path.isdir(path))
+            report.directories_removed = len(subdirectories) + len(existing_categories - needed)
+
+        report.estimated_duration = self.throughput.estimate(report.moves)
+        return report
+
+
+    def dry_run_reset(self, config: Config) -> DryRunReport:
+        """
+        Count the work of resetting a config's directory (`reset_directory` followed
+        by `cleanup_directory`), without any writes.
+
+        :param config: The config to estimate.
+        """
+        directory, categories = config.directory, config.categories
+        report = DryRunReport(directory=directory)
+
+        subdirectories = []
+        category_files = self.scan_categories(directory, categories, with_stats=True, directories=subdirectories)
+        self._count_moves(report, [(entry.size, entry.device, directory) for entry in category_files])
+
+        # Every subdirectory is emptied and removed, then the cleanup removes the empty categories
+        category_paths = self._category_paths(directory, categories)
+        report.directories_removed = len(subdirectories) + sum(1 for path in category_paths if os.path.isdir(path))
+        report.estimated_duration = self.throughput.estimate(report.moves)
+        return report
+
+
+    def process_config(self, config: Config, incremental: bool = False) -> RunReport:
+        """
+        Run all the organize steps for a config.
+
+        :param config: The config to process.
+        :param incremental: Skip the reset step and move only the misplaced
+            and new files, when the category layout didn't change since the last run.
+        :return: The report of the run with its duration, file counts and the time of each phase.
+        """
         if not config.active:
             LOG.info(f"Config for directory {config.directory} is inactive, skipping...")
-            return
+            return RunReport(directory=config.directory, status=STATUS_INACTIVE)
+
+        start_time = time.perf_counter()
+        report = RunReport(directory=config.directory, status=STATUS_DONE, started_at=time.time())
+        recorder = RunRecorder(report, self.hooks)
+        journal = None
+        move_log = None
         try:
-            self.validate_directory(config.directory)
+            with recorder.phase("validate"):
+                self.validate_directory(config.directory)
         except Exception as e:
             LOG.warning(f"Skipping this directory {config.directory}")
-            return
-        
-        self.reset_directory(config.directory, config.categories)
-        self.create_categories(config.directory, config.categories)
-        self.categorize_files(config.directory, config.categories)
-        self.cleanup_directory(config.directory, config.categories)
+            report.status, report.error = STATUS_SKIPPED, str(e)
+            recorder.finish()
+            return report
+
+        try:
+            # Finish the moves of a run that was interrupted
+            with recorder.phase("recover"):
+                self.recover(config)
+            journal = self._open_journal(config)
+            move_log = self._start_move_log(config.directory)
+
+            report.incremental = incremental and not self.layout_changed(config.directory, config.categories)
+            listed = None
+            # The directories are created and removed from the plans: only the
+            # destinations are created, and only the directories files left are removed
+            if report.incremental:
+                LOG.info(f"Layout of {config.directory} is unchanged, organizing incrementally...")
+                with recorder.phase("organize"):
+                    listed = self.organize_incremental(config, journal=journal, move_log=move_log, report=report)
+            else:
+                with recorder.phase("reset"):
+                    self.reset_directory(config.directory, config.categories, journal=journal, move_log=move_log, report=report)
+                with recorder.phase("categorize"):
+                    self.categorize_files(config.directory, config.categories, journal=journal, move_log=move_log, report=report)
+                self.drop_index(config.directory)
+
+                # The reset kept the category directories, the ones that got no files are removed
+                with recorder.phase("cleanup"):
+                    self.remove_empty_directories(config.directory, self._category_paths(config.directory, config.categories))
+
+            if self.deduplicator:
+                with recorder.phase("dedupe"):
+                    self.dedupe(config, report=report, paths=listed)
+            self.save_layout_signature(config.directory, config.categories)
+            if journal:
+                journal.close()
+        except Exception as e:
+            LOG.error(f"Error organizing directory {config.directory}: {e}")
+            if journal:
+                # Keep the journal so the run can be resumed or rolled back
+                journal.close(remove=False)
+            report.status, report.error = STATUS_ERROR, str(e)
+        finally:
+            # The moves that were done can be undone, even if the run failed
+            if move_log:
+                move_log.close()
+            self.throughput.save()
+
+        report.duration = time.perf_counter() - start_time
+        recorder.finish()
+        return report
 
     
-    def process_configs(self, configs: list[Config]):
-        for config in configs:
-            self.process_config(config)
\ No newline at end of file
+    def process_configs(self, configs: list[Config], incremental: bool = False) -> list[RunReport]:
+        """
+        Process many configs at the same time in a bounded worker pool.
+
+        Configs run concurrently only when they are independent: no more than
+        `per_device_limit` configs run on the same device, and a config never runs
+        together with another one whose directory overlaps or is nested in it.
+
+        :param configs: The configs to process.
+        :param incremental: Passed to `process_config`.
+        :return: The results of the configs, in the same order as the configs.
+        """
+        if self.max_workers <= 1 or len(configs) <= 1:
+            return [self.process_config(config, incremental=incremental) for config in configs]
+
+        results: list[Optional[RunReport]] = [None] * len(configs)
+        pending = [(idx, config, _directory_device(config.directory)) for idx, config in enumerate(configs)]
+        running = {}
+
+        pool_class = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+        with pool_class(max_workers=self.max_workers) as pool:
+            while pending or running:
+
+                # Submit every pending config that doesn't conflict with the running ones
+                for item in list(pending):
+                    if len(running) >= self.max_workers:
+                        break
+                    idx, config, device = item
+                    running_on_device = sum(1 for _, _, other_device in running.values() if other_device == device)
+                    if running_on_device >= self.per_device_limit:
+                        continue
+                    if any(_directories_overlap(config.directory, other.directory) for _, other, _ in running.values()):
+                        continue
+
+                    pending.remove(item)
+                    running[pool.submit(self.process_config, config, incremental)] = item
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    idx, config, _ = running.pop(future)
+                    try:
+                        results[idx] = future.result()
+                    except Exception as e:
+                        LOG.error(f"Error organizing directory {config.directory}: {e}")
+                        results[idx] = RunReport(directory=config.directory, status=STATUS_ERROR, error=str(e))
+
+        return results
+
+
+def _directory_device(directory: str) -> int:
+    """Get the device id of a directory, or -1 if it can't be read."""
+    try:
+        return os.stat(directory).st_dev
+    except OSError:
+        return -1
+
+
+def _subdirectories(path: str) -> list[str]:
+    """Get the paths of the subdirectories (not symlinks) of a directory."""
+    try:
+        with os.scandir(path) as it:
+            return [entry.path for entry in it if entry.is_dir(follow_symlinks=False)]
+    except OSError:
+        return []
+
+
+def _is_empty_directory(path: str) -> bool:
+    """Check if a directory is empty, reading at most one entry of it."""
+    try:
+        with os.scandir(path) as it:
+            return next(it, None) is None
+    except OSError:
+        return False
+
+
+def _directories_overlap(first: str, second: str) -> bool:
+    """Check if two directories are the same or one is nested inside the other."""
+    first = os.path.realpath(first)
+    second = os.path.realpath(second)
+    return first == second or first.startswith(second.rstrip(os.sep) + os.sep) or second.startswith(first.rstrip(os.sep) + os.sep)
@@ -6,6 +6,7 @@ from tkinter import ttk, StringVar
 
 from src.organizer.file_organizer import FileOrganizer
 from src.model import Config
+from src.search_index import SearchIndex
 
 class App(tk.Tk):
     def __init__(self, *args, **kwargs) -> None:
@@ -48,7 +49,9 @@ class App(tk.Tk):
         # Create ConfigTreeView
         self.tree = ConfigTreeView(self.main_frame)
         self.tree.grid(row=0, column=0, sticky="nsew")
-        self.tree.load_data(self.load_config())
+        self.configs = self.load_config()
+        self.search_index = SearchIndex(config.dir for config in self.configs)
+        self.tree.load_data(self.configs)
 
         # Create bottom frame for 'Run Configurations' Button
         self.bottom_frame = ttk.Frame(self.root_frame)
@@ -70,7 +73,9 @@ class App(tk.Tk):
     
 
     def on_search(self, event):
-        searched_configs = [config for config in self.load_config() if self.search_var.get() in config.dir]
+        # The configs are read once, each keystroke is a lookup in the search index
+        matched = set(self.search_index.search(self.search_var.get()))
+        searched_configs = [config for config in self.configs if config.dir in matched]
         self.tree.clear_data()
         self.tree.load_data(searched_configs)
     
@@ -0,0 +1,96 @@
+"""
+Module with a bounded cache of values computed from the content of files.
+
+Values are keyed by the device and inode of a file, and a value is only returned
+while the size and mtime of the file are the ones it was computed with. A rename
+keeps the inode, so the values survive the moves of a run. The cache can be kept
+in a JSON file, for the next runs.
+"""
+
+import os
+import json
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+from picklable import PicklableLock
+
+
+LOG = logging.getLogger(__name__)
+
+
+class InodeCache(PicklableLock):
+    """
+    Least recently used cache of file values, keyed by (device, inode).
+
+    Attributes:
+        path (str | None): Path of the JSON file, without it the values are only kept in memory.
+        max_entries (int): Number of cached values, the least recently used ones are dropped.
+    """
+
+    def __init__(self, path: Optional[str], max_entries: int) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        # (device, inode) -> (size, mtime_ns, value)
+        self.entries: OrderedDict[tuple[int, int], tuple[int, int, Any]] = OrderedDict()
+        self._changed = False
+        self._load()
+
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+    def _load(self):
+        """Load the stored values, if any."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                for device, inode, size, mtime_ns, value in json.load(f)[-self.max_entries:]:
+                    self.entries[(device, inode)] = (size, mtime_ns, value)
+        except Exception as e:
+            LOG.error(f"Error reading cache {self.path}: {e}")
+
+
+    def save(self):
+        """Store the values, if they changed since they were loaded."""
+        with self.lock:
+            if not self.path or not self._changed:
+                return
+            entries = [[*key, *value] for key, value in self.entries.items()]
+            self._changed = False
+        temp_path = None
+        try:
+            # Unique in the directory of the cache, so processes and threads never share it
+            fd, temp_path = tempfile.mkstemp(prefix=f"{os.path.basename(self.path)}.", suffix=".tmp", dir=os.path.dirname(self.path) or ".")
+            with os.fdopen(fd, "w") as f:
+                json.dump(entries, f)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            LOG.error(f"Error writing cache {self.path}: {e}")
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+    def get(self, key: tuple[int, int], size: int, mtime_ns: int) -> Optional[Any]:
+        """The value of a file, None if it's unknown or the file changed."""
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached is None or cached[0] != size or cached[1] != mtime_ns:
+                return None
+            self.entries.move_to_end(key)
+            return cached[2]
+
+
+    def put(self, key: tuple[int, int], size: int, mtime_ns: int, value: Any):
+        """Store the value of a file."""
+        with self.lock:
+            self.entries[key] = (size, mtime_ns, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self._changed = True
@@ -0,0 +1,167 @@
+"""
+Module to journal the moves of an organize run, so a run that was killed
+can be resumed (or rolled back) instead of started from scratch.
+
+    Journal Format
+    --------------------------------------------------------------------
+    One JSON object per line, appended as the run goes:
+        {"t": "run", "directory": ..., "layout": ...}      Start of the run
+        {"t": "phase", "name": ..., "count": ...}          Start of a phase (a move plan)
+        {"t": "phase", "name": ..., "stream": true}        Start of a streamed phase, its moves come in batches
+        {"s": <source>, "d": <destination>}                A planned move of the phase
+        {"t": "done", "n": ...}                            The first `n` moves of the phase were attempted
+        {"t": "end"}                                       End of the phase
+
+    The moves of a phase are written (and fsynced) before the first of them runs,
+    the moves of a streamed phase before the first move of their batch.
+    Progress is fsynced once per batch, not per file, so after a crash at most one
+    batch has an unknown state. Those moves are checked on the filesystem: a move is
+    done when its source is gone and its target exists.
+"""
+
+import os
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Optional
+
+from move_plan import MoveAction, MovePlan
+
+
+LOG = logging.getLogger(__name__)
+
+
+@dataclass
+class JournalPhase:
+    """
+    Represents a phase of a journaled run.
+
+    Attributes:
+        name (str): Name of the phase (e.g., "reset", "categorize").
+        actions (list[MoveAction]): The planned moves of the phase.
+        done (int): Number of moves known to be attempted.
+        ended (bool): Whether the phase completed.
+        streamed (bool): Whether the moves were planned while the phase ran, so an
+            interrupted phase may have files that were never planned.
+    """
+
+    name: str
+    actions: list[MoveAction] = field(default_factory=list)
+    done: int = 0
+    ended: bool = False
+    streamed: bool = False
+
+
+@dataclass
+class JournalState:
+    """
+    Represents the content of a journal read back after a crash.
+
+    Attributes:
+        directory (str): The main directory of the run.
+        layout (str | None): Layout signature of the run's categories.
+        phases (list[JournalPhase]): The phases the run started.
+    """
+
+    directory: str
+    layout: Optional[str] = None
+    phases: list[JournalPhase] = field(default_factory=list)
+
+
+def action_done(action: MoveAction) -> bool:
+    """Check on the filesystem whether a move already happened."""
+    target = os.path.join(action.destination, os.path.basename(action.source))
+    return not os.path.lexists(action.source) and os.path.lexists(target)
+
+
+class MoveJournal:
+    """
+    Append only write-ahead journal of the moves of a run.
+
+    Attributes:
+        path (str): Path of the journal file.
+        batch_size (int): Number of moves between two fsyncs of the progress.
+    """
+
+    def __init__(self, path: str, directory: str, layout: Optional[str] = None, batch_size: int = 1000) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.file = open(path, "w", encoding="utf-8")
+        self._write([{"t": "run", "directory": directory, "layout": layout}])
+
+
+    def _write(self, records: list[dict]):
+        """Append records to the journal and make them durable."""
+        self.file.write("".join(json.dumps(record) + "\n" for record in records))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+
+    def begin_phase(self, name: str, plan: MovePlan):
+        """Record the moves of a phase before any of them runs."""
+        records = [{"t": "phase", "name": name, "count": len(plan)}]
+        records.extend({"s": action.source, "d": action.destination} for action in plan)
+        self._write(records)
+
+
+    def begin_stream(self, name: str):
+        """Record the start of a phase whose moves are recorded in batches, see `record_actions`."""
+        self._write([{"t": "phase", "name": name, "stream": True}])
+
+
+    def record_actions(self, plan: MovePlan):
+        """Record the next moves of a streamed phase before any of them runs."""
+        self._write([{"s": action.source, "d": action.destination} for action in plan])
+
+
+    def mark_done(self, count: int):
+        """Record that the first `count` moves of the current phase were attempted."""
+        self._write([{"t": "done", "n": count}])
+
+
+    def end_phase(self):
+        """Record the end of the current phase."""
+        self._write([{"t": "end"}])
+
+
+    def close(self, remove: bool = True):
+        """Close the journal, removing it when the run completed."""
+        self.file.close()
+        if remove:
+            os.remove(self.path)
+
+
+    @staticmethod
+    def load(path: str) -> Optional[JournalState]:
+        """
+        Read a journal left by an interrupted run. A truncated last line
+        (the process died while writing it) is ignored.
+        """
+        state = None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        LOG.warning(f"Ignoring truncated journal record in {path}")
+                        break
+
+                    kind = record.get("t")
+                    if kind == "run":
+                        state = JournalState(directory=record["directory"], layout=record.get("layout"))
+                    elif state is None:
+                        continue
+                    elif kind == "phase":
+                        state.phases.append(JournalPhase(name=record["name"], streamed=record.get("stream", False)))
+                    elif kind == "done":
+                        state.phases[-1].done = record["n"]
+                    elif kind == "end":
+                        phase = state.phases[-1]
+                        phase.done, phase.ended = len(phase.actions), True
+                    elif state.phases:
+                        state.phases[-1].actions.append(MoveAction(source=record["s"], destination=record["d"], reason="journal"))
+        except OSError as e:
+            LOG.error(f"Error reading journal {path}: {e}")
+            return None
+        return state
@@ -1,10 +1,14 @@
 #!/usr/bin/env python3
 
+import os
+import sys
 import logging
-from app_context import AppContext
-from config_service import ConfigFileService
-from setup import configs_path, setup_environment
+from app_context import AppContext, BACKEND_FILE
+from setup import configs_path, database_path, setup_environment, state_path
 from file_organizer import FileOrganizer
+from run_report import exporters_from_environment
+from sniffing import classifier_from_environment
+from dedupe import deduplicator_from_environment
 from cli import MainMenu, MenuManager
 
 # Configure logging
@@ -14,18 +18,28 @@ LOG = logging.getLogger(__name__)
 def main():
 
     # Set up the application folders and logging
-    setup_environment()
+    setup_environment(verbose="--verbose" in sys.argv)
     
     # Setup application ctx dependencies
-    service = ConfigFileService(configs_directory=configs_path())
-    organizer = FileOrganizer()
+    # The config backend is "file" (a JSON file per config) unless FILE_ORGANIZER_CONFIG_BACKEND is "sqlite"
+    backend = os.environ.get("FILE_ORGANIZER_CONFIG_BACKEND", BACKEND_FILE)
+    service = AppContext.create_service(backend, configs_directory=configs_path(), database_path=database_path())
+    organizer = FileOrganizer(
+        state_directory=state_path(), max_workers=4, hooks=exporters_from_environment(),
+        classifier=classifier_from_environment(state_path()),
+        deduplicator=deduplicator_from_environment(state_path())
+    )
     
     # Initialize application context
     app_context = AppContext(service=service, organizer=organizer)
     
     # Create the menu manager to run the cli
     menu_manager = MenuManager(RootMenu=MainMenu, ctx=app_context)
-    menu_manager.run()
+    try:
+        menu_manager.run()
+    finally:
+        if organizer.classifier:
+            organizer.classifier.close()
 
 
 if __name__ == "__main__":
@@ -1,8 +1,89 @@
+import re
+import fnmatch
 import logging
 from dataclasses import dataclass, field
+from typing import Optional
 
 LOG = logging.getLogger(__name__)
 
+
+# Types of the rules of a category
+RULE_GLOB = "glob"
+RULE_REGEX = "regex"
+RULE_SUFFIX = "suffix"
+RULE_TYPES = (RULE_GLOB, RULE_REGEX, RULE_SUFFIX)
+
+
+@dataclass
+class Rule:
+    """
+    Represents a placement rule of a category, beyond its extensions.
+    Names are matched ignoring case, an empty pattern matches every name.
+
+    Attributes:
+        type (str): How the pattern matches the file name: "glob", "regex" (anywhere in the name) or "suffix".
+        pattern (str): The pattern of the file name. Default is empty.
+        min_size (int | None): Minimum size of the file in bytes.
+        max_size (int | None): Maximum size of the file in bytes.
+        min_age (float | None): Minimum days since the file was modified.
+        max_age (float | None): Maximum days since the file was modified.
+    """
+
+    type: str = RULE_GLOB
+    pattern: str = ""
+    min_size: Optional[int] = None
+    max_size: Optional[int] = None
+    min_age: Optional[float] = None
+    max_age: Optional[float] = None
+
+    @staticmethod
+    def from_dict(data: dict[str, any]) -> 'Rule':
+        """Creates a Rule instance from a dictionary."""
+        return Rule(
+            type=data.get('type', RULE_GLOB),
+            pattern=data.get('pattern', ""),
+            min_size=data.get('min_size'),
+            max_size=data.get('max_size'),
+            min_age=data.get('min_age'),
+            max_age=data.get('max_age')
+        )
+
+
+    def to_dict(self) -> dict[str, any]:
+        """Converts the Rule instance to a dictionary, without the unset limits."""
+        data = {'type': self.type, 'pattern': self.pattern}
+        for name in ('min_size', 'max_size', 'min_age', 'max_age'):
+            if getattr(self, name) is not None:
+                data[name] = getattr(self, name)
+        return data
+
+
+    def has_limits(self) -> bool:
+        """Whether the rule needs the size or the modification time of a file."""
+        return any(limit is not None for limit in (self.min_size, self.max_size, self.min_age, self.max_age))
+
+
+    def name_regex(self) -> str:
+        """The regex of a glob or regex rule, anchored at the start of the name."""
+        if self.type == RULE_GLOB:
+            return fnmatch.translate(self.pattern)
+        return f"(?s:.*?)(?:{self.pattern})"
+
+
+    def is_valid(self) -> bool:
+        """Validates the type and the pattern of the Rule."""
+        if self.type not in RULE_TYPES:
+            LOG.warning(f"Rule validation failed: Unknown rule type '{self.type}'.")
+            return False
+        if self.type == RULE_REGEX:
+            # Compiled like the routing does, which rejects e.g. global flags like "(?i)"
+            try:
+                re.compile(self.name_regex(), re.IGNORECASE)
+            except re.error as e:
+                LOG.warning(f"Rule validation failed: Invalid regex '{self.pattern}': {e}")
+                return False
+        return True
+
 @dataclass
 class Category:
     """
@@ -12,11 +93,13 @@ class Category:
         name (str): Name of the category.
         extensions (set[str]): File extensions associated with this category.
         categorize_extensions (bool): Whether to categorize the extensions. Default is False.
+        rules (list[Rule]): Rules of the files of this category, checked before the extensions.
     """
 
     name: str
     extensions: set[str] = field(default_factory=set)
     categorize_extensions: bool = False
+    rules: list[Rule] = field(default_factory=list)
 
     @staticmethod
     def from_dict(data: dict[str, any]) -> 'Category':
@@ -24,7 +107,8 @@ class Category:
         return Category(
             name=data['name'],
             extensions=data['extensions'],
-            categorize_extensions=data['categorize_extensions']
+            categorize_extensions=data['categorize_extensions'],
+            rules=[Rule.from_dict(rule) for rule in data.get('rules', [])]
         )
     
 
@@ -33,7 +117,8 @@ class Category:
         return {
             'name': self.name,
             'extensions': list(self.extensions),
-            'categorize_extensions': self.categorize_extensions
+            'categorize_extensions': self.categorize_extensions,
+            'rules': [rule.to_dict() for rule in self.rules]
         }
         
 
@@ -129,11 +214,15 @@ class Config:
             LOG.warning("Config validation failed: Duplicate category names detected.")
             return False
 
-        # Ensure categories have unique extensions.
-        extensions = [ext for category in self.categories for ext in category.extensions]
+        # Ensure categories have unique extensions, they are matched case-insensitively.
+        extensions = [ext.lower() for category in self.categories for ext in category.extensions]
         if len(extensions) != len(set(extensions)):
             LOG.warning("Config validation failed: Duplicate extensions detected across categories.")
             return False
+
+        # Ensure the rules can be compiled.
+        if not all(rule.is_valid() for category in self.categories for rule in category.rules):
+            return False
         
         return True
     
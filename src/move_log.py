@@ -0,0 +1,235 @@
+"""
+Module to keep a compact log of the moves of each run, so the last runs of a
+directory can be undone.
+
+    Log Format
+    --------------------------------------------------------------------
+    Every run of a directory writes one append-only binary file. After a short
+    header, the file is a sequence of records:
+        b"S" <uint32 length> <bytes>                 A new directory, its id is the next free one
+        b"M" <uint32 source> <uint32 destination>    A move of a file between two directories,
+             <uint16 length> <bytes>                 followed by the name of the file
+
+    A directory is written once per run and then referenced by its id, so a move
+    costs its file name plus 11 bytes. Paths are encoded with `surrogateescape`, so
+    any name the filesystem returns can be written and read back.
+"""
+
+import os
+import time
+import struct
+import logging
+from array import array
+from typing import Iterator
+
+from move_plan import MoveAction
+
+
+LOG = logging.getLogger(__name__)
+
+
+MAGIC = b"FOML\x01"
+
+DIRECTORY_RECORD = struct.Struct("<cI")
+MOVE_RECORD = struct.Struct("<cIIH")
+
+# Buffered bytes before a write to the file
+FLUSH_SIZE = 1 << 16
+
+# Logs of older runs are removed
+MAX_RUNS = 20
+
+
+def _encode(path: str) -> bytes:
+    return path.encode("utf-8", "surrogateescape")
+
+
+def _decode(data: bytes) -> str:
+    return data.decode("utf-8", "surrogateescape")
+
+
+class MoveLogWriter:
+    """
+    Writes the moves of a single run.
+
+    Attributes:
+        path (str): Path of the log file.
+        moves (int): Number of moves written.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.moves = 0
+        self.directory_ids: dict[str, int] = {}
+        self.buffer = bytearray(MAGIC)
+        self.file = open(path, "wb")
+
+
+    def _directory_id(self, directory: str) -> int:
+        """Get the id of a directory, writing it the first time it's seen."""
+        directory_id = self.directory_ids.get(directory)
+        if directory_id is None:
+            directory_id = self.directory_ids[directory] = len(self.directory_ids)
+            data = _encode(directory)
+            self.buffer += DIRECTORY_RECORD.pack(b"S", len(data))
+            self.buffer += data
+        return directory_id
+
+
+    def record(self, action: MoveAction):
+        """Record a move that was done."""
+        source_directory, name = os.path.split(action.source)
+        source_id = self._directory_id(source_directory)
+        destination_id = self._directory_id(action.destination)
+        data = _encode(name)
+        self.buffer += MOVE_RECORD.pack(b"M", source_id, destination_id, len(data))
+        self.buffer += data
+        self.moves += 1
+
+        if len(self.buffer) >= FLUSH_SIZE:
+            self.flush()
+
+
+    def flush(self):
+        """Write the buffered records to the file."""
+        self.file.write(self.buffer)
+        self.buffer.clear()
+
+
+    def close(self):
+        """Write the remaining records and close the log. A log without moves is removed."""
+        self.flush()
+        self.file.close()
+        if not self.moves:
+            os.remove(self.path)
+
+
+class MoveLogRun:
+    """
+    The moves of a run read back from its log. Directories are kept once, the
+    moves are three `array('I')` columns and the names a single bytes buffer.
+
+    Attributes:
+        path (str): Path of the log file.
+        directories (list[str]): The directories of the run, by id.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.directories: list[str] = []
+        self.sources = array("I")
+        self.destinations = array("I")
+        self.name_offsets = array("I", [0])
+        self.names = bytearray()
+        self._load()
+
+
+    def _load(self):
+        """Parse the log file. A truncated last record (a crash while writing) is ignored."""
+        with open(self.path, "rb") as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            raise ValueError(f"Not a move log: {self.path}")
+
+        offset, end = len(MAGIC), len(data)
+        while offset < end:
+            tag = data[offset:offset + 1]
+            if tag == b"S" and offset + DIRECTORY_RECORD.size <= end:
+                _, length = DIRECTORY_RECORD.unpack_from(data, offset)
+                offset += DIRECTORY_RECORD.size
+                if offset + length > end:
+                    break
+                self.directories.append(_decode(data[offset:offset + length]))
+            elif tag == b"M" and offset + MOVE_RECORD.size <= end:
+                _, source_id, destination_id, length = MOVE_RECORD.unpack_from(data, offset)
+                offset += MOVE_RECORD.size
+                if offset + length > end:
+                    break
+                self.sources.append(source_id)
+                self.destinations.append(destination_id)
+                self.names += data[offset:offset + length]
+                self.name_offsets.append(len(self.names))
+            else:
+                LOG.warning(f"Ignoring truncated move log record in {self.path}")
+                break
+            offset += length
+
+
+    def __len__(self) -> int:
+        return len(self.sources)
+
+
+    def reversed_actions(self) -> Iterator[MoveAction]:
+        """The moves that undo the run, latest move first."""
+        directories = self.directories
+        for idx in range(len(self.sources) - 1, -1, -1):
+            name = _decode(self.names[self.name_offsets[idx]:self.name_offsets[idx + 1]])
+            yield MoveAction(
+                source=os.path.join(directories[self.destinations[idx]], name),
+                destination=directories[self.sources[idx]],
+                reason="undo",
+            )
+
+
+    def keep_failed(self, failed: list[MoveAction]):
+        """
+        Rewrite the log with only the moves whose undo failed, so they can be undone
+        again. The file is replaced atomically.
+
+        :param failed: The reverse moves (see `reversed_actions`) that failed.
+        """
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        writer = MoveLogWriter(temp_path)
+        try:
+            # The reverse moves are latest first, the log is in the order of the run
+            for action in reversed(failed):
+                writer.record(MoveAction(
+                    source=os.path.join(action.destination, os.path.basename(action.source)),
+                    destination=os.path.dirname(action.source),
+                    reason=action.reason,
+                ))
+        finally:
+            writer.close()
+        if writer.moves:
+            os.replace(temp_path, self.path)
+
+
+class MoveLog:
+    """
+    The move logs of the runs of a directory, one file per run.
+
+    Attributes:
+        path (str): Directory of the log files.
+        max_runs (int): Number of runs kept.
+    """
+
+    def __init__(self, path: str, max_runs: int = MAX_RUNS) -> None:
+        self.path = path
+        self.max_runs = max_runs
+
+
+    def runs(self) -> list[str]:
+        """Paths of the run logs, oldest first."""
+        if not os.path.isdir(self.path):
+            return []
+        names = sorted(name for name in os.listdir(self.path) if name.endswith(".log"))
+        return [os.path.join(self.path, name) for name in names]
+
+
+    def start_run(self) -> MoveLogWriter:
+        """Start the log of a new run, removing the logs of the oldest runs."""
+        os.makedirs(self.path, exist_ok=True)
+        runs = self.runs()
+        for path in runs[:max(len(runs) - self.max_runs + 1, 0)]:
+            os.remove(path)
+        return MoveLogWriter(os.path.join(self.path, f"{time.time_ns():020d}.log"))
+
+
+    def last_runs(self, count: int) -> Iterator[MoveLogRun]:
+        """Read the logs of the last `count` runs one at a time, latest first."""
+        for path in reversed(self.runs()[-count:] if count > 0 else []):
+            try:
+                yield MoveLogRun(path)
+            except (OSError, ValueError) as e:
+                LOG.error(f"Error reading move log {path}: {e}")
+
@@ -0,0 +1,440 @@
+"""
+Module to plan the file moves of a directory before touching the filesystem.
+
+The planner only decides where each file belongs, it doesn't do any disk I/O.
+The entries it plans for are collected by the `FileOrganizer` and the resulting
+`MovePlan` is applied by `FileOrganizer.execute_plan`.
+"""
+
+import os
+import json
+import time
+import struct
+import logging
+from array import array
+from itertools import accumulate
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator, Optional
+
+from models import Category
+from routing import REASON_UNCATEGORIZED, RoutingTable, compile_routing
+
+
+LOG = logging.getLogger(__name__)
+
+
+# Reason of a move of a file that is inside a category but not in its target
+REASON_MISPLACED = "misplaced"
+# Reasons of the moves of a reset and of a rollback
+REASON_RESET = "reset"
+REASON_ROLLBACK = "rollback"
+
+
+@dataclass(slots=True)
+class FileEntry:
+    """
+    Represents a file found while scanning a directory.
+
+    Attributes:
+        parent (str): The directory that contains the file.
+        name (str): The name of the file.
+        size (int): Size of the file in bytes. Default is 0.
+        device (int): Device id of the filesystem the file lives on. Default is 0.
+        mtime_ns (int): Modification time of the file in nanoseconds. Default is 0.
+        inode (int): Inode number of the file. Default is 0.
+    """
+
+    parent: str
+    name: str
+    size: int = 0
+    device: int = 0
+    mtime_ns: int = 0
+    inode: int = 0
+
+
+@dataclass(slots=True)
+class MoveAction:
+    """
+    Represents a single planned move.
+
+    Attributes:
+        source (str): Path of the file to move.
+        destination (str): Directory the file will be moved into.
+        reason (str): Why the file is moved (e.g., "category", "hidden").
+        size (int): Size of the file in bytes.
+        device (int): Device id of the source file.
+    """
+
+    source: str
+    destination: str
+    reason: str
+    size: int = 0
+    device: int = 0
+
+
+@dataclass
+class MovePlan:
+    """
+    Represents the list of moves needed to organize a directory.
+
+    Attributes:
+        directory (str): The main directory the plan applies to.
+        actions (list[MoveAction]): The planned moves, in execution order.
+        scanned (int): Number of files the plan was built from.
+    """
+
+    directory: str
+    actions: list[MoveAction] = field(default_factory=list)
+    scanned: int = 0
+
+    def __len__(self) -> int:
+        return len(self.actions)
+
+    def __iter__(self) -> Iterator[MoveAction]:
+        return iter(self.actions)
+
+    def total_bytes(self) -> int:
+        """Sum of the sizes of all the files in the plan."""
+        return sum(action.size for action in self.actions)
+
+    def destinations(self) -> set[str]:
+        """Set of the directories that will receive at least one file."""
+        return {action.destination for action in self.actions}
+
+    def add(self, parent: str, name: str, destination: str, reason: str, size: int = 0, device: int = 0):
+        """Append a move of the file `name` of `parent`."""
+        self.actions.append(MoveAction(os.path.join(parent, name), destination, reason, size, device))
+
+    def extend(self, other: 'MovePlan'):
+        """Append the actions of another plan of the same directory."""
+        self.actions.extend(other)
+        self.scanned += other.scanned
+
+
+def _encode(path: str) -> bytes:
+    return path.encode("utf-8", "surrogateescape")
+
+
+def _decode(data: bytes) -> str:
+    return data.decode("utf-8", "surrogateescape")
+
+
+class CompactMovePlan:
+    """
+    A move plan stored in columns instead of one `MoveAction` per move, for the
+    plans of whole directories. Directories and reasons are kept once and referenced
+    by id, the file names are a single bytes buffer. A move costs its name plus
+    13 bytes (21 once a move has a size), instead of a few hundred bytes of objects.
+    Iterating the plan creates the `MoveAction`s on the fly.
+
+    Attributes:
+        directory (str): The main directory the plan applies to.
+        scanned (int): Number of files the plan was built from.
+        directories (list[str]): The directories of the plan, by id.
+        devices (array): Device of the files of each source directory, by directory id.
+        reasons (list[str]): The reasons of the plan, by id.
+        source_ids, destination_ids (array): Source and destination directory id of each move.
+        flags (array): Reason id of each move.
+        name_offsets (array): Start of the name of each move in `names`, plus the end of the last one.
+        names (bytearray): The file names, encoded with `surrogateescape`.
+        sizes (array | None): Size of each move, None while every size is 0.
+    """
+
+    MAGIC = b"FOMP\x01"
+    HEADER = struct.Struct("<QIQQ")
+
+    def __init__(self, directory: str, scanned: int = 0) -> None:
+        self.directory = directory
+        self.scanned = scanned
+        self.directories: list[str] = []
+        self.devices = array("q")
+        self.reasons: list[str] = []
+        self.source_ids = array("I")
+        self.destination_ids = array("I")
+        self.flags = array("B")
+        self.name_offsets = array("I", [0])
+        self.names = bytearray()
+        self.sizes: Optional[array] = None
+        self._directory_ids: dict[str, int] = {}
+        self._reason_ids: dict[str, int] = {}
+
+
+    def _directory_id(self, directory: str) -> int:
+        directory_id = self._directory_ids.get(directory)
+        if directory_id is None:
+            directory_id = self._directory_ids[directory] = len(self.directories)
+            self.directories.append(directory)
+            self.devices.append(0)
+        return directory_id
+
+
+    def _reason_id(self, reason: str) -> int:
+        reason_id = self._reason_ids.get(reason)
+        if reason_id is None:
+            reason_id = self._reason_ids[reason] = len(self.reasons)
+            self.reasons.append(reason)
+        return reason_id
+
+
+    def add(self, parent: str, name: str, destination: str, reason: str, size: int = 0, device: int = 0):
+        """Append a move of the file `name` of `parent`."""
+        source_id = self._directory_id(parent)
+        self.devices[source_id] = device
+        self.source_ids.append(source_id)
+        self.destination_ids.append(self._directory_id(destination))
+        self.flags.append(self._reason_id(reason))
+        self.names += _encode(name)
+        self.name_offsets.append(len(self.names))
+        if size and self.sizes is None:
+            self.sizes = array("Q", bytes(8 * (len(self.source_ids) - 1)))
+        if self.sizes is not None:
+            self.sizes.append(size)
+
+
+    def append(self, action: MoveAction):
+        """Append a move."""
+        parent, name = os.path.split(action.source)
+        self.add(parent, name, action.destination, action.reason, action.size, action.device)
+
+
+    def __len__(self) -> int:
+        return len(self.source_ids)
+
+
+    def name(self, idx: int) -> str:
+        """The file name of a move."""
+        return _decode(self.names[self.name_offsets[idx]:self.name_offsets[idx + 1]])
+
+
+    def action(self, idx: int) -> MoveAction:
+        """The move at an index."""
+        source_id = self.source_ids[idx]
+        return MoveAction(
+            source=os.path.join(self.directories[source_id], self.name(idx)),
+            destination=self.directories[self.destination_ids[idx]],
+            reason=self.reasons[self.flags[idx]],
+            size=self.sizes[idx] if self.sizes is not None else 0,
+            device=self.devices[source_id]
+        )
+
+
+    def __iter__(self) -> Iterator[MoveAction]:
+        return (self.action(idx) for idx in range(len(self.source_ids)))
+
+
+    def total_bytes(self) -> int:
+        """Sum of the sizes of all the files in the plan."""
+        return sum(self.sizes) if self.sizes is not None else 0
+
+
+    def destinations(self) -> set[str]:
+        """Set of the directories that will receive at least one file."""
+        return {self.directories[directory_id] for directory_id in set(self.destination_ids)}
+
+
+    def extend(self, other: 'MovePlan | CompactMovePlan'):
+        """Append the moves of another plan of the same directory."""
+        for action in other:
+            self.append(action)
+        self.scanned += other.scanned
+
+
+    def nbytes(self) -> int:
+        """Approximate memory of the moves, without the interned directories."""
+        columns = (self.source_ids, self.destination_ids, self.flags, self.name_offsets, self.sizes or array("Q"))
+        return sum(column.itemsize * len(column) for column in columns) + len(self.names)
+
+
+    def select(self, indices: Iterable[int]) -> 'CompactMovePlan':
+        """A plan with only the moves at the given indices, in that order. The columns are copied as they are."""
+        indices = list(indices)
+        selected = CompactMovePlan(self.directory, self.scanned)
+        selected.directories = list(self.directories)
+        selected.devices = array("q", self.devices)
+        selected.reasons = list(self.reasons)
+        selected._directory_ids = dict(self._directory_ids)
+        selected._reason_ids = dict(self._reason_ids)
+
+        source_ids, destination_ids, flags, offsets, names = (
+            self.source_ids, self.destination_ids, self.flags, self.name_offsets, self.names
+        )
+        selected.source_ids = array("I", [source_ids[idx] for idx in indices])
+        selected.destination_ids = array("I", [destination_ids[idx] for idx in indices])
+        selected.flags = array("B", [flags[idx] for idx in indices])
+        selected.names = bytearray(b"".join([names[offsets[idx]:offsets[idx + 1]] for idx in indices]))
+        selected.name_offsets = array("I", accumulate((offsets[idx + 1] - offsets[idx] for idx in indices), initial=0))
+        if self.sizes is not None:
+            selected.sizes = array("Q", [self.sizes[idx] for idx in indices])
+        return selected
+
+
+    def filter(self, predicate: Callable[[MoveAction], bool]) -> 'CompactMovePlan':
+        """A plan with only the moves the predicate accepts."""
+        return self.select(idx for idx in range(len(self)) if predicate(self.action(idx)))
+
+
+    def with_reason(self, reason: str) -> 'CompactMovePlan':
+        """A plan with only the moves of a reason, selected on the columns."""
+        reason_id = self._reason_ids.get(reason)
+        return self.select(idx for idx, flag in enumerate(self.flags) if flag == reason_id)
+
+
+    def with_destination(self, destination: str) -> 'CompactMovePlan':
+        """A plan with only the moves into a directory, selected on the columns."""
+        directory_id = self._directory_ids.get(destination)
+        return self.select(idx for idx, other in enumerate(self.destination_ids) if other == directory_id)
+
+
+    def _keys(self, directory_ids: Optional[list[int]] = None) -> Iterator[tuple[int, int, bytes]]:
+        """The (source id, destination id, name) of each move, with the ids mapped by `directory_ids`."""
+        # Slices of bytes (unlike the ones of the bytearray) can be hashed
+        names, offsets = bytes(self.names), self.name_offsets
+        source_ids, destination_ids = self.source_ids, self.destination_ids
+        if directory_ids is not None:
+            source_ids = [directory_ids[directory_id] for directory_id in source_ids]
+            destination_ids = [directory_ids[directory_id] for directory_id in destination_ids]
+        return zip(source_ids, destination_ids, (names[start:end] for start, end in zip(offsets, offsets[1:])))
+
+
+    def diff(self, other: 'CompactMovePlan') -> 'CompactMovePlan':
+        """
+        The moves of this plan that the other plan doesn't have (same file and destination),
+        like the moves a new layout adds to the plan of the old one.
+        """
+        # The directories of the other plan in the ids of this one, -1 when this plan doesn't have them
+        directory_ids = [self._directory_ids.get(directory, -1) for directory in other.directories]
+        other_keys = set(other._keys(directory_ids))
+        return self.select(idx for idx, key in enumerate(self._keys()) if key not in other_keys)
+
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialize the plan: a header, the interned strings as JSON, then the raw columns.
+        The columns are written in the native byte order, for the same machine to load.
+        """
+        strings = json.dumps({
+            "directory": self.directory, "directories": self.directories, "reasons": self.reasons
+        }, ensure_ascii=False).encode("utf-8", "surrogateescape")
+        sizes = self.sizes.tobytes() if self.sizes is not None else b""
+        return b"".join((
+            self.MAGIC,
+            self.HEADER.pack(self.scanned, len(self), len(strings), len(self.names)),
+            strings,
+            self.devices.tobytes(),
+            self.source_ids.tobytes(),
+            self.destination_ids.tobytes(),
+            self.flags.tobytes(),
+            self.name_offsets.tobytes(),
+            self.names,
+            sizes,
+        ))
+
+
+    @staticmethod
+    def from_bytes(data: bytes) -> 'CompactMovePlan':
+        """Load a plan written by `to_bytes`."""
+        if not data.startswith(CompactMovePlan.MAGIC):
+            raise ValueError("Not a serialized move plan")
+        offset = len(CompactMovePlan.MAGIC)
+        scanned, count, strings_size, names_size = CompactMovePlan.HEADER.unpack_from(data, offset)
+        offset += CompactMovePlan.HEADER.size
+        strings = json.loads(data[offset:offset + strings_size].decode("utf-8", "surrogateescape"))
+        offset += strings_size
+
+        plan = CompactMovePlan(strings["directory"], scanned)
+        plan.directories = strings["directories"]
+        plan.reasons = strings["reasons"]
+        plan._directory_ids = {directory: idx for idx, directory in enumerate(plan.directories)}
+        plan._reason_ids = {reason: idx for idx, reason in enumerate(plan.reasons)}
+
+        def read(column: array, items: int):
+            nonlocal offset
+            size = column.itemsize * items
+            column.frombytes(data[offset:offset + size])
+            offset += size
+
+        read(plan.devices, len(plan.directories))
+        read(plan.source_ids, count)
+        read(plan.destination_ids, count)
+        read(plan.flags, count)
+        plan.name_offsets = array("I")
+        read(plan.name_offsets, count + 1)
+        plan.names = bytearray(data[offset:offset + names_size])
+        offset += names_size
+        if offset < len(data):
+            plan.sizes = array("Q")
+            read(plan.sizes, count)
+        return plan
+
+
+class MovePlanner:
+    """
+    Decides the target directory of each file under a set of categories.
+
+    Attributes:
+        directory (str): The main directory path.
+        categories (list[Category]): List of category objects.
+        routing (RoutingTable): The compiled (and cached) routes of the categories.
+        needs_stats (bool): Whether the entries need their size and mtime, for the size and age rules.
+    """
+
+    def __init__(self, directory: str, categories: list[Category]) -> None:
+        self.directory = directory
+        self.categories = categories
+        self.routing: RoutingTable = compile_routing(directory, categories)
+        self.needs_stats = self.routing.needs_stats
+
+
+    def target(self, filename: str, size: int = 0, mtime_ns: int = 0) -> tuple[str, str]:
+        """
+        Find the directory a file belongs to.
+
+        :param filename: The name of the file.
+        :param size: Size of the file in bytes, for the size rules.
+        :param mtime_ns: Modification time of the file, for the age rules.
+        :return: The target directory and the reason of the placement.
+        """
+        return self.routing.target(filename, size, mtime_ns)
+
+
+    def uncategorized(self, entries: Iterable[FileEntry]) -> list[FileEntry]:
+        """The files no extension or rule places, the ones a content type could place."""
+        target = self.routing.target
+        now_ns = time.time_ns()
+        return [
+            entry for entry in entries
+            if target(entry.name, entry.size, entry.mtime_ns, now_ns)[1] == REASON_UNCATEGORIZED
+        ]
+
+
+    def plan(
+        self,
+        entries: Iterable[FileEntry],
+        content_types: Optional[dict[str, str]] = None,
+        compact: bool = False
+    ) -> 'MovePlan | CompactMovePlan':
+        """
+        Build the move plan for the given files. Files that are already
+        in their target directory are left out of the plan.
+
+        :param entries: The files to plan for.
+        :param content_types: Extension of the content of files (by path), used for the uncategorized files.
+        :param compact: Build a `CompactMovePlan`, for the plans of whole directories.
+        """
+        plan = CompactMovePlan(self.directory) if compact else MovePlan(directory=self.directory)
+        target = self.routing.target
+        # The ages of a plan are measured at the same time
+        now_ns = time.time_ns()
+        for entry in entries:
+            plan.scanned += 1
+            destination, reason = target(entry.name, entry.size, entry.mtime_ns, now_ns)
+            if reason == REASON_UNCATEGORIZED and content_types:
+                extension = content_types.get(os.path.join(entry.parent, entry.name))
+                if extension:
+                    destination, reason = self.routing.route_extension(extension) or (destination, reason)
+            if entry.parent == destination:
+                continue
+            if entry.parent != self.directory:
+                reason = REASON_MISPLACED
+            plan.add(entry.parent, entry.name, destination, reason, entry.size, entry.device)
+        return plan
@@ -0,0 +1,30 @@
+"""
+Module with a mixin for the objects that are sent to a process pool but hold
+locks (or other per-process state) that can't be pickled.
+"""
+
+import threading
+from typing import Any, Callable
+
+
+class PicklableLock:
+    """
+    Leaves the attributes of `UNPICKLED` out of the pickled state, and creates
+    them again with their factory when unpickled. By default that's the `lock`.
+    """
+
+    # Attribute name -> factory of a new value
+    UNPICKLED: dict[str, Callable[[], Any]] = {"lock": threading.Lock}
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in self.UNPICKLED:
+            state.pop(name, None)
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for name, factory in self.UNPICKLED.items():
+            setattr(self, name, factory())
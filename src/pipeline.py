@@ -0,0 +1,88 @@
+"""
+Module with the helpers of the streaming scan -> classify -> move pipeline.
+
+Each stage runs in its own thread and hands batches to the next stage through a
+bounded queue, so a stage that is ahead waits for the slower one instead of
+buffering: the memory of a run depends on `BATCH_SIZE` and `QUEUE_SIZE`, not on
+the number of files, and the first moves start while the scan is still running.
+"""
+
+import queue
+import threading
+from typing import Iterable, Iterator, TypeVar
+
+
+T = TypeVar("T")
+
+
+# Items handed between two stages at a time
+BATCH_SIZE = 1000
+# Batches waiting between two stages
+QUEUE_SIZE = 4
+
+# Seconds a blocked stage waits before checking if the pipeline stopped
+_POLL_INTERVAL = 0.1
+
+_ITEM, _END, _ERROR = range(3)
+
+
+def batched(items: Iterable[T], size: int = BATCH_SIZE) -> Iterator[list[T]]:
+    """Group items in lists of `size` items, the last one may be shorter."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def threaded(items: Iterable[T], maxsize: int = QUEUE_SIZE) -> Iterator[T]:
+    """
+    Produce items in a background thread, at most `maxsize` ahead of the consumer.
+    An exception of the producer is raised in the consumer. When the consumer stops
+    early (e.g. on an error), the producer stops at its next item.
+
+    :param items: The items to produce, like a generator of the previous stage.
+    :param maxsize: Number of items that wait in the queue.
+    """
+    pending: queue.Queue = queue.Queue(maxsize)
+    stopped = threading.Event()
+
+    def put(record) -> bool:
+        while not stopped.is_set():
+            try:
+                pending.put(record, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put((_ITEM, item)):
+                    return
+            put((_END, None))
+        except BaseException as e:
+            put((_ERROR, e))
+        finally:
+            # Stops the stages before this one, when the consumer stopped early
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+
+    producer = threading.Thread(target=produce, name="pipeline-stage", daemon=True)
+    producer.start()
+    try:
+        while True:
+            kind, value = pending.get()
+            if kind == _END:
+                return
+            if kind == _ERROR:
+                raise value
+            yield value
+    finally:
+        stopped.set()
+        producer.join()
@@ -0,0 +1,321 @@
+"""
+Module to compile the categories of a config into a routing table.
+
+A `RoutingTable` maps every configured extension straight to the absolute
+directory its files go to, so placing a file is a single dict lookup. Tables
+are cached by directory and layout signature: they are compiled once and only
+compiled again when the categories of the config change.
+
+    Placement
+    --------------------------------------------------------------------
+    1. Hidden files go to `.hidden`.
+    2. The rules of the categories, in config order: the first matching rule wins.
+    3. The longest configured extension the name ends with (".tar.gz" before ".gz").
+    4. Everything else goes to `Uncategorized`.
+    Names are matched ignoring case.
+
+    The rules of all the categories are compiled together: suffix rules (and globs
+    like "*.min.js") go to tables of suffixes by length, the other globs and the
+    regexes to a single alternation, so a file costs a few lookups and one regex
+    match however many rules there are. Size and age rules need the stat of a file,
+    `RoutingTable.needs_stats` tells the scans to read it.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Callable, Optional
+
+from models import Category, Rule, RULE_GLOB, RULE_SUFFIX
+
+
+LOG = logging.getLogger(__name__)
+
+
+UNCATEGORIZED = "Uncategorized"
+HIDDEN = ".hidden"
+
+# Reasons for a placement
+REASON_HIDDEN = "hidden"
+REASON_UNCATEGORIZED = "uncategorized"
+REASON_CATEGORY = "category"
+
+NANOSECONDS_PER_DAY = 86400 * 10 ** 9
+
+GLOB_SPECIAL = re.compile(r"[*?\[]")
+
+
+def layout_signature(categories: list[Category]) -> str:
+    """
+    Compute a fingerprint of the category layout. Two layouts with the same
+    signature place every file in the same target directory. The order of the
+    categories is kept: rules match first to last and the last category of an
+    extension wins, so reordering them can move files.
+
+    :param categories: List of category objects.
+    """
+    layout = [
+        (
+            category.name, sorted(category.extensions), bool(category.categorize_extensions),
+            [rule.to_dict() for rule in category.rules]
+        )
+        for category in categories
+    ]
+    return hashlib.sha1(json.dumps(layout).encode("utf-8")).hexdigest()
+
+
+def normalize_extension(extension: str) -> str:
+    """Add the "." prefix to an extension if it's missing."""
+    return extension if extension.startswith(".") else f".{extension}"
+
+
+def file_extension(filename: str) -> str:
+    """
+    Get the extension of a (not hidden) file name, like `os.path.splitext` does.
+
+    :param filename: A file name without directories.
+    """
+    idx = filename.rfind(".")
+    return filename[idx:] if idx > 0 else ""
+
+
+def _literal_suffix(rule: Rule) -> Optional[str]:
+    """The suffix a rule matches, when its name pattern is only a suffix (like "*.min.js")."""
+    if not rule.pattern:
+        return ""
+    if rule.type == RULE_SUFFIX:
+        return rule.pattern
+    if rule.type == RULE_GLOB and rule.pattern.startswith("*") and not GLOB_SPECIAL.search(rule.pattern[1:]):
+        return rule.pattern[1:]
+    return None
+
+
+def _combinable(regex: str) -> bool:
+    """Whether a regex can be a branch of the combined alternation: no groups of its own to renumber."""
+    try:
+        return re.compile(f"(?:{regex})").groups == 0
+    except re.error:
+        return False
+
+
+def _within_limits(rule: Rule, size: int, mtime_ns: int, now_ns: int) -> bool:
+    if rule.min_size is not None and size < rule.min_size:
+        return False
+    if rule.max_size is not None and size > rule.max_size:
+        return False
+    if rule.min_age is not None or rule.max_age is not None:
+        age = (now_ns - mtime_ns) / NANOSECONDS_PER_DAY
+        if rule.min_age is not None and age < rule.min_age:
+            return False
+        if rule.max_age is not None and age > rule.max_age:
+            return False
+    return True
+
+
+class RuleMatcher:
+    """
+    The rules of all the categories compiled into a single matcher, with first-match priority.
+
+    Attributes:
+        rules (list[Rule]): The rules in priority order.
+        suffixes (list[tuple[int, dict[str, int]]]): By suffix length, the lowercase suffixes and their first rule.
+        combined (re.Pattern | None): Alternation of the glob and regex rules, a named group per rule.
+        separate (list[tuple[int, re.Pattern]]): Regexes with groups of their own, matched one by one.
+        needs_stats (bool): Whether some rule has size or age limits.
+    """
+
+    def __init__(self, rules: list[Rule]) -> None:
+        self.rules = rules
+        self.needs_stats = any(rule.has_limits() for rule in rules)
+        self.separate: list[tuple[int, re.Pattern]] = []
+        self._name_matchers: list[Callable[[str], bool]] = []
+
+        suffixes: dict[int, dict[str, int]] = {}
+        branches = []
+        for idx, rule in enumerate(rules):
+            suffix = _literal_suffix(rule)
+            if suffix is not None:
+                suffix = suffix.lower()
+                suffixes.setdefault(len(suffix), {}).setdefault(suffix, idx)
+                self._name_matchers.append(lambda lower, suffix=suffix: lower.endswith(suffix))
+                continue
+
+            regex = rule.name_regex()
+            try:
+                compiled = re.compile(regex, re.IGNORECASE)
+            except re.error as e:
+                # A broken rule never matches, the other rules still route the files
+                LOG.error(f"Skipping invalid rule '{rule.pattern}': {e}")
+                self._name_matchers.append(lambda lower: False)
+                continue
+            self._name_matchers.append(lambda lower, compiled=compiled: compiled.match(lower) is not None)
+            if _combinable(regex):
+                branches.append(f"(?P<r{idx}>{regex})")
+            else:
+                self.separate.append((idx, compiled))
+
+        self.suffixes = sorted(suffixes.items())
+        self.combined = re.compile("|".join(branches), re.IGNORECASE) if branches else None
+
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+
+    def _first_name_match(self, lower: str) -> int:
+        """Index of the first rule whose name pattern matches, len(rules) if none does."""
+        best = len(self.rules)
+        length = len(lower)
+        for suffix_length, table in self.suffixes:
+            if suffix_length > length:
+                break
+            idx = table.get(lower[length - suffix_length:])
+            if idx is not None and idx < best:
+                best = idx
+
+        if self.combined is not None:
+            # The alternation is tried in order, the first branch that matches is the first rule
+            match = self.combined.match(lower)
+            if match is not None:
+                best = min(best, int(match.lastgroup[1:]))
+
+        for idx, compiled in self.separate:
+            if idx >= best:
+                break
+            if compiled.match(lower):
+                best = idx
+                break
+        return best
+
+
+    def match(self, filename: str, size: int = 0, mtime_ns: int = 0, now_ns: int = 0) -> Optional[int]:
+        """
+        Find the first rule a file matches.
+
+        :param filename: The name of the file.
+        :param size: Size of the file in bytes, for the size limits.
+        :param mtime_ns: Modification time of the file, for the age limits.
+        :param now_ns: The time the ages are measured at, now if 0.
+        :return: The index of the rule, None if no rule matches.
+        """
+        lower = filename.lower()
+        idx = self._first_name_match(lower)
+        if idx == len(self.rules):
+            return None
+        if not self.needs_stats:
+            return idx
+
+        now_ns = now_ns or time.time_ns()
+        # A name match can still fail on the limits, the rules after it are checked one by one
+        for idx in range(idx, len(self.rules)):
+            rule = self.rules[idx]
+            if self._name_matchers[idx](lower) and _within_limits(rule, size, mtime_ns, now_ns):
+                return idx
+        return None
+
+
+class RoutingTable:
+    """
+    Compiled placement rules of a directory.
+
+    Attributes:
+        directory (str): The main directory path.
+        routes (dict[str, tuple[str, str]]): Lowercase extension to target directory and reason.
+        hidden (tuple[str, str]): Target directory and reason of hidden files.
+        uncategorized (tuple[str, str]): Target directory and reason of files without a category.
+        rules (RuleMatcher): The compiled rules of all the categories.
+        rule_routes (list[tuple[str, str]]): Target directory and reason of each rule.
+        needs_stats (bool): Whether the placement needs the size and mtime of the files.
+    """
+
+    def __init__(self, directory: str, categories: list[Category]) -> None:
+        self.directory = directory
+        self.hidden = (os.path.join(directory, HIDDEN), REASON_HIDDEN)
+        self.uncategorized = (os.path.join(directory, UNCATEGORIZED), REASON_UNCATEGORIZED)
+
+        self.routes: dict[str, tuple[str, str]] = {}
+        rules: list[Rule] = []
+        self.rule_routes: list[tuple[str, str]] = []
+        for category in categories:
+            category_path = os.path.join(directory, category.name)
+            for ext in category.extensions:
+                ext = normalize_extension(ext)
+                if category.categorize_extensions:
+                    self.routes[ext.lower()] = (os.path.join(category_path, ext.lstrip('.')), REASON_CATEGORY)
+                else:
+                    self.routes[ext.lower()] = (category_path, REASON_CATEGORY)
+            for rule in category.rules:
+                rules.append(rule)
+                self.rule_routes.append((category_path, REASON_CATEGORY))
+
+        self.rules = RuleMatcher(rules)
+        self.needs_stats = self.rules.needs_stats
+        # The extensions with more than one dot, the others are found with a single lookup
+        self._multi_suffix = any(ext.count(".") > 1 for ext in self.routes)
+
+
+    def target(self, filename: str, size: int = 0, mtime_ns: int = 0, now_ns: int = 0) -> tuple[str, str]:
+        """
+        Find the directory a file belongs to.
+
+        :param filename: The name of the file.
+        :param size: Size of the file in bytes, for the size rules.
+        :param mtime_ns: Modification time of the file, for the age rules.
+        :param now_ns: The time the ages are measured at, now if 0.
+        :return: The target directory and the reason of the placement.
+        """
+        # If the file starts with a dot (i.e., it's hidden), it goes to ".hidden" directory.
+        if filename.startswith('.'):
+            return self.hidden
+
+        if self.rule_routes:
+            idx = self.rules.match(filename, size, mtime_ns, now_ns)
+            if idx is not None:
+                return self.rule_routes[idx]
+
+        lower = filename.lower()
+        if self._multi_suffix:
+            # From the first dot, so the longest extension wins
+            idx = lower.find(".", 1)
+            while idx != -1:
+                route = self.routes.get(lower[idx:])
+                if route is not None:
+                    return route
+                idx = lower.find(".", idx + 1)
+            return self.uncategorized
+        return self.routes.get(file_extension(lower), self.uncategorized)
+
+
+    def route_extension(self, extension: str) -> Optional[tuple[str, str]]:
+        """The target directory and reason of an extension, None if no category has it."""
+        return self.routes.get(extension.lower())
+
+
+    def targets(self) -> set[str]:
+        """Set of all the directories files can be routed to."""
+        targets = {target for target, _ in self.routes.values()} | {target for target, _ in self.rule_routes}
+        return targets | {self.hidden[0], self.uncategorized[0]}
+
+
+_CACHE: dict[str, tuple[str, RoutingTable]] = {}
+_CACHE_LOCK = threading.Lock()
+
+
+def compile_routing(directory: str, categories: list[Category]) -> RoutingTable:
+    """
+    Get the routing table of a directory. The table is compiled once and
+    compiled again only when the categories of the directory change.
+
+    :param directory: The main directory path.
+    :param categories: List of category objects.
+    """
+    signature = layout_signature(categories)
+    with _CACHE_LOCK:
+        cached = _CACHE.get(directory)
+        if cached is None or cached[0] != signature:
+            cached = _CACHE[directory] = (signature, RoutingTable(directory, categories))
+    return cached[1]
@@ -0,0 +1,225 @@
+"""
+Module with the metrics of an organize run and the hooks that export them.
+
+    Hooks
+    --------------------------------------------------------------------
+    `FileOrganizer(hooks=[...])` calls every hook with the report of each run:
+        on_phase(report, phase, seconds)    After each phase of the run
+        on_report(report)                   When the run finished (also after an error)
+    A hook implements only the methods it needs. Exceptions of a hook are logged
+    and never fail a run.
+"""
+
+import os
+import json
+import time
+import logging
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Iterator, Optional
+
+
+LOG = logging.getLogger(__name__)
+
+
+REPORT_SUFFIX = ".report.json"
+
+
+@dataclass
+class RunReport:
+    """
+    Represents the outcome and the metrics of processing a config.
+
+    Attributes:
+        directory (str): Directory of the processed config.
+        status (str): One of "done", "inactive", "skipped" or "error".
+        duration (float): Wall time of the run in seconds. Default is 0.
+        error (str | None): Error message when the run didn't complete.
+        incremental (bool): Whether the run skipped the reset step.
+        started_at (float): Unix time the run started.
+        files_scanned (int): Files listed by the run.
+        files_moved (int): Files moved.
+        files_skipped (int): Listed files that were already in place.
+        errors (int): Failed moves.
+        bytes_moved (int): Size of the moved files (only known for the scans that stat files).
+        duplicates (int): Files with the same content as another file, when the run looks for duplicates.
+        duplicate_bytes (int): Size of the duplicates.
+        phases (dict[str, float]): Wall time of each phase in seconds, in run order.
+    """
+
+    directory: str
+    status: str
+    duration: float = 0.0
+    error: Optional[str] = None
+    incremental: bool = False
+    started_at: float = 0.0
+    files_scanned: int = 0
+    files_moved: int = 0
+    files_skipped: int = 0
+    errors: int = 0
+    bytes_moved: int = 0
+    duplicates: int = 0
+    duplicate_bytes: int = 0
+    phases: dict[str, float] = field(default_factory=dict)
+
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+    @staticmethod
+    def from_dict(data: dict) -> "RunReport":
+        return RunReport(**data)
+
+
+class RunRecorder:
+    """
+    Times the phases of a run and calls the hooks.
+
+    Attributes:
+        report (RunReport): The report of the run.
+        hooks (list): The hooks of the organizer.
+        clock (Callable[[], float]): Timer of the phases.
+    """
+
+    def __init__(self, report: RunReport, hooks: Optional[list] = None, clock: Callable[[], float] = time.perf_counter) -> None:
+        self.report = report
+        self.hooks = hooks or []
+        self.clock = clock
+
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time a phase of the run. A phase that runs twice adds up."""
+        start_time = self.clock()
+        try:
+            yield
+        finally:
+            seconds = self.clock() - start_time
+            self.report.phases[name] = self.report.phases.get(name, 0.0) + seconds
+            self._call("on_phase", self.report, name, seconds)
+
+
+    def finish(self):
+        """Call the hooks with the finished report."""
+        self._call("on_report", self.report)
+
+
+    def _call(self, method: str, *args):
+        for hook in self.hooks:
+            callback = getattr(hook, method, None)
+            if callback is None:
+                continue
+            try:
+                callback(*args)
+            except Exception as e:
+                LOG.error(f"Error in run report hook {type(hook).__name__}.{method}: {e}")
+
+
+def _file_stem(directory: str) -> str:
+    return directory.replace('/', '_')
+
+
+class LastReportStore:
+    """
+    Keeps the last report of each directory in the state directory, for the CLI.
+
+    Attributes:
+        state_directory (str): The organizer state directory.
+    """
+
+    def __init__(self, state_directory: str) -> None:
+        self.state_directory = state_directory
+
+
+    def _path(self, directory: str) -> str:
+        return os.path.join(self.state_directory, f"{_file_stem(directory)}{REPORT_SUFFIX}")
+
+
+    def on_report(self, report: RunReport):
+        path = self._path(report.directory)
+        os.makedirs(self.state_directory, exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(report.to_dict(), f)
+        os.replace(temp_path, path)
+
+
+    def load(self, directory: str) -> Optional[RunReport]:
+        """The last report of a directory, None if it never ran."""
+        path = self._path(directory)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r") as f:
+                return RunReport.from_dict(json.load(f))
+        except Exception as e:
+            LOG.error(f"Error reading run report {path}: {e}")
+            return None
+
+
+class JsonLinesExporter:
+    """
+    Appends every report as a JSON line to a file.
+
+    Attributes:
+        path (str): Path of the JSON lines file.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+
+    def on_report(self, report: RunReport):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(report.to_dict()) + "\n")
+
+
+class PrometheusTextfileExporter:
+    """
+    Writes the metrics of the last run of each directory in the Prometheus text
+    format, one `.prom` file per directory, for the textfile collector of node_exporter.
+
+    Attributes:
+        directory (str): The directory the collector reads.
+    """
+
+    COUNTERS = ["files_scanned", "files_moved", "files_skipped", "errors", "bytes_moved", "duplicates", "duplicate_bytes"]
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+
+    def on_report(self, report: RunReport):
+        label = json.dumps(report.directory, ensure_ascii=False)
+        lines = [
+            f'file_organizer_run_duration_seconds{{directory={label}}} {report.duration}',
+            f'file_organizer_run_timestamp_seconds{{directory={label}}} {report.started_at}',
+            f'file_organizer_run_success{{directory={label}}} {int(report.status == "done")}',
+        ]
+        lines.extend(f'file_organizer_{name}{{directory={label}}} {getattr(report, name)}' for name in self.COUNTERS)
+        lines.extend(
+            f'file_organizer_phase_duration_seconds{{directory={label},phase="{phase}"}} {seconds}'
+            for phase, seconds in report.phases.items()
+        )
+
+        # Written to a temporary file and renamed, so the collector never reads half a file
+        path = os.path.join(self.directory, f"file_organizer{_file_stem(report.directory)}.prom")
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp_path, path)
+
+
+def exporters_from_environment() -> list:
+    """
+    Create the exporters enabled by the environment:
+        FILE_ORGANIZER_PROMETHEUS_DIR    Directory of the Prometheus textfile collector
+        FILE_ORGANIZER_REPORTS_JSONL     Path of a JSON lines file of all the reports
+    """
+    exporters = []
+    if os.environ.get("FILE_ORGANIZER_PROMETHEUS_DIR"):
+        exporters.append(PrometheusTextfileExporter(os.environ["FILE_ORGANIZER_PROMETHEUS_DIR"]))
+    if os.environ.get("FILE_ORGANIZER_REPORTS_JSONL"):
+        exporters.append(JsonLinesExporter(os.environ["FILE_ORGANIZER_REPORTS_JSONL"]))
+    return exporters
@@ -0,0 +1,257 @@
+"""
+Module to run the configs on their schedules.
+
+Each config with an active schedule runs every `interval` units of its `type`.
+The first run of every config is delayed by a random jitter, so many configs
+with the same schedule don't all start on the same second, and later runs keep
+that offset. A run of a directory never overlaps with another run of the same
+directory, or of a directory nested in it or containing it: if such a run is
+still going when the next one is due, the next one is skipped and reported.
+
+The state of the schedules (next run, last duration, skipped runs) is saved in
+the state directory, so the CLI can show it while the daemon runs in another process.
+"""
+
+import os
+import json
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Callable, Optional
+
+from models import Config, Schedule
+from config_service import IConfigService
+from file_organizer import FileOrganizer, _directories_overlap
+
+
+LOG = logging.getLogger(__name__)
+
+
+SCHEDULE_SECONDS = {
+    "MINUTE": 60,
+    "HOUR": 60 * 60,
+    "DAY": 24 * 60 * 60,
+    "WEEK": 7 * 24 * 60 * 60,
+    "MONTH": 30 * 24 * 60 * 60,
+    "YEAR": 365 * 24 * 60 * 60
+}
+
+STATUS_FILENAME = "scheduler.json"
+
+
+@dataclass
+class ScheduleState:
+    """
+    Represents the run state of a scheduled config.
+
+    Attributes:
+        directory (str): Directory of the config.
+        interval (float): Seconds between two runs.
+        next_run (float): Timestamp of the next run.
+        last_duration (float | None): Wall time of the last completed run in seconds.
+        last_status (str | None): Status of the last completed run.
+        skipped (int): Number of runs skipped because the previous run overran.
+        running (bool): Whether a run is in progress.
+    """
+
+    directory: str
+    interval: float
+    next_run: float
+    last_duration: Optional[float] = None
+    last_status: Optional[str] = None
+    skipped: int = 0
+    running: bool = False
+
+
+def interval_seconds(schedule: Schedule) -> Optional[float]:
+    """
+    Get the seconds between two runs of a schedule.
+
+    :return: The interval or None if the schedule type or interval is invalid.
+    """
+    unit = SCHEDULE_SECONDS.get(str(schedule.type).upper())
+    try:
+        interval = int(schedule.interval)
+    except (TypeError, ValueError):
+        return None
+    if not unit or interval <= 0:
+        return None
+    return float(unit * interval)
+
+
+def load_schedule_states(state_directory: str) -> dict[str, ScheduleState]:
+    """Load the schedule states the daemon saved, by directory."""
+    status_path = os.path.join(state_directory, STATUS_FILENAME)
+    if not os.path.exists(status_path):
+        return {}
+    try:
+        with open(status_path, "r") as f:
+            data = json.load(f)
+        return {directory: ScheduleState(**state) for directory, state in data.items()}
+    except Exception as e:
+        LOG.error(f"Error reading scheduler status {status_path}: {e}")
+        return {}
+
+
+class Scheduler:
+    """
+    Runs the configs of a config service on their schedules.
+
+    Attributes:
+        organizer (FileOrganizer): The organizer that runs the configs.
+        service (IConfigService): The service that provides the configs.
+        state_directory (str | None): Directory to save the schedule states in.
+        max_jitter (float): Upper bound of the random delay of the first run, in seconds.
+        states (dict[str, ScheduleState]): The schedule states by directory.
+    """
+
+    TICK = 1.0
+
+    def __init__(
+        self,
+        organizer: FileOrganizer,
+        service: IConfigService,
+        state_directory: Optional[str] = None,
+        max_workers: int = 4,
+        max_jitter: float = 60.0,
+        clock: Callable[[], float] = time.time
+    ) -> None:
+        self.organizer = organizer
+        self.service = service
+        self.state_directory = state_directory
+        self.max_jitter = max_jitter
+        self.clock = clock
+        self.states: dict[str, ScheduleState] = {}
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+
+
+    def refresh(self) -> list[Config]:
+        """
+        Sync the schedule states with the configs of the service.
+
+        :return: The configs that have an active schedule.
+        """
+        now = self.clock()
+        scheduled = []
+        with self.lock:
+            seen = set()
+            for config in self.service.get_configs():
+                interval = interval_seconds(config.schedule)
+                if not config.active or not config.schedule.active or interval is None:
+                    continue
+
+                scheduled.append(config)
+                seen.add(config.directory)
+                state = self.states.get(config.directory)
+                if state is None:
+                    jitter = random.uniform(0, min(interval, self.max_jitter))
+                    self.states[config.directory] = ScheduleState(config.directory, interval, now + jitter)
+                elif state.interval != interval:
+                    # The schedule changed, restart it keeping the jitter offset of the old one
+                    state.next_run = now + (state.next_run - now) % interval
+                    state.interval = interval
+
+            for directory in [directory for directory, state in self.states.items() if directory not in seen and not state.running]:
+                del self.states[directory]
+        return scheduled
+
+
+    def run_pending(self):
+        """Start the runs that are due, skipping the ones whose previous run, or a run of an overlapping directory, is still going."""
+        now = self.clock()
+        changed = False
+        for config in self.refresh():
+            with self.lock:
+                state = self.states[config.directory]
+                if state.next_run > now:
+                    continue
+
+                changed = True
+                if state.running:
+                    missed = self._advance(state, now)
+                    state.skipped += missed
+                    LOG.warning(f"Skipped {missed} run(s) of {config.directory}, the previous run is still going")
+                    continue
+
+                # Two runs moving the same files would race, like in `FileOrganizer.process_configs`
+                overlapping = next((
+                    directory for directory, other in self.states.items()
+                    if other.running and directory != config.directory and _directories_overlap(directory, config.directory)
+                ), None)
+                if overlapping:
+                    missed = self._advance(state, now)
+                    state.skipped += missed
+                    LOG.warning(f"Skipped {missed} run(s) of {config.directory}, the run of {overlapping} is still going")
+                    continue
+
+                missed = self._advance(state, now) - 1
+                if missed:
+                    state.skipped += missed
+                    LOG.warning(f"Skipped {missed} missed run(s) of {config.directory}")
+                state.running = True
+
+            self.pool.submit(self._run, config)
+
+        if changed:
+            self.save_states()
+
+
+    @staticmethod
+    def _advance(state: ScheduleState, now: float) -> int:
+        """Move the next run of a state after `now`, keeping its phase. Returns the number of runs passed."""
+        passed = int((now - state.next_run) // state.interval) + 1
+        state.next_run += passed * state.interval
+        return passed
+
+
+    def _run(self, config: Config):
+        """Run a config and record its duration."""
+        try:
+            result = self.organizer.process_config(config, incremental=True)
+            duration, status = result.duration, result.status
+        except Exception as e:
+            LOG.error(f"Error running scheduled config {config.directory}: {e}")
+            duration, status = None, "error"
+
+        with self.lock:
+            state = self.states.get(config.directory)
+            if state:
+                state.running = False
+                state.last_duration = duration
+                state.last_status = status
+        self.save_states()
+
+
+    def save_states(self):
+        """Save the schedule states for the CLI."""
+        if not self.state_directory:
+            return
+        with self.lock:
+            data = {directory: asdict(state) for directory, state in self.states.items()}
+        status_path = os.path.join(self.state_directory, STATUS_FILENAME)
+        with self.save_lock:
+            try:
+                temp_path = f"{status_path}.tmp"
+                with open(temp_path, "w") as f:
+                    json.dump(data, f)
+                os.replace(temp_path, status_path)
+            except Exception as e:
+                LOG.error(f"Error writing scheduler status {status_path}: {e}")
+
+
+    def run(self, stop_event: Optional[threading.Event] = None):
+        """Run the schedules until `stop_event` is set (or forever)."""
+        stop_event = stop_event or threading.Event()
+        LOG.info("Scheduler started")
+        try:
+            while not stop_event.is_set():
+                self.run_pending()
+                stop_event.wait(self.TICK)
+        finally:
+            self.pool.shutdown(wait=True)
+            LOG.info("Scheduler stopped")
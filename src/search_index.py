@@ -0,0 +1,101 @@
+"""
+Module with an in-memory search index over config directories.
+
+Prefix lookups use a sorted list and `bisect`. Substring lookups use a trigram
+index: every directory is listed under each 3-character slice of its name, so a
+search intersects the (small) sets of the slices of the term and only checks those
+candidates. Terms shorter than a trigram scan the directories. Searches ignore case.
+"""
+
+import bisect
+from typing import Iterable
+
+
+TRIGRAM = 3
+
+
+def _trigrams(text: str) -> set[str]:
+    return {text[idx:idx + TRIGRAM] for idx in range(len(text) - TRIGRAM + 1)}
+
+
+class SearchIndex:
+    """
+    Sorted and trigram index of directories, updated on every insert and delete.
+
+    Attributes:
+        keys (list[tuple[str, str]]): Sorted (lowercase directory, directory) pairs.
+        trigrams (dict[str, set[str]]): Directories of each lowercase trigram.
+    """
+
+    def __init__(self, directories: Iterable[str] = ()) -> None:
+        self.keys: list[tuple[str, str]] = sorted((directory.lower(), directory) for directory in set(directories))
+        self.trigrams: dict[str, set[str]] = {}
+        for key, directory in self.keys:
+            for trigram in _trigrams(key):
+                self.trigrams.setdefault(trigram, set()).add(directory)
+
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+    def __contains__(self, directory: str) -> bool:
+        key = (directory.lower(), directory)
+        idx = bisect.bisect_left(self.keys, key)
+        return idx < len(self.keys) and self.keys[idx] == key
+
+
+    def add(self, directory: str):
+        """Add a directory, if it's not already in the index."""
+        if directory in self:
+            return
+        key = directory.lower()
+        bisect.insort(self.keys, (key, directory))
+        for trigram in _trigrams(key):
+            self.trigrams.setdefault(trigram, set()).add(directory)
+
+
+    def remove(self, directory: str):
+        """Remove a directory, if it's in the index."""
+        if directory not in self:
+            return
+        key = directory.lower()
+        del self.keys[bisect.bisect_left(self.keys, (key, directory))]
+        for trigram in _trigrams(key):
+            directories = self.trigrams[trigram]
+            directories.discard(directory)
+            if not directories:
+                del self.trigrams[trigram]
+
+
+    def prefix(self, prefix: str) -> list[str]:
+        """The directories that start with a prefix, sorted."""
+        prefix = prefix.lower()
+        matched = []
+        for key, directory in self.keys[bisect.bisect_left(self.keys, (prefix, "")):]:
+            if not key.startswith(prefix):
+                break
+            matched.append(directory)
+        return matched
+
+
+    def search(self, term: str) -> list[str]:
+        """The directories that contain a term, sorted."""
+        term = term.lower()
+        if len(term) < TRIGRAM:
+            return [directory for key, directory in self.keys if term in key]
+
+        postings = []
+        for trigram in _trigrams(term):
+            directories = self.trigrams.get(trigram)
+            if not directories:
+                return []
+            postings.append(directories)
+
+        # The smallest set bounds the candidates, the others only filter
+        postings.sort(key=len)
+        candidates = postings[0].intersection(*postings[1:])
+        if len(candidates) * 8 > len(self.keys):
+            # Many matches: filtering the sorted keys is cheaper than sorting them
+            return [directory for key, directory in self.keys if directory in candidates and term in key]
+        return sorted((directory for directory in candidates if term in directory.lower()), key=lambda directory: (directory.lower(), directory))
@@ -1,7 +1,11 @@
 import os
 import json
+import queue
+import atexit
 import logging
 import logging.config
+import logging.handlers
+from typing import Optional
 
 from utils import get_resource_path
 
@@ -27,8 +31,19 @@ class ColoredFormatter(logging.Formatter):
             f"{self.COLORS['MESSAGE']}{record.getMessage()}{self.COLORS['ENDC']}"
         )
 
-def _setup_logging(app_directory: str):
-    """Sets up the logging for the app"""
+# Writes the queued log records to the configured handlers, in its own thread
+_LOG_LISTENER: Optional[logging.handlers.QueueListener] = None
+
+
+def _setup_logging(app_directory: str, verbose: bool = False):
+    """
+    Sets up the logging for the app. The handlers of config/logging.json run behind
+    a queue, so the callers only enqueue records and the formatting and file writes
+    happen in a listener thread.
+
+    :param verbose: Log every file the organizer moves, not only the summary of each run.
+    """
+    global _LOG_LISTENER
 
     # Create logs directory
     logs_directory = os.path.join(app_directory, "logs")
@@ -44,8 +59,31 @@ def _setup_logging(app_directory: str):
         if 'filename' in handler:
             handler['filename'] = handler['filename'].format(USER_HOME=log_dir)
 
+    _stop_logging()
     logging.config.dictConfig(config)
 
+    # Move the configured handlers behind a queue
+    root = logging.getLogger()
+    log_queue = queue.SimpleQueue()
+    _LOG_LISTENER = logging.handlers.QueueListener(log_queue, *root.handlers, respect_handler_level=True)
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    _LOG_LISTENER.start()
+    set_verbose(verbose)
+
+
+def set_verbose(verbose: bool):
+    """Switch the per-file logs of the organizer on or off."""
+    logging.getLogger().setLevel(logging.DEBUG if verbose else logging.INFO)
+
+
+@atexit.register
+def _stop_logging():
+    """Write the records still in the queue and stop the listener"""
+    global _LOG_LISTENER
+    if _LOG_LISTENER:
+        _LOG_LISTENER.stop()
+        _LOG_LISTENER = None
+
 
 
 def _setup_cofigs_dir(app_directory: str):
@@ -56,8 +94,20 @@ def _setup_cofigs_dir(app_directory: str):
 
 
 
-def setup_environment():
-    """Sets up the application environment in order to run"""
+def _setup_state_dir(app_directory: str):
+    """Sets up the directory that keeps the organizer run state"""
+    state_directory = os.path.join(app_directory, "state")
+    if not os.path.exists(state_directory):
+        os.makedirs(state_directory)
+
+
+
+def setup_environment(verbose: bool = False):
+    """
+    Sets up the application environment in order to run
+
+    :param verbose: Log every file the organizer moves.
+    """
     # User home directory
     home_directory = os.path.expanduser("~")
     # Create .file-organizer directory if it doesn't exist
@@ -67,8 +117,10 @@ def setup_environment():
 
     # Setup configs directory
     _setup_cofigs_dir(app_directory)
+    # Setup organizer state directory
+    _setup_state_dir(app_directory)
     # Setup logging configurations
-    _setup_logging(app_directory)
+    _setup_logging(app_directory, verbose or bool(os.environ.get("FILE_ORGANIZER_VERBOSE")))
 
 
 def configs_path():
@@ -76,4 +128,18 @@ def configs_path():
     # User home directory
     home_directory = os.path.expanduser("~")
     # Create .file-organizer directory if it doesn't exist
-    return os.path.join(home_directory, ".file-organizer", "configs")
\ No newline at end of file
+    return os.path.join(home_directory, ".file-organizer", "configs")
+
+
+def state_path():
+    """Retrieve the organizer state path"""
+    # User home directory
+    home_directory = os.path.expanduser("~")
+    return os.path.join(home_directory, ".file-organizer", "state")
+
+
+def database_path():
+    """Retrieve the path of the configs database (for the sqlite config backend)"""
+    # User home directory
+    home_directory = os.path.expanduser("~")
+    return os.path.join(home_directory, ".file-organizer", "configs.db")
@@ -0,0 +1,208 @@
+"""
+Module to classify files by their content, for the files no extension or rule places.
+
+The classifier reads the first `HEADER_SIZE` bytes of a file with a single `os.pread`
+and matches them against a table of magic numbers. The file type is cached by the
+device and inode of the file, and a cached type is used while the size and mtime
+of the file stay the same, so the next runs don't read the file again. The reads
+of a plan run in a thread pool: on a network filesystem they wait on the server,
+not on the CPU. The pool lives as long as the classifier, and the cache is stored
+once per phase by the caller (see `save`), not after every plan.
+"""
+
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
+
+from inode_cache import InodeCache
+from picklable import PicklableLock
+from move_plan import FileEntry
+
+
+LOG = logging.getLogger(__name__)
+
+
+# Bytes read from the start of a file
+HEADER_SIZE = 512
+
+# Files read at the same time
+SNIFF_WORKERS = 8
+
+# Cached file types, the least recently used ones are dropped
+MAX_CACHE_ENTRIES = 100_000
+CACHE_FILENAME = "content-types.json"
+
+
+# (offset, magic bytes, extension), the first match wins
+MAGIC_NUMBERS: list[tuple[int, bytes, str]] = [
+    (0, b"%PDF-", ".pdf"),
+    (0, b"\x89PNG\r\n\x1a\n", ".png"),
+    (0, b"\xff\xd8\xff", ".jpg"),
+    (0, b"GIF87a", ".gif"),
+    (0, b"GIF89a", ".gif"),
+    (0, b"BM", ".bmp"),
+    (0, b"II*\x00", ".tiff"),
+    (0, b"MM\x00*", ".tiff"),
+    (8, b"WEBP", ".webp"),
+    (8, b"WAVE", ".wav"),
+    (8, b"AVI ", ".avi"),
+    (4, b"ftypqt", ".mov"),
+    (4, b"ftyp", ".mp4"),
+    (0, b"\x1aE\xdf\xa3", ".mkv"),
+    (0, b"ID3", ".mp3"),
+    (0, b"\xff\xfb", ".mp3"),
+    (0, b"fLaC", ".flac"),
+    (0, b"OggS", ".ogg"),
+    (0, b"PK\x03\x04", ".zip"),
+    (0, b"\x1f\x8b", ".gz"),
+    (0, b"7z\xbc\xaf\x27\x1c", ".7z"),
+    (0, b"Rar!\x1a\x07", ".rar"),
+    (0, b"BZh", ".bz2"),
+    (0, b"\xfd7zXZ\x00", ".xz"),
+    (257, b"ustar", ".tar"),
+    (0, b"SQLite format 3\x00", ".sqlite"),
+    (0, b"{\\rtf", ".rtf"),
+    (0, b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", ".doc"),
+    (0, b"MZ", ".exe"),
+    (0, b"\x7fELF", ".elf"),
+]
+
+
+def detect_extension(header: bytes) -> str:
+    """
+    Find the file type of a file header.
+
+    :param header: The first bytes of the file.
+    :return: The extension of the type, empty if it's unknown.
+    """
+    for offset, magic, extension in MAGIC_NUMBERS:
+        if header.startswith(magic, offset):
+            return extension
+    return ""
+
+
+def _read_header(path: str) -> bytes:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if hasattr(os, "pread"):
+            return os.pread(fd, HEADER_SIZE, 0)
+        return os.read(fd, HEADER_SIZE)
+    finally:
+        os.close(fd)
+
+
+class ContentClassifier(PicklableLock):
+    """
+    Finds the type of files by their content, with a bounded cache of the results.
+
+    Attributes:
+        cache_path (str | None): Path of the JSON file of the cache, without it the cache is only kept in memory.
+        max_workers (int): Number of files read at the same time.
+        cache (InodeCache): The file types by inode.
+        reads (int): Number of files read, for the tests and the logs.
+    """
+
+    # The pool of a process isn't sent to another one
+    UNPICKLED = {"lock": threading.Lock, "_executor": lambda: None}
+
+    def __init__(
+        self,
+        cache_path: Optional[str] = None,
+        max_workers: int = SNIFF_WORKERS,
+        max_entries: int = MAX_CACHE_ENTRIES
+    ) -> None:
+        self.cache_path = cache_path
+        self.max_workers = max(1, max_workers)
+        self.reads = 0
+        self.lock = threading.Lock()
+        self.cache = InodeCache(cache_path, max_entries)
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+
+    def _pool(self) -> ThreadPoolExecutor:
+        """The thread pool of the reads, created on the first use."""
+        with self.lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="sniffing")
+            return self._executor
+
+
+    def save(self):
+        """Store the cache, if it changed."""
+        self.cache.save()
+
+
+    def close(self):
+        """Stop the threads of the reads and store the cache."""
+        with self.lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+        self.save()
+
+
+    def classify_file(self, entry: FileEntry) -> str:
+        """
+        Find the type of a file. The file is stat'ed when the entry has no stats,
+        and only read when the cache doesn't know it.
+
+        :param entry: The file to classify.
+        :return: The extension of the type, empty if it's unknown or the file can't be read.
+        """
+        path = os.path.join(entry.parent, entry.name)
+        try:
+            if entry.inode:
+                key, size, mtime_ns = (entry.device, entry.inode), entry.size, entry.mtime_ns
+            else:
+                file_stat = os.stat(path)
+                key, size, mtime_ns = (file_stat.st_dev, file_stat.st_ino), file_stat.st_size, file_stat.st_mtime_ns
+
+            extension = self.cache.get(key, size, mtime_ns)
+            if extension is not None:
+                return extension
+
+            extension = detect_extension(_read_header(path))
+        except OSError as e:
+            LOG.error(f"Error reading {path}: {e}")
+            return ""
+
+        with self.lock:
+            self.reads += 1
+        self.cache.put(key, size, mtime_ns, extension)
+        return extension
+
+
+    def classify(self, entries: Iterable[FileEntry]) -> dict[str, str]:
+        """
+        Find the types of files, reading them in a thread pool. The cache is not
+        stored, see `save`.
+
+        :param entries: The files to classify.
+        :return: The path of each file with a known type and the extension of the type.
+        """
+        entries = list(entries)
+        if not entries:
+            return {}
+
+        if self.max_workers == 1 or len(entries) == 1:
+            extensions = [self.classify_file(entry) for entry in entries]
+        else:
+            extensions = list(self._pool().map(self.classify_file, entries))
+
+        return {
+            os.path.join(entry.parent, entry.name): extension
+            for entry, extension in zip(entries, extensions) if extension
+        }
+
+
+def classifier_from_environment(state_directory: Optional[str]) -> Optional[ContentClassifier]:
+    """
+    Create the classifier when the environment enables it:
+        FILE_ORGANIZER_SNIFF_CONTENT    "1" to classify the uncategorized files by their content
+    The cache is kept in the state directory.
+    """
+    if os.environ.get("FILE_ORGANIZER_SNIFF_CONTENT") != "1":
+        return None
+    return ContentClassifier(cache_path=os.path.join(state_directory, CACHE_FILENAME) if state_directory else None)
@@ -0,0 +1,245 @@
+"""
+Module to watch the configured directories and organize new files as soon as they arrive.
+
+Only the main directory of each active config is watched, for files that finished
+being written (or were moved in). Events are debounced, so a burst of new files is
+organized with a single plan per directory.
+
+    Backends
+    --------------------------------------------------------------------
+    - `InotifyBackend`: Linux inotify through ctypes, idle waits cost no CPU.
+    - `PollingBackend`: Pure python fallback that lists the directories periodically.
+"""
+
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+import logging
+import threading
+from typing import Optional
+
+from models import Config
+from file_organizer import FileOrganizer
+
+
+LOG = logging.getLogger(__name__)
+
+
+# inotify event masks (see inotify(7))
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class InotifyBackend:
+    """
+    Watches directories with Linux inotify.
+
+    `poll` yields `(directory, filename)` events, the filename is None when
+    the kernel queue overflowed and the whole directory has to be checked.
+    """
+
+    def __init__(self, directories: list[str]) -> None:
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.watches: dict[int, str] = {}
+        for directory in directories:
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO)
+            if wd < 0:
+                LOG.error(f"Error watching directory {directory}: {os.strerror(ctypes.get_errno())}")
+                continue
+            self.watches[wd] = directory
+
+
+    @staticmethod
+    def available() -> bool:
+        """Check if inotify can be used on this system."""
+        if not sys.platform.startswith("linux"):
+            return False
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6")
+            return hasattr(libc, "inotify_init1")
+        except OSError:
+            return False
+
+
+    def poll(self, timeout: float) -> list[tuple[str, Optional[str]]]:
+        """Wait up to `timeout` seconds for events."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(buffer, offset)
+            name = buffer[offset + INOTIFY_EVENT.size: offset + INOTIFY_EVENT.size + length].rstrip(b"\0")
+            offset += INOTIFY_EVENT.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                LOG.warning("Watch event queue overflowed, checking all the directories")
+                events.extend((directory, None) for directory in self.watches.values())
+                continue
+            if mask & IN_ISDIR or wd not in self.watches:
+                continue
+            events.append((self.watches[wd], os.fsdecode(name)))
+        return events
+
+
+    def close(self):
+        """Close the inotify file descriptor."""
+        os.close(self.fd)
+
+
+class PollingBackend:
+    """
+    Watches directories by listing them every `interval` seconds.
+
+    A file is reported once it's seen with the same size and mtime in two
+    consecutive listings, so files that are still being written are not reported.
+    """
+
+    def __init__(self, directories: list[str], interval: float = 1.0) -> None:
+        self.directories = directories
+        self.interval = interval
+        self.snapshots: dict[str, dict[str, tuple[int, int]]] = {directory: {} for directory in directories}
+        self.reported: dict[str, set[tuple[str, int, int]]] = {directory: set() for directory in directories}
+        self.next_poll = time.monotonic()
+
+
+    def _snapshot(self, directory: str) -> dict[str, tuple[int, int]]:
+        """List the files of a directory with their size and mtime."""
+        snapshot = {}
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        if entry.is_file():
+                            file_stat = entry.stat()
+                            snapshot[entry.name] = (file_stat.st_size, file_stat.st_mtime_ns)
+                    except OSError:
+                        continue
+        except OSError as e:
+            LOG.error(f"Error reading directory {directory}: {e}")
+        return snapshot
+
+
+    def poll(self, timeout: float) -> list[tuple[str, Optional[str]]]:
+        """Wait up to `timeout` seconds for the next listing and report the stable new files."""
+        wait_time = self.next_poll - time.monotonic()
+        if wait_time > timeout:
+            time.sleep(timeout)
+            return []
+        if wait_time > 0:
+            time.sleep(wait_time)
+        self.next_poll = time.monotonic() + self.interval
+
+        events = []
+        for directory in self.directories:
+            previous = self.snapshots[directory]
+            current = self._snapshot(directory)
+            reported = set()
+            for name, signature in current.items():
+                key = (name, *signature)
+                if key in self.reported[directory]:
+                    reported.add(key)
+                elif previous.get(name) == signature:
+                    events.append((directory, name))
+                    reported.add(key)
+            self.snapshots[directory] = current
+            self.reported[directory] = reported
+        return events
+
+
+    def close(self):
+        pass
+
+
+class Watcher:
+    """
+    Organizes the new files of the watched configs as they arrive.
+
+    Attributes:
+        organizer (FileOrganizer): The organizer that moves the files.
+        configs (dict[str, Config]): The watched configs by directory.
+        debounce (float): Seconds without new events before a burst is organized.
+    """
+
+    IDLE_TIMEOUT = 1.0
+
+    def __init__(self, organizer: FileOrganizer, configs: list[Config], debounce: float = 0.5, backend=None) -> None:
+        self.organizer = organizer
+        self.configs = {config.directory: config for config in configs if config.active}
+        self.debounce = debounce
+
+        directories = list(self.configs)
+        if backend is not None:
+            self.backend = backend
+        elif InotifyBackend.available():
+            self.backend = InotifyBackend(directories)
+        else:
+            LOG.info("inotify is not available, falling back to polling")
+            self.backend = PollingBackend(directories)
+
+        # directory -> filenames (None means the whole directory)
+        self.pending: dict[str, Optional[set[str]]] = {}
+        self.last_event = 0.0
+
+
+    def _add_events(self, events: list[tuple[str, Optional[str]]]):
+        """Add events to the pending burst."""
+        for directory, filename in events:
+            if filename is None:
+                self.pending[directory] = None
+            elif self.pending.get(directory, set()) is not None:
+                self.pending.setdefault(directory, set()).add(filename)
+        if events:
+            self.last_event = time.monotonic()
+
+
+    def flush(self):
+        """Organize the files of the pending burst."""
+        pending, self.pending = self.pending, {}
+        for directory, filenames in pending.items():
+            config = self.configs.get(directory)
+            if not config:
+                continue
+            try:
+                self.organizer.organize_files(config, filenames)
+            except Exception as e:
+                LOG.error(f"Error organizing new files in {directory}: {e}")
+
+
+    def run(self, stop_event: Optional[threading.Event] = None):
+        """
+        Watch until `stop_event` is set (or forever).
+
+        Existing files in the main directories are organized first.
+        """
+        stop_event = stop_event or threading.Event()
+        self._add_events([(directory, None) for directory in self.configs])
+        try:
+            while not stop_event.is_set():
+                timeout = self.debounce if self.pending else self.IDLE_TIMEOUT
+                self._add_events(self.backend.poll(timeout))
+                if self.pending and time.monotonic() - self.last_event >= self.debounce:
+                    self.flush()
+        finally:
+            self.backend.close()
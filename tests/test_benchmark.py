@@ -0,0 +1,49 @@
+import os
+from unittest import TestCase
+from benchmark import PHASES, CallCounter, Workload, check_regressions, run_suite
+
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), "..", "config", "template.json")
+
+
+class TestBenchmark(TestCase):
+
+
+    def test_run_suite(self):
+        run = run_suite([Workload("tiny", 50, extension_skew=1.0, depth=2)], template_path=TEMPLATE_PATH, routing_names=1000)
+
+        result = run["results"]["tiny"]
+        self.assertEqual(list(result["phases"]), PHASES)
+        # Half of the files start nested in the categories and are renamed twice
+        self.assertEqual(result["phases"]["reset"]["calls"]["rename"], 25)
+        self.assertEqual(result["phases"]["categorize"]["calls"]["rename"], 50)
+
+        self.assertEqual(run["routing"]["names"], 1000)
+        self.assertGreater(run["routing"]["names_per_second"], 0)
+
+
+    def test_call_counter_restores_os(self):
+        stat = os.stat
+        with CallCounter(["stat"]) as counter:
+            os.stat(".")
+        self.assertEqual(counter.counts["stat"], 1)
+        self.assertIs(os.stat, stat)
+
+
+    def test_check_regressions(self):
+        def run(ns):
+            return {"results": {"flat": {"phases": {"reset": {"ns": ns}, "validate": {"ns": 10}}}}}
+
+        baseline = run(100_000_000)
+        self.assertEqual(check_regressions(run(110_000_000), baseline, threshold=0.25), [])
+
+        regressions = check_regressions(run(200_000_000), baseline, threshold=0.25)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("flat/reset"))
+
+        # The routing benchmark regresses when it places fewer names per second
+        baseline["routing"] = {"names_per_second": 1_000_000}
+        self.assertEqual(check_regressions({**run(100_000_000), "routing": {"names_per_second": 900_000}}, baseline), [])
+        regressions = check_regressions({**run(100_000_000), "routing": {"names_per_second": 500_000}}, baseline)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("routing"))
@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from models import Category, Config, Schedule
+from app_context import AppContext, BACKEND_SQLITE
+from config_db_service import ConfigDatabaseService
+from config_service import ConfigFileService
+
+
+def _config(directory: str) -> Config:
+    return Config(
+        directory=directory,
+        categories=[Category(name="Documents", extensions=[".doc", ".pdf"], categorize_extensions=True)],
+        schedule=Schedule(active=True, type="HOUR", interval=5)
+    )
+
+
+class TestConfigDatabaseService(TestCase):
+
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "configs.db")
+        self.service = ConfigDatabaseService(self.path)
+
+
+    def tearDown(self) -> None:
+        self.service.close()
+        shutil.rmtree(self.temp_dir)
+
+
+    def test_crud(self):
+        self.service.create_config(_config("/home/b"))
+        self.service.create_config(_config("/home/a"))
+        with self.assertRaises(ValueError):
+            self.service.create_config(_config("/home/a"))
+
+        self.assertEqual([config.directory for config in self.service.get_configs()], ["/home/a", "/home/b"])
+
+        updated = _config("/home/a")
+        updated.active = False
+        self.service.update_config(directory="/home/a", config=updated)
+        self.assertFalse(self.service.get_config("/home/a").active)
+
+        self.service.delete_config("/home/a")
+        self.assertIsNone(self.service.get_config("/home/a"))
+        with self.assertRaises(ValueError):
+            self.service.delete_config("/home/a")
+        with self.assertRaises(ValueError):
+            self.service.update_config(directory="/home/a", config=updated)
+
+        # Everything is in the database
+        reopened = ConfigDatabaseService(self.path)
+        self.addCleanup(reopened.close)
+        self.assertEqual([config.directory for config in reopened.get_configs()], ["/home/b"])
+        self.assertEqual(reopened.get_config("/home/b").schedule, Schedule(active=True, type="HOUR", interval=5))
+
+
+    def test_update_config_directory(self):
+        self.service.create_config(_config("/home/a"))
+        self.service.create_config(_config("/home/c"))
+        with self.assertRaises(ValueError):
+            self.service.update_config(directory="/home/a", config=_config("/home/c"))
+
+        # The config moves to its new directory, in the index and in the database
+        self.service.update_config(directory="/home/a", config=_config("/home/b"))
+        self.assertIsNone(self.service.get_config("/home/a"))
+        self.assertEqual([config.directory for config in self.service.get_configs()], ["/home/b", "/home/c"])
+        self.assertEqual([config.directory for config in self.service.find_configs("/b")], ["/home/b"])
+        self.assertEqual(self.service.find_configs("/a"), [])
+
+        reopened = ConfigDatabaseService(self.path)
+        self.addCleanup(reopened.close)
+        self.assertEqual([config.directory for config in reopened.get_configs()], ["/home/b", "/home/c"])
+
+
+    def test_search_configs(self):
+        for directory in ["/home/user/docs", "/home/user/downloads", "/home/username", "/srv/data"]:
+            self.service.create_config(_config(directory))
+
+        self.assertEqual(
+            [config.directory for config in self.service.search_configs("/home/user/")],
+            ["/home/user/docs", "/home/user/downloads"]
+        )
+        self.assertEqual(len(self.service.search_configs("/home/user")), 3)
+        self.assertEqual(len(self.service.search_configs("")), 4)
+        self.assertEqual(self.service.search_configs("/tmp"), [])
+
+        self.assertEqual([config.directory for config in self.service.find_configs("DOWN")], ["/home/user/downloads"])
+        self.service.delete_config("/home/user/downloads")
+        self.assertEqual(self.service.find_configs("down"), [])
+        self.assertEqual(len(self.service.find_configs("user")), 2)
+
+
+    def test_changes_of_other_connections(self):
+        other = ConfigDatabaseService(self.path)
+        self.addCleanup(other.close)
+        self.assertEqual(self.service.get_configs(), [])
+
+        other.create_config(_config("/home/a"))
+        self.assertIsNotNone(self.service.get_config("/home/a"))
+
+
+    def test_import_config_files(self):
+        configs_directory = os.path.join(self.temp_dir, "configs")
+        os.makedirs(configs_directory)
+        files = ConfigFileService(configs_directory)
+        files.create_config(_config("/home/a"))
+        files.create_config(_config("/home/b"))
+        self.service.create_config(_config("/home/b"))
+
+        # Configs already in the database are kept
+        self.assertEqual(self.service.import_config_files(configs_directory), 1)
+        self.assertEqual([config.directory for config in self.service.get_configs()], ["/home/a", "/home/b"])
+
+        # A new sqlite backend imports the files once
+        service = AppContext.create_service(BACKEND_SQLITE, configs_directory, os.path.join(self.temp_dir, "new.db"))
+        self.addCleanup(service.close)
+        self.assertEqual(len(service.get_configs()), 2)
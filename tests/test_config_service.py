@@ -1,7 +1,7 @@
 import json
 import os
 import shutil
-from unittest import TestCase
+from unittest import TestCase, mock
 from models import Category, Config, Schedule
 from config_service import ConfigFileService
 
@@ -154,6 +154,25 @@ class TestConfigService(TestCase):
         self._assert_configs_equals(actual=updated_config, expected=config)
     
 
+    def test_update_config_directory(self):
+        config = self.service.get_config(directory="/home/test1")
+        moved = Config.from_dict({**config.to_dict(), "directory": "/home/moved"})
+        with self.assertRaises(ValueError):
+            self.service.update_config(directory="/home/test1", config=Config.from_dict({**config.to_dict(), "directory": "/home/test2"}))
+
+        # The config moves to its new directory, in the index and on disk
+        self.service.update_config(directory="/home/test1", config=moved)
+        self.assertIsNone(self.service.get_config("/home/test1"))
+        self._assert_configs_equals(actual=self.service.get_config("/home/moved"), expected=moved)
+        self.assertEqual([config.directory for config in self.service.find_configs("moved")], ["/home/moved"])
+        self.assertEqual(self.service.find_configs("test1"), [])
+        self.assertFalse(os.path.exists(os.path.join(self.mock_dir, f"{config.dir_to_filename()}.json")))
+
+        reloaded = ConfigFileService(self.mock_dir)
+        self.assertIsNone(reloaded.get_config("/home/test1"))
+        self.assertEqual(reloaded.get_config("/home/moved").directory, "/home/moved")
+
+
     def test_delete_config(self):
         
         # 1. fetch the config and check if it exists
@@ -169,4 +188,89 @@ class TestConfigService(TestCase):
 
         # 4. Ensure that the json file is removed
         expected_filepath = os.path.join(self.mock_dir, f"{exists_config.dir_to_filename()}.json")
-        self.assertFalse(os.path.exists(expected_filepath))
\ No newline at end of file
+        self.assertFalse(os.path.exists(expected_filepath))
+    
+
+    def test_lazy_reload_of_changed_files(self):
+        # Nothing is read before the first access
+        with mock.patch("config_service.json.load", wraps=json.load) as load:
+            service = ConfigFileService(self.mock_dir, reload_interval=0)
+            self.assertEqual(load.call_count, 0)
+            service.get_configs()
+            self.assertEqual(load.call_count, len(MOCK_CONFIGS))
+
+            # Unchanged files aren't parsed again
+            service.get_configs()
+            self.assertEqual(load.call_count, len(MOCK_CONFIGS))
+
+            # An edited file is parsed again
+            edited = dict(MOCK_CONFIGS[0], active=False)
+            with open(os.path.join(self.mock_dir, "_home_test1.json"), 'w') as f:
+                json.dump(edited, f)
+            self.assertFalse(service.get_config("/home/test1").active)
+            self.assertEqual(load.call_count, len(MOCK_CONFIGS) + 1)
+
+        # A deleted file drops its config
+        os.remove(os.path.join(self.mock_dir, "_home_test2.json"))
+        self.assertIsNone(service.get_config("/home/test2"))
+        self.assertEqual([config.directory for config in service.get_configs()], ["/home/test1"])
+
+
+    def test_sorted_index(self):
+        for directory in ["/home/b", "/home/a", "/home/test15"]:
+            self.service.create_config(Config(directory=directory, categories=[Category(name="A", extensions=[".a"])], schedule=Schedule(active=False)))
+        self.service.delete_config("/home/test2")
+
+        directories = [config.directory for config in self.service.get_configs()]
+        self.assertEqual(directories, ["/home/a", "/home/b", "/home/test1", "/home/test15"])
+        self.assertEqual([config.directory for config in self.service.search_configs("/home/test")], ["/home/test1", "/home/test15"])
+
+
+    def test_find_configs(self):
+        self.service.create_config(Config(directory="/home/Test15", categories=[Category(name="A", extensions=[".a"])], schedule=Schedule(active=False)))
+        self.assertEqual([config.directory for config in self.service.find_configs("TEST1")], ["/home/test1", "/home/Test15"])
+        self.assertEqual([config.directory for config in self.service.find_configs("t2")], ["/home/test2"])
+
+        self.service.delete_config("/home/test1")
+        self.assertEqual([config.directory for config in self.service.find_configs("test1")], ["/home/Test15"])
+
+
+    def test_writes_of_other_services(self):
+        # The service of another process (like the daemon) checks the directory rarely
+        other = ConfigFileService(self.mock_dir, reload_interval=3600)
+        self.assertIsNotNone(other.get_config("/home/test2"))
+
+        # It sees the writes of this service right away through the generation counter
+        self.service.delete_config("/home/test2")
+        self.assertIsNone(other.get_config("/home/test2"))
+
+        config = self.service.get_config("/home/test1")
+        config.active = False
+        self.service.update_config(directory=config.directory, config=config)
+        self.assertFalse(other.get_config("/home/test1").active)
+
+        # A create of a config the other service already created fails
+        new_config = Config(directory="/home/new", categories=[Category(name="A", extensions=[".a"])], schedule=Schedule(active=False))
+        other.create_config(new_config)
+        with self.assertRaises(ValueError):
+            self.service.create_config(new_config)
+
+
+    def test_atomic_write(self):
+        config = self.service.get_config(directory="/home/test1")
+        config_path = os.path.join(self.mock_dir, "_home_test1.json")
+        with open(config_path) as f:
+            content = f.read()
+
+        # A write that fails before the rename leaves the old file (and no temporary file)
+        config.active = False
+        with mock.patch("config_service.os.replace", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                self.service.update_config(directory=config.directory, config=config)
+        with open(config_path) as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(sorted(name for name in os.listdir(self.mock_dir) if name.endswith(".tmp")), [])
+
+        self.service.update_config(directory=config.directory, config=config)
+        with open(config_path) as f:
+            self.assertFalse(json.load(f)["active"])
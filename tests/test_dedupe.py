@@ -0,0 +1,159 @@
+import os
+import pickle
+import shutil
+import tempfile
+from unittest import TestCase, mock
+from dedupe import DuplicateFinder, DuplicateGroup, MODE_HARDLINK, PARTIAL_SIZE
+from file_organizer import FileOrganizer
+from models import Category, Config, Schedule
+
+
+class TestDuplicateFinder(TestCase):
+
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        self.directory = os.path.join(self.temp_dir, "files")
+        os.makedirs(self.directory)
+
+        large = os.urandom(3 * PARTIAL_SIZE)
+        # Same size, start and end as the large file, but a different middle
+        changed_middle = large[:PARTIAL_SIZE] + bytes(PARTIAL_SIZE) + large[-PARTIAL_SIZE:]
+        self.files = {
+            "a.one": b"same content",
+            "b.two": b"same content",
+            "c.one": b"same length!",
+            "d.one": large,
+            "e.two": large,
+            "f.one": changed_middle,
+            "g.two": b"",
+            "h.two": b"",
+        }
+        for name, content in self.files.items():
+            with open(os.path.join(self.directory, name), "wb") as f:
+                f.write(content)
+
+        self.config = Config(
+            directory=self.directory,
+            categories=[Category(name="One", extensions=[".one"]), Category(name="Two", extensions=[".two"])],
+            schedule=Schedule(active=False)
+        )
+
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_dir)
+
+
+    def _path(self, category: str, name: str) -> str:
+        return os.path.join(self.directory, category, name)
+
+
+    def test_find(self):
+        cache_path = os.path.join(self.temp_dir, "hashes.json")
+        finder = DuplicateFinder(cache_path=cache_path, max_workers=4)
+        organizer = FileOrganizer()
+        organizer.process_config(self.config)
+        entries = organizer.scan_categories(self.directory, self.config.categories, with_stats=True)
+
+        groups = finder.find(entries)
+        self.assertEqual([group.paths for group in groups], [
+            [self._path("One", "d.one"), self._path("Two", "e.two")],
+            [self._path("One", "a.one"), self._path("Two", "b.two")],
+        ])
+        self.assertEqual(groups[0].wasted_bytes(), 3 * PARTIAL_SIZE)
+        # Partial hashes of the 3 small and 3 large files, full hashes only of the 3 large ones
+        self.assertEqual(finder.reads, 9)
+
+        # The next run finds the same groups from the stored hashes
+        next_run = DuplicateFinder(cache_path=cache_path)
+        self.assertEqual(next_run.find(entries), groups)
+        self.assertEqual(next_run.reads, 0)
+
+
+    def test_process_config_hardlinks_duplicates(self):
+        organizer = FileOrganizer(deduplicator=DuplicateFinder(MODE_HARDLINK))
+        report = organizer.process_config(self.config)
+
+        self.assertEqual(report.duplicates, 2)
+        self.assertEqual(report.duplicate_bytes, 3 * PARTIAL_SIZE + len(b"same content"))
+        self.assertIn("dedupe", report.phases)
+        self.assertTrue(os.path.samefile(self._path("One", "a.one"), self._path("Two", "b.two")))
+        self.assertTrue(os.path.samefile(self._path("One", "d.one"), self._path("Two", "e.two")))
+        self.assertFalse(os.path.samefile(self._path("One", "d.one"), self._path("One", "f.one")))
+        with open(self._path("Two", "e.two"), "rb") as f:
+            self.assertEqual(f.read(), self.files["e.two"])
+
+        # Linked files are not duplicates anymore
+        self.assertEqual(organizer.process_config(self.config).duplicates, 0)
+
+
+    def test_link_keeps_files_named_like_the_temp_files(self):
+        for name in ("b.two.dedupe.tmp", "c.one.dedupe.tmp"):
+            with open(os.path.join(self.directory, name), "wb") as f:
+                f.write(b"user file")
+        group = DuplicateGroup(size=12, digest="", paths=[os.path.join(self.directory, "a.one"), os.path.join(self.directory, "b.two")])
+        missing = DuplicateGroup(size=12, digest="", paths=[os.path.join(self.directory, "missing"), os.path.join(self.directory, "c.one")])
+
+        finder = DuplicateFinder(MODE_HARDLINK)
+        self.assertEqual(finder.link(group), 12)
+        self.assertEqual(finder.link(missing), 0)
+
+        self.assertTrue(os.path.samefile(os.path.join(self.directory, "a.one"), os.path.join(self.directory, "b.two")))
+        for name in ("b.two.dedupe.tmp", "c.one.dedupe.tmp"):
+            with open(os.path.join(self.directory, name), "rb") as f:
+                self.assertEqual(f.read(), b"user file")
+        self.assertEqual(len(os.listdir(self.directory)), len(self.files) + 2)
+
+
+    def test_pickled_finder_gets_its_own_buffers(self):
+        finder = DuplicateFinder(max_workers=1)
+        organizer = FileOrganizer()
+        organizer.process_config(self.config)
+        entries = organizer.scan_categories(self.directory, self.config.categories, with_stats=True)
+        groups = finder.find(entries)
+
+        copy = pickle.loads(pickle.dumps(finder))
+        self.assertIsNot(copy.lock, finder.lock)
+        self.assertIsNone(getattr(copy._local, "buffer", None))
+        self.assertEqual(copy.find(entries), groups)
+
+
+    def test_link_skips_files_changed_since_hashed(self):
+        finder = DuplicateFinder(MODE_HARDLINK)
+        organizer = FileOrganizer()
+        organizer.process_config(self.config)
+        groups = finder.find(organizer.scan_categories(self.directory, self.config.categories, with_stats=True))
+        small = next(group for group in groups if group.size == len(b"same content"))
+
+        # Same size, new content and mtime: the edit is kept
+        with open(self._path("Two", "b.two"), "wb") as f:
+            f.write(b"edited file!")
+        os.utime(self._path("Two", "b.two"), ns=(0, 0))
+        self.assertEqual(finder.link(small), 0)
+        with open(self._path("Two", "b.two"), "rb") as f:
+            self.assertEqual(f.read(), b"edited file!")
+        self.assertFalse(os.path.samefile(self._path("One", "a.one"), self._path("Two", "b.two")))
+
+
+    def test_incremental_run_checks_only_new_files(self):
+        state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, state_dir)
+        organizer = FileOrganizer(state_directory=state_dir, deduplicator=DuplicateFinder())
+        organizer.process_config(self.config)
+        organizer.process_config(self.config, incremental=True)
+
+        # A new copy of a file of the categories, and a new unique file
+        with open(os.path.join(self.directory, "copy.two"), "wb") as f:
+            f.write(b"same length!")
+        with open(os.path.join(self.directory, "new.one"), "wb") as f:
+            f.write(b"unique")
+
+        with mock.patch.object(FileOrganizer, "scan_categories", wraps=organizer.scan_categories) as scan:
+            report = organizer.process_config(self.config, incremental=True)
+        scan.assert_not_called()
+        self.assertTrue(report.incremental)
+        # The new copy is checked against the indexed files of its size (a, b and c), the large duplicates aren't read again
+        self.assertEqual(report.duplicates, 2)
+        groups = organizer.dedupe(self.config, paths=[self._path("Two", "copy.two")])
+        self.assertIn([self._path("One", "c.one"), self._path("Two", "copy.two")], [group.paths for group in groups])
+        self.assertEqual(len(organizer.dedupe(self.config)), 3)
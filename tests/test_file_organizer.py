@@ -4,9 +4,11 @@ import unittest
 import tempfile
 import logging
 import setup
-from models import Category
-from file_organizer import FileOrganizer
+from models import Category, Config
+from file_organizer import FileOrganizer, STATUS_DONE, STATUS_INACTIVE, _directories_overlap
+from pipeline import batched
 from random import choice
+from unittest import mock
 
 
 LOG = logging.getLogger(__name__)
@@ -69,6 +71,13 @@ class TestFileOrganizer(unittest.TestCase):
         # remove the temp_dir
         shutil.rmtree(self.temp_dir)
 
+
+    def _stateful_organizer(self, **kwargs) -> FileOrganizer:
+        """An organizer with a state directory of its own, removed after the test."""
+        state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, state_dir)
+        return FileOrganizer(state_directory=state_dir, **kwargs)
+
     
 
     def test_validate_directory_existance(self):
@@ -223,4 +232,446 @@ class TestFileOrganizer(unittest.TestCase):
         
         # Check if main category directories remain intact
         self.assertTrue(os.path.exists(os.path.join(self.temp_dir, "CategoryA")))
-        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, "CategoryB")))
\ No newline at end of file
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, "CategoryB")))
+    
+
+    def test_incremental_process_config(self):
+        organizer = self._stateful_organizer()
+
+        config = Config(directory=self.temp_dir, categories=[
+            Category(name="Category1", extensions=[".one"], categorize_extensions=False),
+        ])
+        with open(os.path.join(self.temp_dir, "test1.one"), 'w') as f:
+            f.write("some content")
+
+        # First run records the layout
+        organizer.process_config(config, incremental=True)
+        self.assertFalse(organizer.layout_changed(self.temp_dir, config.categories))
+        placed_file = os.path.join(self.temp_dir, "Category1", "test1.one")
+        placed_ctime = os.stat(placed_file).st_ctime_ns
+
+        # A new file in the main directory is the only one that moves
+        with open(os.path.join(self.temp_dir, "test2.one"), 'w') as f:
+            f.write("some content")
+        organizer.process_config(config, incremental=True)
+
+        self.assertTrue(os.path.exists(placed_file))
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, "Category1", "test2.one")))
+        root_files = [f for f in os.listdir(self.temp_dir) if os.path.isfile(os.path.join(self.temp_dir, f))]
+        self.assertEqual(root_files, [])
+        # The already placed file was not moved (a rename would update its ctime)
+        self.assertEqual(os.stat(placed_file).st_ctime_ns, placed_ctime)
+
+
+    def test_incremental_relocates_on_layout_change(self):
+        organizer = self._stateful_organizer()
+
+        config = Config(directory=self.temp_dir, categories=[
+            Category(name="Category1", extensions=[".one"], categorize_extensions=False),
+        ])
+        with open(os.path.join(self.temp_dir, "test1.one"), 'w') as f:
+            f.write("some content")
+        organizer.process_config(config, incremental=True)
+
+        # Changing the layout triggers a full reset
+        config.categories[0].categorize_extensions = True
+        self.assertTrue(organizer.layout_changed(self.temp_dir, config.categories))
+        organizer.process_config(config, incremental=True)
+
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, "Category1", "one", "test1.one")))
+
+
+    def test_process_configs_parallel(self):
+        directories = [tempfile.mkdtemp() for _ in range(3)]
+        for directory in directories:
+            self.addCleanup(shutil.rmtree, directory)
+            with open(os.path.join(directory, "test1.one"), 'w') as f:
+                f.write("some content")
+
+        categories = [Category(name="Category1", extensions=[".one"], categorize_extensions=False)]
+        configs = [Config(directory=directory, categories=categories) for directory in directories]
+        configs.append(Config(directory=self.temp_dir, active=False, categories=categories))
+
+        organizer = FileOrganizer(max_workers=4, per_device_limit=2)
+        results = organizer.process_configs(configs)
+
+        # Results keep the order of the configs
+        self.assertEqual([result.directory for result in results], [config.directory for config in configs])
+        self.assertEqual([result.status for result in results], [STATUS_DONE] * 3 + [STATUS_INACTIVE])
+        for directory in directories:
+            self.assertTrue(os.path.exists(os.path.join(directory, "Category1", "test1.one")))
+
+
+    def test_directories_overlap(self):
+        self.assertTrue(_directories_overlap("/home/test", "/home/test"))
+        self.assertTrue(_directories_overlap("/home/test", "/home/test/nested"))
+        self.assertTrue(_directories_overlap("/home/test/nested", "/home/test"))
+        self.assertFalse(_directories_overlap("/home/test", "/home/test2"))
+
+
+    def test_scan_files(self):
+        os.makedirs(os.path.join(self.temp_dir, "nested", "deeper"))
+        with open(os.path.join(self.temp_dir, "nested", "deeper", "test1.one"), 'w') as f:
+            f.write("some content")
+
+        # Only the files directly inside the directory, directories are skipped
+        entries = self.organizer.scan_files(self.temp_dir)
+        self.assertEqual(len(entries), NUM_OF_FILES)
+        self.assertTrue(all(entry.size == 0 for entry in entries))
+
+        # Recursive scan with the stats of the files
+        entries = self.organizer.scan_files(self.temp_dir, recursive=True, with_stats=True)
+        self.assertEqual(len(entries), NUM_OF_FILES + 1)
+        nested = [entry for entry in entries if entry.name == "test1.one"][0]
+        self.assertEqual(nested.parent, os.path.join(self.temp_dir, "nested", "deeper"))
+        self.assertEqual(nested.size, len("some content"))
+
+
+    def test_move_file_does_not_overwrite(self):
+        destination = os.path.join(self.temp_dir, "Category1")
+        os.makedirs(destination)
+        source = os.path.join(self.temp_dir, "test1.one")
+        for path in (source, os.path.join(destination, "test1.one")):
+            with open(path, 'w') as f:
+                f.write(path)
+
+        with self.assertRaises(shutil.Error):
+            FileOrganizer._move_file(source, destination, same_device=True)
+
+        # Both files are intact
+        with open(os.path.join(destination, "test1.one")) as f:
+            self.assertEqual(f.read(), os.path.join(destination, "test1.one"))
+        self.assertTrue(os.path.exists(source))
+
+        # Moving to a new name is a rename
+        os.rename(source, os.path.join(self.temp_dir, "test2.one"))
+        FileOrganizer._move_file(os.path.join(self.temp_dir, "test2.one"), destination, same_device=True)
+        self.assertTrue(os.path.exists(os.path.join(destination, "test2.one")))
+
+
+    def test_incremental_uses_file_index(self):
+        organizer = self._stateful_organizer()
+
+        config = Config(directory=self.temp_dir, categories=[
+            Category(name="Category1", extensions=[".one"], categorize_extensions=True),
+        ])
+        with open(os.path.join(self.temp_dir, "test1.one"), 'w') as f:
+            f.write("some content")
+
+        # Full run, then an incremental run that builds the index
+        organizer.process_config(config, incremental=True)
+        organizer.process_config(config, incremental=True)
+
+        # Nothing changed: the category directories with files are not listed again
+        with mock.patch.object(organizer, "scan_files", wraps=organizer.scan_files) as scan_files:
+            organizer.process_config(config, incremental=True)
+        scanned = [call.args[0] for call in scan_files.call_args_list]
+        self.assertIn(self.temp_dir, scanned)
+        self.assertNotIn(os.path.join(self.temp_dir, "Category1"), scanned)
+        self.assertNotIn(os.path.join(self.temp_dir, "Category1", "one"), scanned)
+
+        # A file dropped in a category directory is found and moved
+        uncategorized = os.path.join(self.temp_dir, "Uncategorized")
+        with open(os.path.join(uncategorized, "test2.one"), 'w') as f:
+            f.write("some content")
+        organizer.process_config(config, incremental=True)
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, "Category1", "one", "test2.one")))
+
+
+    def _tree(self) -> list[str]:
+        return sorted(os.path.join(root, name) for root, dirs, files in os.walk(self.temp_dir) for name in dirs + files)
+
+
+    def test_dry_run(self):
+        categories = [
+            Category(name="CategoryA", extensions=[".one", ".two"], categorize_extensions=True),
+            Category(name="CategoryB", extensions=[".test"], categorize_extensions=False)
+        ]
+        config = Config(directory=self.temp_dir, categories=categories)
+
+        os.makedirs(os.path.join(self.temp_dir, "CategoryA", "one"))
+        with open(os.path.join(self.temp_dir, "CategoryA", "one", "test1.one"), 'w') as f:
+            f.write("some content")
+
+        tree = self._tree()
+        report = self.organizer.dry_run(config)
+        reset_report = self.organizer.dry_run_reset(config)
+
+        # Nothing was written
+        self.assertEqual(self._tree(), tree)
+
+        # The file in the category moves twice, the files of the main directory once
+        self.assertFalse(report.incremental)
+        self.assertEqual(report.moves, NUM_OF_FILES + 2)
+        self.assertEqual(report.bytes, (NUM_OF_FILES + 2) * len("some content"))
+        self.assertEqual(report.cross_device, 0)
+        self.assertIsNone(report.estimated_duration)
+
+        # The reset moves only the file of the category and removes both of its directories
+        self.assertEqual(reset_report.moves, 1)
+        self.assertEqual(reset_report.directories_removed, 2)
+
+        # After a real run the throughput is known
+        self.organizer.process_config(config)
+        self.assertIsNotNone(self.organizer.dry_run(config).estimated_duration)
+
+
+    def test_throughput_is_stored_once_per_run(self):
+        organizer = self._stateful_organizer()
+        config = Config(directory=self.temp_dir, categories=[
+            Category(name="Category1", extensions=FILE_EXTENSIONS, categorize_extensions=True),
+        ])
+
+        # Each phase measures the throughput, only the save at the end of the run writes it
+        with mock.patch.object(organizer.throughput, "record", wraps=organizer.throughput.record) as record, \
+                mock.patch.object(organizer.throughput, "save") as save:
+            organizer.process_config(config)
+        self.assertGreater(record.call_count, 1)
+        save.assert_called_once()
+        self.assertFalse(os.path.exists(organizer.throughput.path))
+
+        organizer.throughput.save()
+        self.assertEqual([name for name in os.listdir(organizer.state_directory) if name.endswith(".tmp")], [])
+        self.assertIsNotNone(FileOrganizer(state_directory=organizer.state_directory).throughput.files_per_second)
+
+
+    def _interrupted_run(self, organizer: FileOrganizer, config: Config, moves: int):
+        """Run a config and kill it (like a SIGINT) after `moves` moves."""
+        move_file = FileOrganizer._move_file
+        calls = []
+
+        def _move_then_die(source, destination, same_device):
+            if len(calls) == moves:
+                raise KeyboardInterrupt()
+            calls.append(source)
+            move_file(source, destination, same_device)
+
+        with mock.patch.object(FileOrganizer, "_move_file", side_effect=_move_then_die):
+            with self.assertRaises(KeyboardInterrupt):
+                organizer.process_config(config)
+
+
+    def test_recover_resumes_interrupted_run(self):
+        organizer = self._stateful_organizer()
+        config = Config(directory=self.temp_dir, categories=[
+            Category(name="Category1", extensions=FILE_EXTENSIONS, categorize_extensions=True),
+        ])
+
+        self._interrupted_run(organizer, config, moves=NUM_OF_FILES // 2)
+        self.assertTrue(organizer.has_interrupted_run(self.temp_dir))
+
+        # The remaining moves are done and the run is complete
+        self.assertTrue(organizer.recover(config))
+        self.assertFalse(organizer.has_interrupted_run(self.temp_dir))
+        self.assertEqual([entry.name for entry in os.scandir(self.temp_dir) if entry.is_file()], [])
+        self.assertFalse(organizer.layout_changed(self.temp_dir, config.categories))
+        self.assertFalse(organizer.recover(config))
+
+
+    def test_recover_resumes_interrupted_stream(self):
+        organizer = self._stateful_organizer()
+        config = Config(directory=self.temp_dir, categories=[
+            Category(name="Category1", extensions=FILE_EXTENSIONS, categorize_extensions=True),
+        ])
+
+        # In batches of 10, the run dies before the last files were scanned and journaled
+        with mock.patch("file_organizer.batched", side_effect=lambda items: batched(items, 10)):
+            self._interrupted_run(organizer, config, moves=NUM_OF_FILES // 2)
+
+        self.assertTrue(organizer.recover(config))
+        self.assertEqual([entry.name for entry in os.scandir(self.temp_dir) if entry.is_file()], [])
+        self.assertFalse(organizer.layout_changed(self.temp_dir, config.categories))
+
+
+    def test_recover_rollback(self):
+        organizer = self._stateful_organizer()
+        config = Config(directory=self.temp_dir, categories=[
+            Category(name="Category1", extensions=FILE_EXTENSIONS, categorize_extensions=True),
+        ])
+        files = sorted(os.listdir(self.temp_dir))
+
+        self._interrupted_run(organizer, config, moves=NUM_OF_FILES // 2)
+
+        # The moved files are back in the main directory
+        self.assertTrue(organizer.recover(config, rollback=True))
+        self.assertFalse(organizer.has_interrupted_run(self.temp_dir))
+        self.assertEqual(sorted(entry.name for entry in os.scandir(self.temp_dir) if entry.is_file()), files)
+
+
+    def test_recover_rollback_after_reset(self):
+        organizer = self._stateful_organizer()
+        config = Config(directory=self.temp_dir, categories=[
+            Category(name="Pics", extensions=FILE_EXTENSIONS, categorize_extensions=True),
+        ])
+        os.makedirs(os.path.join(self.temp_dir, "Pics"))
+        for i in range(10):
+            with open(os.path.join(self.temp_dir, "Pics", f"pic{i}.jpg"), 'w') as f:
+                f.write("some content")
+        tree = self._tree()
+
+        # The reset moves the pictures to the main directory, the run dies near the end of the categorize
+        self._interrupted_run(organizer, config, moves=10 + NUM_OF_FILES)
+
+        # The categorize is rolled back before the reset, so the pictures are back in their category
+        self.assertTrue(organizer.recover(config, rollback=True))
+        self.assertEqual(self._tree(), tree)
+
+
+    def test_recover_resumes_interrupted_reset(self):
+        organizer = self._stateful_organizer()
+        config = Config(directory=self.temp_dir, categories=[
+            Category(name="Pics", extensions=FILE_EXTENSIONS, categorize_extensions=True),
+        ])
+        os.makedirs(os.path.join(self.temp_dir, "Pics", "old"))
+        for i in range(10):
+            with open(os.path.join(self.temp_dir, "Pics", "old", f"pic{i}.jpg"), 'w') as f:
+                f.write("some content")
+
+        # In batches of 3, the run dies before the last pictures were scanned and journaled
+        with mock.patch("file_organizer.batched", side_effect=lambda items: batched(items, 3)):
+            self._interrupted_run(organizer, config, moves=5)
+
+        # The reset is finished and the files are categorized
+        self.assertTrue(organizer.recover(config))
+        self.assertFalse(organizer.has_interrupted_run(self.temp_dir))
+        self.assertEqual([entry.name for entry in os.scandir(self.temp_dir) if entry.is_file()], [])
+        self.assertLessEqual({f"pic{i}.jpg" for i in range(10)}, set(os.listdir(os.path.join(self.temp_dir, "Pics", "jpg"))))
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir, "Pics", "old")))
+        self.assertFalse(organizer.layout_changed(self.temp_dir, config.categories))
+
+
+    def test_undo(self):
+        organizer = self._stateful_organizer()
+        config = Config(directory=self.temp_dir, categories=[
+            Category(name="Category1", extensions=FILE_EXTENSIONS[:20], categorize_extensions=True),
+        ])
+        tree = self._tree()
+
+        organizer.process_config(config)
+        organized = self._tree()
+
+        # A second run with another layout, then both are undone one at a time
+        config.categories[0].categorize_extensions = False
+        organizer.process_config(config)
+        self.assertNotEqual(self._tree(), organized)
+
+        self.assertGreater(organizer.undo(config), 0)
+        self.assertEqual(self._tree(), organized)
+        self.assertEqual(organizer.undo(config), NUM_OF_FILES)
+        self.assertEqual(self._tree(), tree)
+
+        # Nothing left to undo
+        self.assertEqual(organizer.undo(config), 0)
+
+
+    def test_undo_keeps_failed_moves(self):
+        organizer = self._stateful_organizer()
+        config = Config(directory=self.temp_dir, categories=[
+            Category(name="Category1", extensions=FILE_EXTENSIONS, categorize_extensions=False),
+        ])
+        tree = self._tree()
+        organizer.process_config(config)
+        stuck = os.path.join(self.temp_dir, "Category1", sorted(os.listdir(os.path.join(self.temp_dir, "Category1")))[0])
+
+        move_file = FileOrganizer._move_file
+
+        def _fail_one(source, destination, same_device):
+            if source == stuck:
+                raise PermissionError("denied")
+            move_file(source, destination, same_device)
+
+        # The move that failed stays in the log
+        with mock.patch.object(FileOrganizer, "_move_file", side_effect=_fail_one):
+            self.assertEqual(organizer.undo(config), NUM_OF_FILES - 1)
+        self.assertTrue(os.path.exists(stuck))
+
+        # And is undone by the next undo
+        self.assertEqual(organizer.undo(config), 1)
+        self.assertEqual(self._tree(), tree)
+        self.assertEqual(organizer.undo(config), 0)
+
+
+    def test_execute_plan_logs_summary(self):
+        categories = [Category(name="Category1", extensions=FILE_EXTENSIONS, categorize_extensions=False)]
+        self.organizer.create_categories(self.temp_dir, categories)
+
+        # One summary per plan, the files are only logged in verbose mode
+        with self.assertLogs("file_organizer", level=logging.INFO) as logs:
+            self.organizer.categorize_files(self.temp_dir, categories)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn(f"moved {NUM_OF_FILES} files", logs.output[0])
+
+        self.organizer.reset_directory(self.temp_dir, categories)
+        with self.assertLogs("file_organizer", level=logging.DEBUG) as logs:
+            self.organizer.categorize_files(self.temp_dir, categories)
+        self.assertEqual(len([line for line in logs.output if "Moved " in line]), NUM_OF_FILES)
+
+
+    def test_process_config_report(self):
+        phases = []
+
+        class PhaseHook:
+            def on_phase(self, report, phase, seconds):
+                phases.append(phase)
+
+        class FailingHook:
+            def on_report(self, report):
+                raise RuntimeError("exporter is down")
+
+        organizer = self._stateful_organizer(hooks=[PhaseHook(), FailingHook()])
+        config = Config(directory=self.temp_dir, categories=[
+            Category(name="Category1", extensions=FILE_EXTENSIONS, categorize_extensions=True),
+        ])
+
+        # A failing hook doesn't fail the run
+        report = organizer.process_config(config)
+        self.assertEqual(report.status, STATUS_DONE)
+        self.assertEqual(report.files_moved, NUM_OF_FILES)
+        self.assertEqual(report.files_scanned, NUM_OF_FILES)
+        self.assertEqual(report.errors, 0)
+        self.assertEqual(list(report.phases), ["validate", "recover", "reset", "categorize", "cleanup"])
+        self.assertEqual(phases, list(report.phases))
+
+        # Nothing moves on the next run, the files are listed and skipped
+        report = organizer.process_config(config, incremental=True)
+        self.assertTrue(report.incremental)
+        self.assertEqual(report.files_moved, 0)
+        self.assertEqual(report.files_skipped, report.files_scanned)
+        self.assertEqual(organizer.last_report(self.temp_dir), report)
+
+
+    def test_process_config_creates_only_destinations(self):
+        config = Config(directory=self.temp_dir, categories=[
+            Category(name="Category1", extensions=[".one", ".two", ".three"], categorize_extensions=True),
+            Category(name="Category2", extensions=[".test"], categorize_extensions=False),
+        ])
+        os.makedirs(os.path.join(self.temp_dir, "Category2"))
+        with open(os.path.join(self.temp_dir, "test1.one"), 'w') as f:
+            f.write("some content")
+
+        self.organizer.process_config(config)
+
+        # Only the directories that got files exist, the empty category is removed
+        self.assertTrue(os.path.isdir(os.path.join(self.temp_dir, "Category1", "one")))
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir, "Category1", "two")))
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir, "Category2")))
+
+
+    def test_remove_empty_directories(self):
+        os.makedirs(os.path.join(self.temp_dir, "A", "one"))
+        os.makedirs(os.path.join(self.temp_dir, "A", "two"))
+        os.makedirs(os.path.join(self.temp_dir, "B", "one"))
+        with open(os.path.join(self.temp_dir, "B", "test.one"), 'w') as f:
+            f.write("some content")
+
+        removed = FileOrganizer.remove_empty_directories(self.temp_dir, [
+            os.path.join(self.temp_dir, "A", "one"),
+            os.path.join(self.temp_dir, "A", "two"),
+            os.path.join(self.temp_dir, "B", "one"),
+            os.path.join(self.temp_dir, "missing"),
+        ])
+
+        # The emptied parents are removed too, the main directory and non-empty ones stay
+        self.assertEqual(sorted(removed), sorted(os.path.join(self.temp_dir, *parts) for parts in [("A",), ("A", "one"), ("A", "two"), ("B", "one")]))
+        self.assertTrue(os.path.isdir(os.path.join(self.temp_dir, "B")))
+        self.assertTrue(os.path.isdir(self.temp_dir))
@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from move_log import MoveLog, MoveLogRun
+from move_plan import MoveAction
+from routing import REASON_CATEGORY
+
+
+class TestMoveLog(TestCase):
+
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        self.log = MoveLog(os.path.join(self.temp_dir, "moves"), max_runs=2)
+
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_dir)
+
+
+    def _write_run(self, names: list[str]) -> str:
+        writer = self.log.start_run()
+        for name in names:
+            writer.record(MoveAction(source=os.path.join("/home/test", name), destination="/home/test/Category1", reason=REASON_CATEGORY))
+        writer.close()
+        return writer.path
+
+
+    def test_round_trip(self):
+        names = ["a.one", "b.two", "caf\udce9.one"]
+        path = self._write_run(names)
+
+        run = MoveLogRun(path)
+        self.assertEqual(len(run), 3)
+        # Each directory is written once
+        self.assertEqual(run.directories, ["/home/test", "/home/test/Category1"])
+
+        actions = list(run.reversed_actions())
+        self.assertEqual([os.path.basename(action.source) for action in actions], names[::-1])
+        self.assertEqual(actions[0].source, os.path.join("/home/test/Category1", names[-1]))
+        self.assertEqual(actions[0].destination, "/home/test")
+
+
+    def test_truncated_log(self):
+        path = self._write_run(["a.one", "b.two"])
+        with open(path, "r+b") as f:
+            f.truncate(os.path.getsize(path) - 2)
+
+        self.assertEqual(len(MoveLogRun(path)), 1)
+
+
+    def test_runs(self):
+        # A run without moves leaves no log
+        self._write_run([])
+        self.assertEqual(self.log.runs(), [])
+
+        first = self._write_run(["a.one"])
+        second = self._write_run(["b.one"])
+        third = self._write_run(["c.one"])
+
+        # Only the last runs are kept, the latest is read first
+        self.assertEqual(self.log.runs(), [second, third])
+        self.assertEqual([run.path for run in self.log.last_runs(5)], [third, second])
+        self.assertFalse(os.path.exists(first))
@@ -0,0 +1,202 @@
+import os
+from unittest import TestCase
+from models import Category, Rule
+from routing import NANOSECONDS_PER_DAY, REASON_CATEGORY, REASON_HIDDEN, REASON_UNCATEGORIZED, RoutingTable, RuleMatcher, compile_routing, layout_signature
+from move_plan import CompactMovePlan, FileEntry, MoveAction, MovePlanner, REASON_MISPLACED
+
+
+DIRECTORY = "/home/test"
+
+
+class TestMovePlanner(TestCase):
+
+
+    def setUp(self) -> None:
+        categories = [
+            Category(name="Category1", extensions=[".one", ".two"], categorize_extensions=True),
+            Category(name="Category2", extensions=[".test"], categorize_extensions=False),
+        ]
+        self.planner = MovePlanner(DIRECTORY, categories)
+
+
+    def test_target(self):
+        self.assertEqual(self.planner.target("a.one"), (os.path.join(DIRECTORY, "Category1", "one"), REASON_CATEGORY))
+        self.assertEqual(self.planner.target("a.test"), (os.path.join(DIRECTORY, "Category2"), REASON_CATEGORY))
+        self.assertEqual(self.planner.target("a.other"), (os.path.join(DIRECTORY, "Uncategorized"), REASON_UNCATEGORIZED))
+        self.assertEqual(self.planner.target(".hiddenfile.txt"), (os.path.join(DIRECTORY, ".hidden"), REASON_HIDDEN))
+
+
+    def test_plan(self):
+        entries = [
+            FileEntry(parent=DIRECTORY, name="a.one", size=10, device=1),
+            FileEntry(parent=os.path.join(DIRECTORY, "Category2"), name="b.test", size=20, device=1),
+            FileEntry(parent=os.path.join(DIRECTORY, "Category2"), name="c.two", size=30, device=1),
+        ]
+
+        plan = self.planner.plan(entries)
+
+        # The file already in place is left out
+        self.assertEqual(len(plan), 2)
+        self.assertEqual(plan.total_bytes(), 40)
+
+        first, second = plan.actions
+        self.assertEqual(first.source, os.path.join(DIRECTORY, "a.one"))
+        self.assertEqual(first.destination, os.path.join(DIRECTORY, "Category1", "one"))
+        self.assertEqual(first.reason, REASON_CATEGORY)
+        self.assertEqual(second.destination, os.path.join(DIRECTORY, "Category1", "two"))
+        self.assertEqual(second.reason, REASON_MISPLACED)
+        self.assertEqual(plan.destinations(), {first.destination, second.destination})
+
+
+    def test_routing_is_cached_per_layout(self):
+        categories = [Category(name="Category1", extensions=[".one"], categorize_extensions=False)]
+
+        # Same layout: the compiled table is reused
+        table = compile_routing(DIRECTORY, categories)
+        self.assertIs(compile_routing(DIRECTORY, [Category(name="Category1", extensions=[".one"])]), table)
+
+        # Changed layout: compiled again
+        categories[0].categorize_extensions = True
+        changed = compile_routing(DIRECTORY, categories)
+        self.assertIsNot(changed, table)
+        self.assertEqual(changed.target("a.one")[0], os.path.join(DIRECTORY, "Category1", "one"))
+
+
+    def test_routing_keeps_category_order(self):
+        reports = Category(name="Reports", rules=[Rule(type="glob", pattern="report*")])
+        texts = Category(name="Texts", rules=[Rule(type="glob", pattern="*.txt")])
+
+        # The first matching rule wins, so the order is part of the layout
+        self.assertNotEqual(layout_signature([reports, texts]), layout_signature([texts, reports]))
+        self.assertEqual(compile_routing(DIRECTORY, [reports, texts]).target("report.txt")[0], os.path.join(DIRECTORY, "Reports"))
+        self.assertEqual(compile_routing(DIRECTORY, [texts, reports]).target("report.txt")[0], os.path.join(DIRECTORY, "Texts"))
+
+
+class TestRoutingRules(TestCase):
+
+
+    def setUp(self) -> None:
+        categories = [
+            Category(name="Archives", extensions=[".gz", ".tar.gz", ".zip"], categorize_extensions=True),
+            Category(name="Images", extensions=[".jpg", ".png"], rules=[Rule(type="glob", pattern="screenshot*")]),
+            Category(name="Scripts", extensions=[".js"], rules=[Rule(type="suffix", pattern=".min.js"), Rule(type="regex", pattern=r"^\d{4}-\d{2}-\d{2}")]),
+            Category(name="Large", rules=[Rule(type="glob", pattern="*.mp4", min_size=1000)]),
+            Category(name="Old", rules=[Rule(min_age=30)]),
+        ]
+        self.routing = RoutingTable(DIRECTORY, categories)
+
+
+    def target(self, filename: str, size: int = 0, mtime_ns: int = 0) -> str:
+        return os.path.relpath(self.routing.target(filename, size, mtime_ns, now_ns=100 * NANOSECONDS_PER_DAY)[0], DIRECTORY)
+
+
+    def test_extensions(self):
+        now = 100 * NANOSECONDS_PER_DAY
+        self.assertEqual(self.target("archive.tar.gz", mtime_ns=now), os.path.join("Archives", "tar.gz"))
+        self.assertEqual(self.target("my.backup.TAR.GZ", mtime_ns=now), os.path.join("Archives", "tar.gz"))
+        self.assertEqual(self.target("notes.gz", mtime_ns=now), os.path.join("Archives", "gz"))
+        self.assertEqual(self.target("IMG_0001.JPG", mtime_ns=now), "Images")
+        self.assertEqual(self.target("noextension", mtime_ns=now), "Uncategorized")
+
+
+    def test_rules_first_match(self):
+        now = 100 * NANOSECONDS_PER_DAY
+        # Rules come before the extensions, in config order
+        self.assertEqual(self.target("Screenshot 2024.zip", mtime_ns=now), "Images")
+        self.assertEqual(self.target("app.MIN.js", mtime_ns=now), "Scripts")
+        self.assertEqual(self.target("2024-01-31 report.pdf", mtime_ns=now), "Scripts")
+        self.assertEqual(self.target("report 2024-01-31.pdf", mtime_ns=now), "Uncategorized")
+
+
+    def test_size_and_age_rules(self):
+        self.assertTrue(self.routing.needs_stats)
+        now = 100 * NANOSECONDS_PER_DAY
+        self.assertEqual(self.target("movie.mp4", size=5000, mtime_ns=now), "Large")
+        self.assertEqual(self.target("clip.mp4", size=10, mtime_ns=now), "Uncategorized")
+        # A failed limit falls through to the next rule
+        self.assertEqual(self.target("clip.mp4", size=10, mtime_ns=0), "Old")
+        self.assertEqual(self.target("a.png", mtime_ns=0), "Old")
+        self.assertEqual(self.target("a.png", mtime_ns=now), "Images")
+
+
+    def test_many_rules_compile_to_one_matcher(self):
+        rules = [Rule(type="suffix", pattern=f".ext{idx}") for idx in range(1000)]
+        rules += [Rule(type="glob", pattern=f"prefix{idx}_*") for idx in range(1000)]
+        matcher = RuleMatcher(rules)
+
+        self.assertEqual(len(matcher.suffixes), 3)
+        self.assertIsNotNone(matcher.combined)
+        self.assertEqual(matcher.match("file.EXT999"), 999)
+        self.assertEqual(matcher.match("prefix5_file.ext7"), 7)
+        self.assertEqual(matcher.match("prefix5_file.txt"), 1005)
+        self.assertIsNone(matcher.match("other.txt"))
+
+        # A regex with groups of its own is matched separately, in order
+        matcher = RuleMatcher([Rule(type="regex", pattern=r"(a)\1"), Rule(type="glob", pattern="*aa*")])
+        self.assertEqual(matcher.match("xaay"), 0)
+        self.assertEqual(len(matcher.separate), 1)
+
+
+    def test_invalid_rule_is_skipped(self):
+        # Compiles on its own, but not inside the routing regex
+        rule = Rule(type="regex", pattern="(?i)^report")
+        self.assertFalse(rule.is_valid())
+
+        routing = RoutingTable(DIRECTORY, [
+            Category(name="Reports", rules=[rule]),
+            Category(name="Texts", extensions=[".txt"], rules=[Rule(type="glob", pattern="notes*")]),
+        ])
+        self.assertEqual(routing.target("report.txt")[0], os.path.join(DIRECTORY, "Texts"))
+        self.assertEqual(routing.target("notes.md")[0], os.path.join(DIRECTORY, "Texts"))
+
+
+class TestCompactMovePlan(TestCase):
+
+
+    def setUp(self) -> None:
+        self.actions = [
+            MoveAction(os.path.join(DIRECTORY, "a.one"), os.path.join(DIRECTORY, "Category1", "one"), REASON_CATEGORY, 10, 1),
+            MoveAction(os.path.join(DIRECTORY, "caf\udce9.two"), os.path.join(DIRECTORY, "Category1", "two"), REASON_CATEGORY, 0, 1),
+            MoveAction(os.path.join(DIRECTORY, "Category2", "c.one"), os.path.join(DIRECTORY, "Category1", "one"), REASON_MISPLACED, 30, 2),
+        ]
+        self.plan = CompactMovePlan(DIRECTORY, scanned=5)
+        for action in self.actions:
+            self.plan.append(action)
+
+
+    def test_round_trip(self):
+        self.assertEqual(len(self.plan), 3)
+        self.assertEqual(list(self.plan), self.actions)
+        self.assertEqual(self.plan.total_bytes(), 40)
+        self.assertEqual(self.plan.destinations(), {action.destination for action in self.actions})
+        # Each directory is kept once
+        self.assertEqual(len(self.plan.directories), 4)
+
+        loaded = CompactMovePlan.from_bytes(self.plan.to_bytes())
+        self.assertEqual(list(loaded), self.actions)
+        self.assertEqual(loaded.scanned, 5)
+
+
+    def test_filters(self):
+        self.assertEqual(list(self.plan.with_reason(REASON_MISPLACED)), self.actions[2:])
+        self.assertEqual(list(self.plan.with_destination(os.path.join(DIRECTORY, "Category1", "one"))), [self.actions[0], self.actions[2]])
+        self.assertEqual(list(self.plan.filter(lambda action: action.size == 0)), self.actions[1:2])
+        self.assertEqual(len(self.plan.with_reason("unknown")), 0)
+
+
+    def test_diff(self):
+        other = CompactMovePlan(DIRECTORY)
+        other.append(self.actions[0])
+        other.append(MoveAction(self.actions[1].source, os.path.join(DIRECTORY, "Uncategorized"), REASON_CATEGORY))
+        self.assertEqual(list(self.plan.diff(other)), self.actions[1:])
+
+
+    def test_planner_builds_compact_plans(self):
+        planner = MovePlanner(DIRECTORY, [Category(name="Category1", extensions=[".one"])])
+        entries = [FileEntry(DIRECTORY, f"file_{idx}.one") for idx in range(10_000)]
+        plan = planner.plan(entries, compact=True)
+
+        self.assertEqual(list(plan), list(planner.plan(entries)))
+        self.assertIsNone(plan.sizes)
+        # The name plus 13 bytes of columns per move
+        self.assertLessEqual(plan.nbytes(), sum(len(entry.name) + 13 for entry in entries) + 4)
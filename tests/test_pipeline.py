@@ -0,0 +1,54 @@
+import threading
+from unittest import TestCase
+from pipeline import batched, threaded
+
+
+class TestPipeline(TestCase):
+
+
+    def test_batched(self):
+        self.assertEqual(list(batched(range(7), 3)), [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(list(batched([], 3)), [])
+
+
+    def test_threaded_is_bounded(self):
+        produced = []
+
+        def produce():
+            for idx in range(100):
+                produced.append(idx)
+                yield idx
+
+        items = threaded(produce(), maxsize=2)
+        self.assertEqual(next(items), 0)
+        # The producer waits for the consumer: at most the queue and the item being put ahead
+        threading.Event().wait(0.2)
+        self.assertLessEqual(len(produced), 4)
+        self.assertEqual(list(items), list(range(1, 100)))
+
+
+    def test_threaded_raises_producer_errors(self):
+        def produce():
+            yield 1
+            raise OSError("disk error")
+
+        items = threaded(produce())
+        self.assertEqual(next(items), 1)
+        with self.assertRaises(OSError):
+            next(items)
+
+
+    def test_consumer_stop_closes_the_stages(self):
+        closed = threading.Event()
+
+        def produce():
+            try:
+                for idx in range(1000):
+                    yield idx
+            finally:
+                closed.set()
+
+        items = threaded(batch[0] for batch in threaded(batched(produce(), 10), maxsize=1))
+        self.assertEqual(next(items), 0)
+        items.close()
+        self.assertTrue(closed.wait(1))
@@ -0,0 +1,53 @@
+import os
+import json
+import shutil
+import tempfile
+from unittest import TestCase
+from run_report import JsonLinesExporter, PrometheusTextfileExporter, RunRecorder, RunReport
+
+
+class TestRunReport(TestCase):
+
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        self.report = RunReport(directory="/home/te\"st", status="done", duration=1.5, files_moved=3, phases={"reset": 0.5})
+
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_dir)
+
+
+    def test_recorder_phases(self):
+        ticks = iter([0.0, 1.0, 5.0, 7.0])
+        recorder = RunRecorder(RunReport(directory="/home/test", status="done"), clock=lambda: next(ticks))
+
+        with recorder.phase("scan"):
+            pass
+        with recorder.phase("scan"):
+            pass
+        self.assertEqual(recorder.report.phases, {"scan": 3.0})
+
+
+    def test_json_lines_exporter(self):
+        path = os.path.join(self.temp_dir, "reports.jsonl")
+        exporter = JsonLinesExporter(path)
+        exporter.on_report(self.report)
+        exporter.on_report(self.report)
+
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(RunReport.from_dict(lines[0]), self.report)
+
+
+    def test_prometheus_exporter(self):
+        PrometheusTextfileExporter(self.temp_dir).on_report(self.report)
+
+        [filename] = os.listdir(self.temp_dir)
+        self.assertTrue(filename.endswith(".prom"))
+        with open(os.path.join(self.temp_dir, filename)) as f:
+            content = f.read()
+        self.assertIn('file_organizer_files_moved{directory="/home/te\\"st"} 3\n', content)
+        self.assertIn('file_organizer_phase_duration_seconds{directory="/home/te\\"st",phase="reset"} 0.5\n', content)
+        self.assertIn('file_organizer_run_success{directory="/home/te\\"st"} 1\n', content)
@@ -0,0 +1,122 @@
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+from models import Config, Schedule
+from file_organizer import STATUS_DONE
+from run_report import RunReport
+from scheduler import Scheduler, interval_seconds, load_schedule_states
+
+
+class MockService:
+
+    def __init__(self, configs: list[Config]) -> None:
+        self.configs = configs
+
+    def get_configs(self) -> list[Config]:
+        return self.configs
+
+
+class BlockingOrganizer:
+    """Organizer whose runs last until `release` is set."""
+
+    def __init__(self) -> None:
+        self.release = threading.Event()
+        self.started = threading.Semaphore(0)
+        self.runs = 0
+
+    def process_config(self, config: Config, incremental: bool = False) -> RunReport:
+        self.runs += 1
+        self.started.release()
+        self.release.wait(5)
+        return RunReport(directory=config.directory, status=STATUS_DONE, duration=1.5)
+
+
+class TestScheduler(TestCase):
+
+
+    def setUp(self) -> None:
+        self.state_dir = tempfile.mkdtemp()
+        self.now = 1000.0
+        self.config = Config(directory="/home/test1", schedule=Schedule(type="MINUTE", interval="2", active=True))
+        self.organizer = BlockingOrganizer()
+        self.scheduler = Scheduler(
+            organizer=self.organizer,
+            service=MockService([self.config, Config(directory="/home/test2", schedule=Schedule(active=False))]),
+            state_directory=self.state_dir,
+            max_jitter=30,
+            clock=lambda: self.now
+        )
+
+
+    def tearDown(self) -> None:
+        self.organizer.release.set()
+        self.scheduler.pool.shutdown(wait=True)
+        shutil.rmtree(self.state_dir)
+
+
+    def test_interval_seconds(self):
+        self.assertEqual(interval_seconds(Schedule(type="HOUR", interval=2, active=True)), 7200)
+        self.assertEqual(interval_seconds(Schedule(type="MINUTE", interval="3", active=True)), 180)
+        self.assertIsNone(interval_seconds(Schedule(type="MINTUTE", interval=1, active=True)))
+        self.assertIsNone(interval_seconds(Schedule(type="MINUTE", interval=0, active=True)))
+
+
+    def test_jitter_and_inactive_schedules(self):
+        self.scheduler.refresh()
+
+        # Only the active schedule, delayed by at most the max jitter
+        self.assertEqual(list(self.scheduler.states), ["/home/test1"])
+        state = self.scheduler.states["/home/test1"]
+        self.assertGreaterEqual(state.next_run, self.now)
+        self.assertLessEqual(state.next_run, self.now + 30)
+
+
+    def test_overrun_is_skipped(self):
+        self.scheduler.refresh()
+        state = self.scheduler.states["/home/test1"]
+        first_run = state.next_run
+
+        # First run starts
+        self.now = first_run
+        self.scheduler.run_pending()
+        self.assertTrue(self.organizer.started.acquire(timeout=5))
+        self.assertTrue(state.running)
+        self.assertEqual(state.next_run, first_run + 120)
+
+        # Next run is due while the first is still going: skipped
+        self.now = first_run + 120
+        self.scheduler.run_pending()
+        self.assertEqual(state.skipped, 1)
+        self.assertEqual(state.next_run, first_run + 240)
+
+        # The first run completes and its duration is saved for the CLI
+        self.organizer.release.set()
+        self.scheduler.pool.shutdown(wait=True)
+        self.assertEqual(self.organizer.runs, 1)
+        self.assertFalse(state.running)
+
+        saved = load_schedule_states(self.state_dir)["/home/test1"]
+        self.assertEqual(saved.last_duration, 1.5)
+        self.assertEqual(saved.skipped, 1)
+        self.assertEqual(saved.next_run, first_run + 240)
+
+
+    def test_overlapping_directories_are_skipped(self):
+        nested = Config(directory="/home/test1/nested", schedule=Schedule(type="MINUTE", interval="2", active=True))
+        self.scheduler.service.configs.append(nested)
+        self.scheduler.refresh()
+        state = self.scheduler.states["/home/test1"]
+        nested_state = self.scheduler.states["/home/test1/nested"]
+
+        # Both are due, only the first one runs while the other waits for the next run
+        self.now = max(state.next_run, nested_state.next_run)
+        self.scheduler.run_pending()
+        self.assertTrue(self.organizer.started.acquire(timeout=5))
+        self.assertTrue(state.running)
+        self.assertFalse(nested_state.running)
+        self.assertEqual(nested_state.skipped, 1)
+
+        self.organizer.release.set()
+        self.scheduler.pool.shutdown(wait=True)
+        self.assertEqual(self.organizer.runs, 1)
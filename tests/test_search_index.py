@@ -0,0 +1,50 @@
+import time
+import random
+from unittest import TestCase
+from search_index import SearchIndex
+
+
+class TestSearchIndex(TestCase):
+
+
+    def setUp(self) -> None:
+        self.index = SearchIndex(["/home/User/Downloads", "/home/user/docs", "/srv/data", "/home/username"])
+
+
+    def test_prefix(self):
+        self.assertEqual(self.index.prefix("/home/user/"), ["/home/user/docs", "/home/User/Downloads"])
+        self.assertEqual(self.index.prefix("/HOME/USERN"), ["/home/username"])
+        self.assertEqual(self.index.prefix("/tmp"), [])
+
+
+    def test_search(self):
+        self.assertEqual(self.index.search("DOWN"), ["/home/User/Downloads"])
+        self.assertEqual(self.index.search("do"), ["/home/user/docs", "/home/User/Downloads"])
+        self.assertEqual(self.index.search("data"), ["/srv/data"])
+        self.assertEqual(self.index.search("user/do"), ["/home/user/docs", "/home/User/Downloads"])
+        self.assertEqual(self.index.search("missing"), [])
+        self.assertEqual(len(self.index.search("")), 4)
+
+
+    def test_add_remove(self):
+        self.index.add("/mnt/downloads")
+        self.index.add("/mnt/downloads")
+        self.assertEqual(len(self.index), 5)
+        self.assertEqual(self.index.search("downloads"), ["/home/User/Downloads", "/mnt/downloads"])
+
+        self.index.remove("/home/User/Downloads")
+        self.index.remove("/not/indexed")
+        self.assertEqual(self.index.search("downloads"), ["/mnt/downloads"])
+        self.assertNotIn("/home/User/Downloads", self.index)
+
+
+    def test_search_is_fast(self):
+        rng = random.Random(0)
+        words = ["photos", "music", "work", "projects", "backup", "downloads", "archive", "videos"]
+        directories = [f"/home/user{idx}/{rng.choice(words)}/{rng.choice(words)}{idx}" for idx in range(10_000)]
+        index = SearchIndex(directories)
+
+        start_time = time.perf_counter()
+        for term in ["user123/", "archive/mus", "videos9999"]:
+            index.search(term)
+        self.assertLess((time.perf_counter() - start_time) / 3, 0.01)
@@ -0,0 +1,51 @@
+import os
+import shutil
+import logging
+import logging.handlers
+import tempfile
+from unittest import TestCase, mock
+import setup
+
+
+class TestSetupLogging(TestCase):
+
+
+    def setUp(self) -> None:
+        self.home = tempfile.mkdtemp()
+        self.root_handlers = logging.getLogger().handlers[:]
+        self.root_level = logging.getLogger().level
+
+
+    def tearDown(self) -> None:
+        setup._stop_logging()
+        root = logging.getLogger()
+        root.handlers = self.root_handlers
+        root.setLevel(self.root_level)
+        shutil.rmtree(self.home)
+
+
+    def test_logging_is_queued(self):
+        with mock.patch.dict(os.environ, {"HOME": self.home}):
+            app_directory = os.path.join(self.home, ".file-organizer")
+            setup._setup_logging(app_directory)
+
+            # The callers only enqueue, the file handlers run in the listener
+            root = logging.getLogger()
+            self.assertEqual(len(root.handlers), 1)
+            self.assertIsInstance(root.handlers[0], logging.handlers.QueueHandler)
+            self.assertEqual(root.level, logging.INFO)
+
+            logging.getLogger("test").info("queued message")
+            setup._stop_logging()
+
+            with open(os.path.join(app_directory, "logs", "info.log")) as f:
+                self.assertIn("queued message", f.read())
+
+
+    def test_verbose(self):
+        with mock.patch.dict(os.environ, {"HOME": self.home}):
+            setup._setup_logging(os.path.join(self.home, ".file-organizer"), verbose=True)
+            self.assertEqual(logging.getLogger().level, logging.DEBUG)
+
+            setup.set_verbose(False)
+            self.assertEqual(logging.getLogger().level, logging.INFO)
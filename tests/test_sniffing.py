@@ -0,0 +1,116 @@
+import os
+import pickle
+import shutil
+import tempfile
+from unittest import TestCase, mock
+from file_organizer import FileOrganizer
+from models import Category, Config, Schedule
+from move_plan import FileEntry
+from sniffing import ContentClassifier, detect_extension
+
+
+HEADERS = {
+    "report": b"%PDF-1.7\n...",
+    "photo": b"\xff\xd8\xff\xe0\x00\x10JFIF",
+    "notes.txt": b"plain text",
+    "archive.bin": b"PK\x03\x04\x14\x00",
+}
+
+
+class TestContentClassifier(TestCase):
+
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        self.directory = os.path.join(self.temp_dir, "files")
+        os.makedirs(self.directory)
+        for name, header in HEADERS.items():
+            with open(os.path.join(self.directory, name), "wb") as f:
+                f.write(header)
+
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_dir)
+
+
+    def _entries(self) -> list[FileEntry]:
+        return [FileEntry(self.directory, name) for name in sorted(HEADERS)]
+
+
+    def test_detect_extension(self):
+        self.assertEqual(detect_extension(b"%PDF-1.4"), ".pdf")
+        self.assertEqual(detect_extension(b"RIFF\x00\x00\x00\x00WEBPVP8 "), ".webp")
+        self.assertEqual(detect_extension(b"\x00\x00\x00\x18ftypmp42"), ".mp4")
+        self.assertEqual(detect_extension(b"\x00" * 257 + b"ustar\x00"), ".tar")
+        self.assertEqual(detect_extension(b"hello"), "")
+
+
+    def test_classify_reads_each_file_once(self):
+        cache_path = os.path.join(self.temp_dir, "content-types.json")
+        classifier = ContentClassifier(cache_path=cache_path, max_workers=4)
+
+        content_types = classifier.classify(self._entries())
+        self.assertEqual(content_types, {
+            os.path.join(self.directory, "archive.bin"): ".zip",
+            os.path.join(self.directory, "photo"): ".jpg",
+            os.path.join(self.directory, "report"): ".pdf",
+        })
+        self.assertEqual(classifier.reads, 4)
+
+        # Known files are not read again, also by the classifier of the next run once the cache is stored
+        classifier.classify(self._entries())
+        self.assertEqual(classifier.reads, 4)
+        self.assertFalse(os.path.exists(cache_path))
+        classifier.close()
+        self.assertTrue(os.path.exists(cache_path))
+        self.assertEqual([name for name in os.listdir(self.temp_dir) if name.endswith(".tmp")], [])
+        next_run = ContentClassifier(cache_path=cache_path)
+        self.assertEqual(next_run.classify(self._entries()), content_types)
+        self.assertEqual(next_run.reads, 0)
+
+        # A changed file is read again
+        with open(os.path.join(self.directory, "notes.txt"), "wb") as f:
+            f.write(b"GIF89a and more")
+        self.assertEqual(next_run.classify(self._entries())[os.path.join(self.directory, "notes.txt")], ".gif")
+        self.assertEqual(next_run.reads, 1)
+
+
+    def test_cache_is_bounded(self):
+        classifier = ContentClassifier(max_workers=1, max_entries=2)
+        classifier.classify(self._entries())
+        self.assertEqual(len(classifier.cache), 2)
+
+
+    def test_pickled_classifier_gets_its_own_pool_and_locks(self):
+        classifier = ContentClassifier(max_workers=4)
+        content_types = classifier.classify(self._entries())
+
+        # Like a FileOrganizer sent to a worker process
+        copy = pickle.loads(pickle.dumps(classifier))
+        self.assertIsNone(copy._executor)
+        self.assertIsNot(copy.lock, classifier.lock)
+        self.assertIsNot(copy.cache.lock, classifier.cache.lock)
+        self.assertEqual(copy.classify(self._entries()), content_types)
+        self.assertEqual(copy.reads, classifier.reads)
+        classifier.close()
+        copy.close()
+
+
+    def test_organizer_places_uncategorized_files_by_content(self):
+        config = Config(
+            directory=self.directory,
+            categories=[Category(name="Documents", extensions=[".pdf"]), Category(name="Images", extensions=[".jpg"])],
+            schedule=Schedule(active=False)
+        )
+        classifier = ContentClassifier()
+        organizer = FileOrganizer(classifier=classifier)
+        # The cache is stored once for the phase, not after each batch
+        with mock.patch.object(classifier, "save", wraps=classifier.save) as save:
+            organizer.process_config(config)
+        self.assertEqual(save.call_count, 1)
+
+        self.assertTrue(os.path.exists(os.path.join(self.directory, "Documents", "report")))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, "Images", "photo")))
+        # A known type without a category, and an unknown type, stay uncategorized
+        self.assertTrue(os.path.exists(os.path.join(self.directory, "Uncategorized", "archive.bin")))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, "Uncategorized", "notes.txt")))
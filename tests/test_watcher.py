@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from models import Category, Config
+from file_organizer import FileOrganizer
+from watcher import InotifyBackend, PollingBackend, Watcher
+
+
+class TestWatcher(unittest.TestCase):
+
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        self.config = Config(directory=self.temp_dir, categories=[
+            Category(name="Category1", extensions=[".one"], categorize_extensions=False),
+        ])
+        self.organizer = FileOrganizer()
+
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_dir)
+
+
+    def _write(self, filename: str):
+        with open(os.path.join(self.temp_dir, filename), 'w') as f:
+            f.write("some content")
+
+
+    @unittest.skipUnless(InotifyBackend.available(), "inotify is not available")
+    def test_inotify_backend(self):
+        backend = InotifyBackend([self.temp_dir])
+        try:
+            self._write("test1.one")
+            os.makedirs(os.path.join(self.temp_dir, "Category1"))
+            events = backend.poll(timeout=1.0)
+        finally:
+            backend.close()
+
+        # Directories are ignored
+        self.assertEqual(events, [(self.temp_dir, "test1.one")])
+
+
+    def test_polling_backend(self):
+        backend = PollingBackend([self.temp_dir], interval=0)
+        self._write("test1.one")
+
+        # Reported once it's stable across two listings, then never again
+        self.assertEqual(backend.poll(timeout=0), [])
+        self.assertEqual(backend.poll(timeout=0), [(self.temp_dir, "test1.one")])
+        self.assertEqual(backend.poll(timeout=0), [])
+
+
+    def test_watcher_organizes_new_files(self):
+        self._write("test1.one")
+        backend = PollingBackend([self.temp_dir], interval=0)
+        watcher = Watcher(self.organizer, [self.config], debounce=0, backend=backend)
+
+        stop_event = threading.Event()
+        thread = threading.Thread(target=watcher.run, args=(stop_event,))
+        thread.start()
+        try:
+            target = os.path.join(self.temp_dir, "Category1", "test1.one")
+            for _ in range(100):
+                if os.path.exists(target):
+                    break
+                stop_event.wait(0.01)
+        finally:
+            stop_event.set()
+            thread.join()
+
+        self.assertTrue(os.path.exists(target))